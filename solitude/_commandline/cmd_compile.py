@@ -3,23 +3,108 @@
 # This source code is licensed under the BSD-3-Clause license found in the
 # COPYING file in the root directory of this source tree
 
+import os
 import sys
+import time
+import tempfile
 from solitude import Factory
 from solitude.common.errors import CLIError, CompilerError
-from solitude.common import ContractSourceList, read_config_file, file_message_format
+from solitude.common import (
+    ContractSourceList, ContractObjectList, DirectoryWatcher, read_config_file, file_message_format)
+from solitude.common.contract_objectlist import (
+    make_unique_built_contract_filename, make_unique_built_unit_filename)
 
 
 def main(args):
     cfg = read_config_file(args.config)
+    if args.watch:
+        if cfg["Project.SourceDir"] is None:
+            raise CLIError("Watch mode requires Project.SourceDir")
+        if cfg["Compiler.CacheDir"] is None:
+            # the cache is what makes recompilation incremental
+            with tempfile.TemporaryDirectory() as cache_dir:
+                cfg = dict(cfg)
+                cfg["Compiler.CacheDir"] = cache_dir
+                watch(cfg)
+        else:
+            watch(cfg)
+        return
+
     factory = Factory(cfg)
-    compiler = factory.create_compiler()
     sources = factory.get_sourcelist()
 
-    try:
-        objects = compiler.compile(sources)
-    except CompilerError as e:
-        for message in e.messages:
-            print(file_message_format(message), file=sys.stderr)
-        raise CLIError("Compiler error")
+    with factory.create_compiler() as compiler:
+        try:
+            objects = compiler.compile(sources)
+        except CompilerError as e:
+            print_errors(e)
+            raise CLIError("Compiler error")
 
     objects.save_directory(cfg["Project.ObjectDir"])
+
+
+def print_errors(e: CompilerError):
+    for message in e.messages:
+        print(file_message_format(message), file=sys.stderr)
+
+
+def watch(cfg):
+    factory = Factory(cfg)
+    compiler = factory.create_compiler()
+    object_dir = cfg["Project.ObjectDir"]
+    watcher = DirectoryWatcher(cfg["Project.SourceDir"])
+    previous = ContractObjectList()
+    print("Watching %s" % cfg["Project.SourceDir"])
+    try:
+        while True:
+            start = time.monotonic()
+            try:
+                objects = compiler.compile(factory.get_sourcelist())
+            except CompilerError as e:
+                print_errors(e)
+                print("Compilation failed in %.2fs" % (time.monotonic() - start))
+            else:
+                updated, removed = save_changes(objects, previous, object_dir)
+                previous = objects
+                print("Compiled %d contracts in %.2fs, %d updated, %d removed" % (
+                    len(objects.contracts), time.monotonic() - start, updated, removed))
+            changed = watcher.wait()
+            print("Changed: %s" % ", ".join(sorted(os.path.relpath(path) for path in changed)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        compiler.close()
+
+
+def save_changes(objects: ContractObjectList, previous: ContractObjectList, object_dir: str):
+    """Write the contracts which changed since the previous compilation, and remove
+    the files of the contracts and units which no longer exist
+
+    :return: tuple of (number of contracts written, number of contracts removed)
+    """
+    contracts, previous_contracts = objects.contracts, previous.contracts
+    changed = [
+        key for key, contract in contracts.items()
+        if key not in previous_contracts or not same_contract(contract, previous_contracts[key])]
+    removed = [key for key in previous_contracts if key not in contracts]
+    units = set(unitname for unitname, _ in contracts)
+    filenames = [make_unique_built_contract_filename(unitname, contractname) for unitname, contractname in removed]
+    filenames.extend(
+        make_unique_built_unit_filename(unitname)
+        for unitname in set(unitname for unitname, _ in removed) if unitname not in units)
+    for filename in filenames:
+        try:
+            os.remove(os.path.join(object_dir, filename))
+        except OSError:
+            pass
+    # after the removals, so that the manifest drops the removed contracts
+    objects.save_directory(object_dir, changed)
+    return len(changed), len(removed)
+
+
+def same_contract(a: dict, b: dict) -> bool:
+    # equal, except for the compilation time
+    return (
+        {k: v for k, v in a.items() if k != "_solitude"} == {k: v for k, v in b.items() if k != "_solitude"} and
+        {k: v for k, v in a["_solitude"].items() if k != "timestamp"} ==
+        {k: v for k, v in b["_solitude"].items() if k != "timestamp"})
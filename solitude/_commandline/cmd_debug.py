@@ -18,16 +18,37 @@ from solitude._internal.oi_interface import ObjectInterface, ObjectInterfaceExce
 from solitude.debugger.evm_debug_core import EvmDebugCore, Step, Function, Frame, Value  # noqa
 from solitude.debugger.evm_trace import TraceStep  # noqa
 from solitude.debugger.oi_debugger import InteractiveDebuggerOI
+from solitude.debugger.debug_adapter import DebugAdapter
 from solitude._commandline.color_util import Color
 
 
 def main(args):
-    Color.enable()
-    factory = Factory(read_config_file(args.config))
-    client = factory.create_client()
-    client.update_contracts(factory.get_objectlist())
-
-    idbg = InteractiveDebuggerCLI(InteractiveDebuggerOI(args.txhash, client))
+    if args.adapter is None:
+        Color.enable()
+    if args.open is not None:
+        if args.txhash is not None:
+            raise CLIError("TXHASH cannot be used with --open")
+        oi = InteractiveDebuggerOI(None, None, dbg=EvmDebugCore.from_file(args.open))
+    else:
+        if args.txhash is None:
+            raise CLIError("TXHASH is required, unless a trace file is opened with --open")
+        factory = Factory(read_config_file(args.config))
+        client = factory.create_client()
+        client.update_contracts(factory.get_objectlist())
+        # the debug adapter serves requests while the trace is decoded, the
+        #   client is not used by anything else
+        oi = InteractiveDebuggerOI(
+            args.txhash, client, memory=args.memory, storage=args.storage,
+            background=args.adapter is not None)
+
+    if args.adapter == "stdio":
+        DebugAdapter(oi).serve_stdio()
+        return
+    elif args.adapter == "tcp":
+        DebugAdapter(oi).serve_tcp(args.host, args.port)
+        return
+
+    idbg = InteractiveDebuggerCLI(oi)
     if args.ex:
         for command in args.ex:
             for c in command.split(";"):
@@ -55,6 +76,8 @@ class InteractiveDebuggerCLI(cmd.Cmd):
             "s": functools.partial(self.oi_arglist, name="step"),
             "stepi": functools.partial(self.oi_arglist, name="stepi"),
             "si": functools.partial(self.oi_arglist, name="stepi"),
+            "reverse-step": functools.partial(self.oi_arglist, name="reverse_step"),
+            "rs": functools.partial(self.oi_arglist, name="reverse_step"),
             "next": functools.partial(self.oi_arglist, name="next"),
             "n": functools.partial(self.oi_arglist, name="next"),
             "finish": functools.partial(self.oi_arglist, name="finish"),
@@ -78,10 +101,12 @@ class InteractiveDebuggerCLI(cmd.Cmd):
             "breakpoint": self.present_breakpoint,
             "revert": self.present_revert,
             "terminate": self.present_terminate,
+            "interrupt": self.present_interrupt,
             "print": self.present_print,
             "info_locals": self.present_info_locals,
             "info_args": self.present_info_args,
             "info_breakpoints": self.present_info_breakpoints,
+            "info_changes": self.present_info_changes,
             "backtrace": self.present_backtrace,
             "frame": self.present_frame,
             "list": self.present_list,
@@ -160,6 +185,12 @@ class InteractiveDebuggerCLI(cmd.Cmd):
         assert obj["type"] == "terminate"
         self.print_info("Execution terminated")
 
+    def present_interrupt(self, obj):
+        assert obj["type"] == "interrupt"
+        self.print_info("Interrupted")
+        if obj["code"] is not None:
+            self.print_code(obj["code"])
+
     def present_print(self, obj):
         assert obj["type"] == "print"
         if not obj["frame_found"]:
@@ -191,6 +222,17 @@ class InteractiveDebuggerCLI(cmd.Cmd):
         for breakpoint in obj["breakpoints"]:
             self.print_info("Breakpoint: %s" % breakpoint)
 
+    def present_info_changes(self, obj):
+        assert obj["type"] == "info_changes"
+        if not obj["memory_available"]:
+            self.print_error("Memory not available, run the debugger with --memory")
+        for write in obj["memory"]:
+            self.print_info("Memory: %s" % InteractiveDebuggerCLI.format_memory_write(write))
+        if not obj["storage_available"]:
+            self.print_error("Storage changes not available")
+        for write in obj["storage"]:
+            self.print_info("Storage: %s" % InteractiveDebuggerCLI.format_storage_write(write))
+
     def present_backtrace(self, obj):
         assert obj["type"] == "backtrace"
         for f in obj["frames"]:
@@ -240,6 +282,20 @@ class InteractiveDebuggerCLI(cmd.Cmd):
             line=1 + code["line_index"],
             col=code["line_pos"])
 
+    @staticmethod
+    def format_memory_write(write):
+        return "[{start:#x}:{end:#x}] = {data}".format(
+            start=write["offset"],
+            end=write["offset"] + (len(write["data"]) - 2) // 2,
+            data=write["data"])
+
+    @staticmethod
+    def format_storage_write(write):
+        text = "[{slot}] = {value}".format(slot=write["slot"], value=write["value"])
+        for var in write["variables"]:
+            text += ", {name} = {value}".format(name=var["name"], value=var["value"])
+        return text
+
     def call(self, command, *args):
         inp = dict(command=command, args=args)
         out = self.oi.call(inp)
@@ -257,10 +313,16 @@ class InteractiveDebuggerCLI(cmd.Cmd):
             self.print_info("Stack: %s" % str(s.step.stack))
         elif what == "memory":
             s = self.oi.dbg.get_step(0)
-            self.print_info("Memory: %s" % str(s.step.memory))
+            if s.step.memory is None:
+                self.print_error("Memory not available, run the debugger with --memory")
+            else:
+                self.print_info("Memory: %s" % str(s.step.memory))
         elif what == "storage":
             s = self.oi.dbg.get_step(0)
-            self.print_info("Storage: %s" % str(s.step.storage))
+            if s.step.storage is None:
+                self.print_error("Storage not available, run the debugger with --storage")
+            else:
+                self.print_info("Storage: %s" % str(s.step.storage))
         elif what == "code":
             import code
             code.interact(local=locals())
@@ -0,0 +1,21 @@
+# Copyright (c) 2019, Solitude Developers
+#
+# This source code is licensed under the BSD-3-Clause license found in the
+# COPYING file in the root directory of this source tree
+
+from solitude import Factory, read_config_file
+from solitude.debugger import TraceAnalyzer
+
+
+def main(args):
+    factory = Factory(read_config_file(args.config))
+    client = factory.create_client()
+    client.update_contracts(factory.get_objectlist())
+    analyzer = TraceAnalyzer(client.rpc, client.contracts)
+
+    analysis = analyzer.run(args.txhash, workers=args.workers)
+
+    print(analysis.gas.report(limit=args.limit), end="")
+    if args.collapsed:
+        with open(args.collapsed, "w") as fp:
+            fp.write(analysis.gas.collapsed())
@@ -8,7 +8,7 @@ from solitude import Factory, read_config_file
 from solitude._internal.oi_common_objects import ColorText
 from solitude._commandline.color_util import Color
 from solitude._commandline.text_util import TablePrinter
-from solitude.debugger import EvmDebugCore, EvmTrace, TraceStep, InteractiveDebuggerOI
+from solitude.debugger import EvmDebugCore, EvmTrace, TraceStep, TraceFile, InteractiveDebuggerOI
 
 
 def main(args):
@@ -17,7 +17,15 @@ def main(args):
     factory = Factory(read_config_file(args.config))
     client = factory.create_client()
     client.update_contracts(factory.get_objectlist())
-    debugger = EvmDebugCore(client, args.txhash)
+    if args.export is not None:
+        store = EvmTrace(client.rpc, client.contracts).trace_store(
+            args.txhash, memory=args.memory, storage=args.storage)
+        TraceFile.write(args.export, store, client.contracts, args.txhash)
+        print("Exported %d steps to %s" % (len(store), args.export))
+        return
+    # the stack is always needed, to extract variables and follow calls.
+    #   Storage writes are read from the stack, the storage itself is not needed.
+    debugger = EvmDebugCore(client, args.txhash, memory=args.memory, storage=False)
     printer = TablePrinter([
         ("INDEX", 6),
         ("PC", 6),
@@ -62,6 +70,11 @@ def main(args):
         if args.stack:
             print(s.step.stack)
         if args.memory:
-            print(s.step.memory)
+            for write in debugger.get_memory_writes():
+                print("memory[{start:#x}:{end:#x}] = 0x{data}".format(
+                    start=write.offset, end=write.offset + len(write.data) // 2, data=write.data))
         if args.storage:
-            print(s.step.storage)
+            for write, variables in debugger.get_storage_writes():
+                print("storage[{slot:#x}] = {value:#x}".format(slot=write.slot, value=write.value))
+                for var, value in variables:
+                    print("    {name} = {value}".format(name=var.name, value=value))
@@ -49,6 +49,7 @@ def create_parser():
     p_compile = sub.add_parser("compile")
     p_debug = sub.add_parser("debug")
     p_trace = sub.add_parser("trace")
+    p_profile = sub.add_parser("profile")
     p_lint = sub.add_parser("lint")
     p_server = sub.add_parser("server")
 
@@ -66,16 +67,32 @@ def create_parser():
         from solitude._commandline import cmd_compile
         return cmd_compile
     p_compile.set_defaults(module=module_compile)
+    p_compile.add_argument(
+        "--watch", action="store_true",
+        help="Recompile when the sources in Project.SourceDir change, until interrupted")
 
     def module_debug():
         from solitude._commandline import cmd_debug
         return cmd_debug
     p_debug.set_defaults(module=module_debug)
     p_debug.add_argument(
-        "txhash", type=txhash_type,
+        "txhash", type=txhash_type, nargs="?",
         help="Transaction hash, a hex string prefixed with 0x")
+    p_debug.add_argument(
+        "--open", help="Debug a trace file created with 'trace --export', without the node")
     p_debug.add_argument(
         "--eval-command", "-ex", action="append", help="Execute command at start", dest="ex")
+    p_debug.add_argument(
+        "--memory", action="store_true", help="Request the EVM memory from the node")
+    p_debug.add_argument(
+        "--storage", action="store_true", help="Request the EVM storage from the node")
+    p_debug.add_argument(
+        "--adapter", choices=["stdio", "tcp"],
+        help="Serve the debugger to an IDE front-end, with JSON messages over stdio or TCP")
+    p_debug.add_argument(
+        "--host", default="127.0.0.1", help="Address to listen on, with '--adapter tcp'")
+    p_debug.add_argument(
+        "--port", type=int, default=8555, help="Port to listen on, with '--adapter tcp'")
 
     def module_trace():
         from solitude._commandline import cmd_trace
@@ -87,6 +104,22 @@ def create_parser():
     p_trace.add_argument("--stack", action="store_true")
     p_trace.add_argument("--memory", action="store_true")
     p_trace.add_argument("--storage", action="store_true")
+    p_trace.add_argument(
+        "--export", help="Write the trace to a file, which can be debugged offline with 'debug --open'")
+
+    def module_profile():
+        from solitude._commandline import cmd_profile
+        return cmd_profile
+    p_profile.set_defaults(module=module_profile)
+    p_profile.add_argument(
+        "txhash", type=txhash_type, nargs="+",
+        help="Transaction hash, a hex string prefixed with 0x")
+    p_profile.add_argument(
+        "--limit", type=int, default=20, help="Maximum number of entries in each section of the report")
+    p_profile.add_argument(
+        "--collapsed", help="Path to collapsed stacks output, for flame graph tools")
+    p_profile.add_argument(
+        "--workers", type=int, default=1, help="Number of processes tracing the transactions")
 
     def module_lint():
         from solitude._commandline import cmd_lint
@@ -3,7 +3,7 @@
 # This source code is licensed under the BSD-3-Clause license found in the
 # COPYING file in the root directory of this source tree
 
-from typing import Union, List, Dict, Tuple, Optional  # noqa
+from typing import Union, List, Dict, Tuple, Optional, Callable  # noqa
 import binascii
 import fnmatch
 import time
@@ -145,39 +145,71 @@ class ETHClient(AccountContext, EventCaptureContext):
         self._initial_default_account = self._web3.eth.defaultAccount
 
         # collect contracts and events
-        self._events = []  # type: List[EventAbi]
+        # events of each contract, indexed on first use
+        self._events = {}  # type: Dict[Tuple[str, str], List[EventAbi]]
         self._event_logs = []  # type: List[EventLog]
         self._event_map = {}  # type: Dict[Tuple[str, bytes], EventAbi]
         self._filters = []  # type: List[Filter]
 
+        self._transaction_hooks = []  # type: List[Callable[[bytes], None]]
+
     def update_contracts(self, contracts: ContractObjectList):
         """Update the collection of contracts known to this client
 
         :param contracts: a collection of contracts (see ContractObjectList)
         """
         self._compiled.update(contracts)
-        self._update_events_index(contracts)
-
-    def _update_events_index(self, compiled: ContractObjectList):
-        for (unitname, contractname), contract in compiled.contracts.items():
-            for abi in contract['abi']:
-                if abi.get("type") == "event":
-                    event_selector = "{name}({params})".format(
-                        name=abi["name"],
-                        params=",".join([inp["type"] for inp in abi["inputs"]]))
-                    event = EventAbi(
-                        unitname,
-                        contractname,
-                        name=abi["name"],
-                        signature=bytes(self._web3.sha3(text=event_selector)),
-                        abi=abi)
-                    self._events.append(event)
-                    key = (event.unitname, event.contractname, event.signature)
-                    self._event_map[key] = event
+
+    def _get_contract_events(self, unitname: str, contractname: str) -> List[EventAbi]:
+        # events of a contract, and add them to the event map the first time
+        try:
+            return self._events[(unitname, contractname)]
+        except KeyError:
+            pass
+        events = []
+        try:
+            contract = self._compiled.get_contract(unitname, contractname)
+        except KeyError:
+            contract = {}
+        for abi in contract.get('abi', []):
+            if abi.get("type") == "event":
+                event_selector = "{name}({params})".format(
+                    name=abi["name"],
+                    params=",".join([inp["type"] for inp in abi["inputs"]]))
+                event = EventAbi(
+                    unitname,
+                    contractname,
+                    name=abi["name"],
+                    signature=bytes(self._web3.sha3(text=event_selector)),
+                    abi=abi)
+                events.append(event)
+                key = (event.unitname, event.contractname, event.signature)
+                self._event_map[key] = event
+        self._events[(unitname, contractname)] = events
+        return events
 
     def _reload_accounts(self):
         self._accounts = list(self._web3.eth.accounts)
 
+    def add_transaction_hook(self, hook: Callable[[bytes], None]) -> None:
+        """Add a function to be called with the hash of every transaction sent
+        through this client, by :py:meth:`deploy` and :py:meth:`ContractBase.transact_sync`
+
+        :param hook: function receiving the transaction hash, as bytes
+        """
+        self._transaction_hooks.append(hook)
+
+    def remove_transaction_hook(self, hook: Callable[[bytes], None]) -> None:
+        """Remove a function added with :py:meth:`add_transaction_hook`
+
+        :param hook: function to remove
+        """
+        self._transaction_hooks.remove(hook)
+
+    def _call_transaction_hooks(self, txhash: bytes) -> None:
+        for hook in self._transaction_hooks:
+            hook(txhash)
+
     def set_default_gaslimit(self, gas: Optional[int]):
         """Set the default gas limit for transactions
 
@@ -277,6 +309,8 @@ class ETHClient(AccountContext, EventCaptureContext):
         return EventCaptureWithStatement(self, pattern)
 
     def _on_transaction(self, info: TransactionInfo):
+        self._call_transaction_hooks(info.txhash)
+
         # reporting
         self._dump("{contract}[{address}]".format(
             contract=info.contractname,
@@ -292,6 +326,7 @@ class ETHClient(AccountContext, EventCaptureContext):
                 gasused=info.receipt.gasUsed))
 
         # read events
+        self._get_contract_events(info.unitname, info.contractname)
         for log in info.receipt.logs:
             try:
                 event_signature = bytes(log.topics[0])
@@ -399,6 +434,7 @@ class ETHClient(AccountContext, EventCaptureContext):
             bytecode=compiled_contract['bin'])
         txhash = contract.constructor(*args).transact({"from": account})
         receipt = self._web3.eth.waitForTransactionReceipt(txhash)
+        self._call_transaction_hooks(bytes(txhash))
         # Check whether there is any code in the deployed contract. Sometimes web3 would just produce
         #   an empty contract after unsuccessful deployment, instead of raising an exception.
         code = self._web3.eth.getCode(receipt.contractAddress)
@@ -456,8 +492,8 @@ class ETHClient(AccountContext, EventCaptureContext):
             unitname = contract.unitname
             param_address.append(contract.address)
         param_events = []
-        for event in self._events:
-            if event.contractname == contractname and event.unitname == unitname and event.name in event_names:
+        for event in self._get_contract_events(unitname, contractname):
+            if event.name in event_names:
                 param_events.append(hex_repr(event.signature, prefix=True))
         param_topics = [single_or_list(param_events)]
         if parameters is not None:
@@ -507,6 +543,7 @@ class ETHClient(AccountContext, EventCaptureContext):
                     invalid_filters = True
                     continue
                 logs = self._web3.eth.getFilterChanges(hex(flt.index))
+                self._get_contract_events(flt.unitname, flt.contractname)
                 for log in logs:
                     key = (flt.unitname, flt.contractname, bytes(log["topics"][0]))
                     event = self._event_map[key]
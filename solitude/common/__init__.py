@@ -13,9 +13,10 @@ from solitude.common.resource_util import (
 from solitude.common.config_util import (
     read_config_file, read_yaml_or_json, make_default_config)
 
-from solitude.common.contract_objectlist import ContractObjectList
+from solitude.common.contract_objectlist import ContractObjectList, ArtifactInfo
 from solitude.common.contract_sourcelist import ContractSourceList
 from solitude.common.contract_util import path_to_unitname
+from solitude.common.directory_watcher import DirectoryWatcher
 from solitude.common.dump import Dump
 from solitude.common.rpc_client import RPCClient
 
@@ -38,8 +39,10 @@ __all__ = [
     "make_default_config",
 
     "ContractObjectList",
+    "ArtifactInfo",
     "ContractSourceList",
     "path_to_unitname",
+    "DirectoryWatcher",
 
     "Dump",
     "RPCClient"
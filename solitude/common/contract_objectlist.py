@@ -4,9 +4,15 @@
 # COPYING file in the root directory of this source tree
 
 import os
+import bisect
 import hashlib
 import json
-from typing import List, Tuple, Dict, Optional  # noqa
+import re
+import tempfile
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+from typing import List, Tuple, Dict, Mapping, Optional, Iterable, Callable  # noqa
 from solitude._internal import type_assert, value_assert, RaiseForParam
 
 
@@ -27,6 +33,9 @@ def make_unique_built_contract_filename(unitname: str, contractname: str):
     return "build_" + contractname + "_" + h.hexdigest() + ".json"
 
 
+_BUILT_CONTRACT_FILENAME = re.compile(r"^build_(.+)_[0-9a-f]{32}\.json$")
+
+
 def file_is_built_contract(filename: str):
     """Verify from the filename whether a file may contain compiled contract
     information.
@@ -38,6 +47,302 @@ def file_is_built_contract(filename: str):
     return filename.startswith("build_") and filename.endswith(".json")
 
 
+def _contractname_from_filename(filename: str) -> Optional[str]:
+    # contract name in a filename from make_unique_built_contract_filename, or None
+    match = _BUILT_CONTRACT_FILENAME.match(filename)
+    return match.group(1) if match is not None else None
+
+
+def make_unique_built_unit_filename(unitname: str):
+    """Create a unique filename to store the data shared by the contracts of a source
+    unit: the source, the AST and the source maps of each contract.
+
+    :param unitname: source unit name
+    :return: unique filename
+    """
+    h = hashlib.md5()
+    h.update(unitname.encode("utf-8"))
+    return "unit_" + h.hexdigest() + ".json"
+
+
+# fields stored in the unit file: in contract["_solitude"], and in contract
+_UNIT_FIELDS = ("ast", "source")
+_UNIT_CONTRACT_FIELDS = ("srcmap", "srcmap-runtime")
+
+
+MANIFEST_FILENAME = "manifest.json"
+_MANIFEST_VERSION = 1
+
+ArtifactInfo = namedtuple("ArtifactInfo", [
+    "unitname", "contractname", "filename", "unit_filename", "hash", "selectors", "events"])
+ArtifactInfo.__doc__ = "Manifest entry of a contract saved to a directory"
+ArtifactInfo.unitname.__doc__ = "source unit containing the contract"
+ArtifactInfo.contractname.__doc__ = "name of the contract"
+ArtifactInfo.filename.__doc__ = "name of the contract file"
+ArtifactInfo.unit_filename.__doc__ = "name of the unit file, with the source, AST and source maps"
+ArtifactInfo.hash.__doc__ = "SHA-256 of the content of the contract file, as hex string"
+ArtifactInfo.selectors.__doc__ = "dictionary of (function signature -> 4-byte selector, as hex string)"
+ArtifactInfo.events.__doc__ = "dictionary of (event signature -> topic, as hex string), excluding anonymous events"
+
+
+class _UnitFile:
+    # unit file, parsed on first use and shared by the contracts of the unit
+    def __init__(self, path: str):
+        self._path = path
+        self._data = None  # type: Optional[dict]
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        with self._lock:
+            if self._data is None:
+                with open(self._path) as fp:
+                    self._data = json.load(fp)
+            return self._data
+
+    def __getstate__(self):
+        # the lock is not picklable, e.g. when sending a partly loaded list to
+        #   worker processes
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class _LazyDict(dict):
+    """Dictionary with some fields loaded on first access
+
+    Accessing a lazy field, iterating, comparing or copying the dictionary loads all
+    the lazy fields.
+    """
+    def __init__(self, data: dict, lazy_keys: Iterable[str], load: Callable[[], dict]):
+        super().__init__(data)
+        self._lazy_keys = set(lazy_keys) - set(data)
+        self._load = load
+
+    def load(self) -> None:
+        """Load the lazy fields, if not loaded yet"""
+        if not self._lazy_keys:
+            return
+        values = self._load()
+        for key in self._lazy_keys:
+            if key in values and not dict.__contains__(self, key):
+                dict.__setitem__(self, key, values[key])
+        self._lazy_keys = set()
+
+    def __missing__(self, key):
+        if key in self._lazy_keys:
+            self.load()
+            if dict.__contains__(self, key):
+                return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self._lazy_keys:
+            self.load()
+        return dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        if key in self._lazy_keys:
+            self.load()
+        return dict.get(self, key, default)
+
+    def pop(self, key, *args):
+        self.load()
+        return dict.pop(self, key, *args)
+
+    def setdefault(self, key, default=None):
+        self.load()
+        return dict.setdefault(self, key, default)
+
+    def __delitem__(self, key):
+        self.load()
+        dict.__delitem__(self, key)
+
+    def __iter__(self):
+        self.load()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self.load()
+        return dict.__len__(self)
+
+    def keys(self):
+        self.load()
+        return dict.keys(self)
+
+    def items(self):
+        self.load()
+        return dict.items(self)
+
+    def values(self):
+        self.load()
+        return dict.values(self)
+
+    def copy(self):
+        self.load()
+        return dict(dict.items(self))
+
+    def __eq__(self, other):
+        self.load()
+        if isinstance(other, _LazyDict):
+            other.load()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        self.load()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        # pickled as a plain dictionary
+        return (dict, (self.copy(),))
+
+
+def _split_contract(contract: dict, unit_filename: str) -> dict:
+    # contract file data: the contract without the fields stored in the unit file
+    out = {key: value for key, value in contract.items() if key not in _UNIT_CONTRACT_FIELDS}
+    if "_solitude" in contract:
+        info = {key: value for key, value in contract["_solitude"].items() if key not in _UNIT_FIELDS}
+        info["unitFile"] = unit_filename
+        out["_solitude"] = info
+    return out
+
+
+def _make_unit(unitname: str, contracts: Dict[str, dict]) -> dict:
+    # unit file data, from all the contracts of the unit
+    out = {"unitName": unitname, "contracts": {}}  # type: dict
+    for contractname, contract in sorted(contracts.items()):
+        info = contract.get("_solitude", {})
+        for key in _UNIT_FIELDS:
+            if key in info and key not in out:
+                out[key] = info[key]
+        out["contracts"][contractname] = {
+            key: contract[key] for key in _UNIT_CONTRACT_FIELDS if key in contract}
+    return out
+
+
+def _load_contract(contract: dict, unit_files: Dict[str, _UnitFile], path: str) -> dict:
+    # contract from a contract file; fields stored in a unit file are loaded lazily
+    info = contract.get("_solitude", {})
+    unit_filename = info.pop("unitFile", None)
+    if unit_filename is None:
+        # contract file containing all the fields
+        return contract
+    if unit_filename not in unit_files:
+        unit_files[unit_filename] = _UnitFile(os.path.join(path, unit_filename))
+    unit_file = unit_files[unit_filename]
+    contractname = info["contractName"]
+    contract["_solitude"] = _LazyDict(info, _UNIT_FIELDS, unit_file.get)
+    return _LazyDict(
+        contract, _UNIT_CONTRACT_FIELDS, lambda: unit_file.get()["contracts"].get(contractname, {}))
+
+
+def _read_contract(path: str, unit_files: Dict[str, _UnitFile]) -> dict:
+    with open(path) as fp:
+        return _load_contract(json.load(fp), unit_files, os.path.dirname(path))
+
+
+def _write_json(path: str, filename: str, data: dict) -> str:
+    # write to a temporary file first, so that readers never see partial files;
+    #   return the SHA-256 of the content
+    content = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    fd, tmp_path = tempfile.mkstemp(dir=path, prefix="." + filename, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(content)
+        os.replace(tmp_path, os.path.join(path, filename))
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return hashlib.sha256(content).hexdigest()
+
+
+def _abi_type(param: dict) -> str:
+    # canonical type of an ABI parameter, with tuples expanded
+    paramtype = param["type"]
+    if paramtype.startswith("tuple"):
+        return "(" + ",".join(_abi_type(c) for c in param.get("components", [])) + ")" + paramtype[len("tuple"):]
+    return paramtype
+
+
+def _abi_signature(entry: dict) -> str:
+    return "%s(%s)" % (entry["name"], ",".join(_abi_type(param) for param in entry.get("inputs", [])))
+
+
+def _make_artifact_info(unitname: str, contractname: str, contract: dict, file_hash: str) -> ArtifactInfo:
+    # keccak is provided by a dependency of web3, which is slow to import
+    from eth_utils import keccak
+    selectors = {}
+    events = {}
+    for entry in contract.get("abi") or []:
+        if entry.get("type") == "function":
+            signature = _abi_signature(entry)
+            selectors[signature] = keccak(text=signature)[:4].hex()
+        elif entry.get("type") == "event" and not entry.get("anonymous"):
+            signature = _abi_signature(entry)
+            events[signature] = keccak(text=signature).hex()
+    return ArtifactInfo(
+        unitname=unitname,
+        contractname=contractname,
+        filename=make_unique_built_contract_filename(unitname, contractname),
+        unit_filename=make_unique_built_unit_filename(unitname),
+        hash=file_hash,
+        selectors=selectors,
+        events=events)
+
+
+def _write_manifest(path: str, artifacts: Dict[Tuple[str, str], ArtifactInfo]) -> None:
+    _write_json(path, MANIFEST_FILENAME, {
+        "version": _MANIFEST_VERSION,
+        "contracts": [{
+            "unitName": info.unitname,
+            "contractName": info.contractname,
+            "file": info.filename,
+            "unitFile": info.unit_filename,
+            "hash": info.hash,
+            "selectors": info.selectors,
+            "events": info.events
+        } for _, info in sorted(artifacts.items())]})
+
+
+class _SuffixIndex:
+    """Unit names of the contracts with the same name, indexed by suffix
+
+    The names are kept sorted by their reversed string, so the names ending with a
+    suffix are a contiguous range, found with a binary search.
+    """
+
+    def __init__(self):
+        self._units = []  # type: List[str]
+        self._reversed = []  # type: List[str]
+
+    def add(self, unitname: str) -> None:
+        self._units.append(unitname)
+        bisect.insort(self._reversed, unitname[::-1])
+
+    def find(self, suffix: Optional[str]) -> List[str]:
+        # unit names ending with suffix, in insertion order
+        if suffix is None:
+            return list(self._units)
+        rsuffix = suffix[::-1]
+        found = set()
+        for i in range(bisect.bisect_left(self._reversed, rsuffix), len(self._reversed)):
+            if not self._reversed[i].startswith(rsuffix):
+                break
+            found.add(self._reversed[i][::-1])
+        if len(found) == len(self._units):
+            return list(self._units)
+        return [unitname for unitname in self._units if unitname in found]
+
+
 class ContractObjectList:
     """A collection of compiled contracts
     """
@@ -46,7 +351,15 @@ class ContractObjectList:
         """Create an empty collection of compiled contracts
         """
         self._contracts = {}  # type: Dict[Tuple[str, str], dict]
-        self._name_to_units = {}
+        self._name_to_units = {}  # type: Dict[str, _SuffixIndex]
+        # contract names of each source unit, in insertion order
+        self._unit_to_names = {}  # type: Dict[str, List[str]]
+        # selector string -> key of the matched contract
+        self._selected = {}  # type: Dict[str, Tuple[str, str]]
+        # files not loaded yet, by contract name: (path, shared unit files)
+        self._pending = {}  # type: Dict[str, List[Tuple[str, Dict[str, _UnitFile]]]]
+        # files not loaded yet, listed in a manifest: key -> (path, shared unit files)
+        self._unloaded = {}  # type: Dict[Tuple[str, str], Tuple[str, Dict[str, _UnitFile]]]
 
     def add_contract(self, unitname: str, contractname: str, contract: dict):
         """Add a contract, uniquely identified by (unitname, contractname).
@@ -55,55 +368,178 @@ class ContractObjectList:
         :param contractname: name of the contract
         :param contract: contract data dictionary, as produced by the compiler module
         """
+        self._add_key(unitname, contractname)
+        self._contracts[(unitname, contractname)] = contract
+
+    def _add_key(self, unitname: str, contractname: str) -> None:
+        self._load_pending(contractname)
         key = (unitname, contractname)
-        if key in self._contracts:
+        if key in self._contracts or key in self._unloaded:
             raise CompilerError([FileMessage(
                 type="duplicate",
                 unitname=unitname + ":" + contractname,
                 line=None,
                 column=None,
                 message="Duplicate contract identifier found")])
-        self._contracts[key] = contract
         try:
-            self._name_to_units[contractname].append(unitname)
+            self._name_to_units[contractname].add(unitname)
         except KeyError:
-            self._name_to_units[contractname] = [unitname]
+            self._name_to_units[contractname] = _SuffixIndex()
+            self._name_to_units[contractname].add(unitname)
+        self._unit_to_names.setdefault(unitname, []).append(contractname)
+        # a new contract can make a selector ambiguous
+        self._selected.clear()
 
-    def add_directory(self, path: str) -> None:
+    def add_directory(self, path: str, lazy: bool=False) -> None:
         """Add all contracts from a directory.
 
+        The source, AST and source maps of the contracts are loaded when they are
+        first accessed.
+
         :param path: path of the directory containing the contracts data.
+        :param lazy: if True, only list the files; a contract is loaded when it is
+            selected, or when all contracts are accessed. The contracts listed in the
+            directory manifest are found without loading them; the others are loaded
+            when a contract with the same name is looked up.
         """
-        for filename in os.listdir(path):
-            if file_is_built_contract(filename):
-                with open(os.path.join(path, filename)) as fp:
-                    contract = json.load(fp)
-                self.add_contract(
-                    contract["_solitude"]["unitName"],
-                    contract["_solitude"]["contractName"],
-                    contract)
-
-    def save_directory(self, path: str) -> None:
+        unit_files = {}  # type: Dict[str, _UnitFile]
+        filenames = set(filename for filename in os.listdir(path) if file_is_built_contract(filename))
+        if lazy:
+            manifest = ContractObjectList.read_manifest(path) or {}
+            for key, info in sorted(manifest.items()):
+                if info.filename in filenames:
+                    filenames.remove(info.filename)
+                    self._add_key(*key)
+                    self._unloaded[key] = (os.path.join(path, info.filename), unit_files)
+        for filename in sorted(filenames):
+            contractname = _contractname_from_filename(filename) if lazy else None
+            if contractname is None:
+                self._load_file(os.path.join(path, filename), unit_files)
+            else:
+                self._pending.setdefault(contractname, []).append((os.path.join(path, filename), unit_files))
+                self._selected.clear()
+
+    def _load_file(self, path: str, unit_files: Dict[str, _UnitFile]) -> None:
+        contract = _read_contract(path, unit_files)
+        self.add_contract(
+            contract["_solitude"]["unitName"],
+            contract["_solitude"]["contractName"],
+            contract)
+
+    def _get_loaded(self, key: Tuple[str, str]) -> dict:
+        if key in self._unloaded:
+            path, unit_files = self._unloaded.pop(key)
+            self._contracts[key] = _read_contract(path, unit_files)
+        return self._contracts[key]
+
+    def _load_all(self) -> None:
+        self._load_pending()
+        for key in list(self._unloaded):
+            self._get_loaded(key)
+
+    def _load_pending(self, contractname: Optional[str]=None) -> None:
+        # load the pending files of a contract name, or all of them
+        if contractname is None:
+            contractnames = list(self._pending)
+        else:
+            contractnames = [contractname] if contractname in self._pending else []
+        for name in contractnames:
+            for path, unit_files in self._pending.pop(name):
+                self._load_file(path, unit_files)
+
+    def save_directory(self, path: str, keys: Optional[Iterable[Tuple[str, str]]]=None) -> None:
         """Save all contracts to a directory.
 
+        The source, AST and source maps are stored once per source unit, in a unit file
+        shared by the contracts of the unit. Files are written atomically, as compact
+        JSON, so that readers never see a partially written contract.
+
         :param path: path of destination directory; the directory must exist.
+        :param keys: save only the contracts with these (unitname, contractname), or
+            None to save all contracts
+
+        The directory manifest (see :py:meth:`read_manifest`) is updated with the saved
+        contracts; the entries of the files which no longer exist are removed.
         """
         os.makedirs(path, exist_ok=True)
+        self._load_all()
+        if keys is None:
+            keys = self._contracts.keys()
+        keys = list(keys)
+        units = {}  # type: Dict[str, Dict[str, dict]]
         for (unitname, contractname), contract in self._contracts.items():
-            filename = make_unique_built_contract_filename(unitname, contractname)
-            with open(os.path.join(path, filename), "w") as fp:
-                json.dump(contract, fp, indent=2)
+            units.setdefault(unitname, {})[contractname] = contract
+        for unitname in sorted(set(unitname for unitname, _ in keys)):
+            _write_json(path, make_unique_built_unit_filename(unitname), _make_unit(unitname, units[unitname]))
+        manifest = ContractObjectList.read_manifest(path) or {}
+        for unitname, contractname in keys:
+            contract = self._contracts[(unitname, contractname)]
+            file_hash = _write_json(
+                path,
+                make_unique_built_contract_filename(unitname, contractname),
+                _split_contract(contract, make_unique_built_unit_filename(unitname)))
+            manifest[(unitname, contractname)] = _make_artifact_info(unitname, contractname, contract, file_hash)
+        _write_manifest(path, {
+            key: info for key, info in manifest.items() if os.path.isfile(os.path.join(path, info.filename))})
+
+    @staticmethod
+    def read_manifest(path: str) -> Optional[Dict[Tuple[str, str], ArtifactInfo]]:
+        """Read the manifest of a directory written by :py:meth:`save_directory`, which
+        describes the saved contracts without having to open their files.
+
+        :param path: path of the directory containing the contracts data.
+        :return: dictionary of (unitname, contractname) -> :py:class:`ArtifactInfo`, or
+            None if the directory has no valid manifest
+        """
+        try:
+            with open(os.path.join(path, MANIFEST_FILENAME)) as fp:
+                data = json.load(fp)
+            if data.get("version") != _MANIFEST_VERSION:
+                return None
+            out = {}
+            for entry in data["contracts"]:
+                info = ArtifactInfo(
+                    unitname=entry["unitName"],
+                    contractname=entry["contractName"],
+                    filename=entry["file"],
+                    unit_filename=entry["unitFile"],
+                    hash=entry["hash"],
+                    selectors=entry["selectors"],
+                    events=entry["events"])
+                out[(info.unitname, info.contractname)] = info
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+        return out
 
     def update(self, other: "ContractObjectList") -> None:
         """Add all contracts from other ContractObjectList.
 
+        Contracts which are not loaded yet in the other collection are loaded on
+        demand by this one.
+
         :param other: other ContractObjectList with contracts to add
         """
         with RaiseForParam("other"):
             type_assert(other, ContractObjectList)
+        for contractname, files in other._pending.items():
+            self._pending.setdefault(contractname, []).extend(files)
+            self._selected.clear()
+        for key, entry in other._unloaded.items():
+            self._add_key(*key)
+            self._unloaded[key] = entry
         for (unitname, contractname), contract in other._contracts.items():
             self.add_contract(unitname, contractname, contract)
 
+    def get_contract(self, unitname: str, contractname: str) -> dict:
+        """Get a contract by its identifier (unitname, contractname).
+
+        :param unitname: source unit containing the contract
+        :param contractname: name of the contract
+        :return: contract data dictionary; raises KeyError if the contract is not found
+        """
+        self._load_pending(contractname)
+        return self._get_loaded((unitname, contractname))
+
     def find(self, suffix: Optional[str], contractname: str) -> List[Tuple[str, str]]:
         """Find contracts by unitname suffix and full contractname.
 
@@ -117,12 +553,33 @@ class ContractObjectList:
             type_assert(suffix, (str, type(None)))
         with RaiseForParam("contractname"):
             type_assert(contractname, str)
-        out = []
-        units = self._name_to_units.get(contractname, [])
-        for unit in units:
-            if suffix is None or unit.endswith(suffix):
-                out.append((unit, contractname))
-        return out
+        self._load_pending(contractname)
+        try:
+            units = self._name_to_units[contractname]
+        except KeyError:
+            return []
+        return [(unitname, contractname) for unitname in units.find(suffix)]
+
+    def keys(self) -> List[Tuple[str, str]]:
+        """Identifiers of all contracts, without loading the ones listed in a
+        directory manifest.
+
+        :return: list of (unitname, contractname), grouped by source unit
+        """
+        self._load_pending()
+        return [
+            (unitname, contractname)
+            for unitname, contractnames in self._unit_to_names.items() for contractname in contractnames]
+
+    def find_unit(self, unitname: str) -> List[Tuple[str, str]]:
+        """Find the contracts of a source unit, without loading the ones listed in a
+        directory manifest.
+
+        :param unitname: full name of the source unit
+        :return: list of (unitname, contractname), in the order they were added
+        """
+        self._load_pending()
+        return [(unitname, contractname) for contractname in self._unit_to_names.get(unitname, [])]
 
     def select(self, selector: str) -> dict:
         """Find a single contract matching the contract selector string.
@@ -141,6 +598,11 @@ class ContractObjectList:
 
         :param selector: contract selector
         """
+        try:
+            return self._get_loaded(self._selected[selector])
+        except (KeyError, TypeError):
+            # not selected before, or not a valid selector
+            pass
         with RaiseForParam("selector"):
             type_assert(selector, str)
             if selector.count(":") == 1:
@@ -157,10 +619,14 @@ class ContractObjectList:
             value_assert(
                 len(contracts) == 1,
                 "Contract selector matched multiple contracts")
-            return self._contracts[contracts[0]]
+        self._selected[selector] = contracts[0]
+        return self._get_loaded(contracts[0])
 
     @property
-    def contracts(self) -> Dict[Tuple[str, str], dict]:
-        """All contracts, as a dictionary of (unitname, contractname) -> data
+    def contracts(self) -> Mapping[Tuple[str, str], dict]:
+        """All contracts, as a read-only dictionary of (unitname, contractname) -> data
+
+        The dictionary is a view, which reflects the contracts added later.
         """
-        return self._contracts.copy()
+        self._load_all()
+        return MappingProxyType(self._contracts)
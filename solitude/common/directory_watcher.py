@@ -0,0 +1,96 @@
+# Copyright (c) 2019, Solitude Developers
+#
+# This source code is licensed under the BSD-3-Clause license found in the
+# COPYING file in the root directory of this source tree
+
+import os
+import time
+from typing import List, Dict, Set, Tuple, Optional  # noqa
+from solitude._internal import type_assert, value_assert, RaiseForParam
+
+
+class DirectoryWatcher:
+    """Detect changes to the files of a directory tree, by polling their modification
+    time and size
+
+    Editors and version control tools often write several files in a burst; changes
+    are only reported once no file has changed for the `debounce` delay, so that a
+    burst is reported as a single change.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            ext_filter: Optional[List[str]]=[".sol"],
+            interval: float=0.5,
+            debounce: float=0.2):
+        """Create a DirectoryWatcher, and take a snapshot of the current files
+
+        :param path: directory path
+        :param ext_filter: list of watched extensions for the file names, including
+            the '.' character (e.g. [".sol"]), or None for any extension
+        :param interval: delay between polls, in seconds
+        :param debounce: time without changes before a change is reported, in seconds
+        """
+        with RaiseForParam("path"):
+            type_assert(path, str)
+        with RaiseForParam("interval"):
+            type_assert(interval, (int, float))
+            value_assert(interval > 0, "Interval must be positive")
+        with RaiseForParam("debounce"):
+            type_assert(debounce, (int, float))
+            value_assert(debounce >= 0, "Debounce delay cannot be negative")
+        self._path = path
+        self._ext_filter = ext_filter
+        self._interval = interval
+        self._debounce = debounce
+        self._snapshot = self._scan()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        # path -> (modification time, size) of all watched files
+        out = {}
+        for root, _dirnames, filenames in os.walk(self._path):
+            for filename in filenames:
+                if self._ext_filter is None or os.path.splitext(filename)[1].lower() in self._ext_filter:
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        # removed while scanning
+                        continue
+                    out[path] = (stat.st_mtime_ns, stat.st_size)
+        return out
+
+    def poll(self) -> Set[str]:
+        """Compare the files with the last snapshot, then take a new snapshot
+
+        :return: paths of the files added, modified or removed since the last snapshot
+        """
+        snapshot = self._scan()
+        changed = set(
+            path for path in set(snapshot) | set(self._snapshot)
+            if snapshot.get(path) != self._snapshot.get(path))
+        self._snapshot = snapshot
+        return changed
+
+    def wait(self, timeout: Optional[float]=None) -> Set[str]:
+        """Wait until files are added, modified or removed
+
+        :param timeout: maximum time to wait for the first change, in seconds, or None
+            to wait indefinitely
+        :return: paths of the changed files, or an empty set on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        changed = set()  # type: Set[str]
+        while not changed:
+            if deadline is not None and time.monotonic() >= deadline:
+                return changed
+            time.sleep(self._interval)
+            changed = self.poll()
+        # wait for the end of the burst
+        while True:
+            time.sleep(self._debounce)
+            more = self.poll()
+            if not more:
+                return changed
+            changed |= more
@@ -24,6 +24,10 @@ class RequestError(SolitudeError):
     pass
 
 
+class TraceFileError(SolitudeError):
+    pass
+
+
 class TransactionError(RequestError):
     def __init__(
             self,
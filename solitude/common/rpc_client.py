@@ -30,6 +30,11 @@ class RPCClient:
         self._session = requests.Session()
         self._json_rpc_id = 1
 
+    @property
+    def endpoint(self) -> str:
+        """JSON-RPC server URL"""
+        return self._endpoint
+
     def _prepare(self, key, args):
         rpc_call_id = self._json_rpc_id
         self._json_rpc_id += 1
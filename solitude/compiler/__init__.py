@@ -4,7 +4,10 @@
 # COPYING file in the root directory of this source tree
 
 from solitude.compiler.compiler import Compiler
+from solitude.compiler.compile_cache import CompileCache
+from solitude.compiler.import_graph import ImportGraph
+from solitude.compiler.solc_worker import SolcWorker
 
 __all__ = [
-    "Compiler"
+    "Compiler", "CompileCache", "ImportGraph", "SolcWorker"
 ]
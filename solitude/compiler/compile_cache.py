@@ -0,0 +1,146 @@
+# Copyright (c) 2019, Solitude Developers
+#
+# This source code is licensed under the BSD-3-Clause license found in the
+# COPYING file in the root directory of this source tree
+
+from typing import Optional, List, Tuple  # noqa
+import os
+import json
+import zlib
+import hashlib
+import tempfile
+
+from solitude._internal import RaiseForParam, type_assert, value_assert
+
+
+# changes whenever the format of the entries changes
+_CACHE_VERSION = b"solitude-compile-cache-2"
+_SUFFIX = ".json.z"
+
+
+class CompileCache:
+    """Content-addressed cache of compiler outputs, stored in a directory
+
+    Entries are keyed by a hash of the whole compiler input (sources and settings)
+    and of the compiler executable, so they never need to be invalidated. When the
+    total size of the entries exceeds the limit, the least recently used ones are
+    removed. The directory can be shared by several projects and processes.
+    """
+    def __init__(self, directory: str, max_size: int=256 * 1024 * 1024):
+        """Create a CompileCache
+
+        :param directory: path of the cache directory, created if it does not exist
+        :param max_size: maximum total size of the cache entries, in bytes
+        """
+        with RaiseForParam("max_size"):
+            type_assert(max_size, int)
+            value_assert(max_size > 0, "Cache size must be positive")
+        self._directory = directory
+        self._max_size = max_size
+
+    @property
+    def directory(self) -> str:
+        """Path of the cache directory"""
+        return self._directory
+
+    @staticmethod
+    def make_key(executable: str, data: dict) -> str:
+        """Compute the cache key of a compiler invocation
+
+        The executable is identified by its resolved path, size and modification
+        time, which change with the compiler version.
+
+        :param executable: path to the compiler executable
+        :param data: compiler input, as standard JSON dictionary
+        :return: key, as hex string
+        """
+        path = os.path.realpath(executable)
+        stat = os.stat(path)
+        h = hashlib.sha256()
+        h.update(_CACHE_VERSION)
+        h.update(b"\0")
+        h.update(("%s\0%d\0%d\0" % (path, stat.st_size, stat.st_mtime_ns)).encode("utf-8"))
+        h.update(json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, key + _SUFFIX)
+
+    def get(self, key: str) -> Optional[dict]:
+        """Get a cache entry, and mark it as recently used
+
+        :param key: key, from :py:meth:`make_key`
+        :return: the compiler output, or None if it is not in the cache
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fp:
+                value = json.loads(zlib.decompress(fp.read()).decode("utf-8"))
+            os.utime(path)
+        except (OSError, ValueError, zlib.error):
+            # missing, or corrupted by an interrupted write from an old version
+            return None
+        return value
+
+    def put(self, key: str, value: dict) -> None:
+        """Add an entry to the cache, then remove the least recently used entries
+        if the cache is too large
+
+        :param key: key, from :py:meth:`make_key`
+        :param value: the compiler output, as JSON serializable dictionary
+        """
+        os.makedirs(self._directory, exist_ok=True)
+        data = zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+        # write to a temporary file first, so that readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(data)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._evict()
+
+    def clear(self) -> None:
+        """Remove all the entries from the cache"""
+        for _, _, path in self._entries():
+            _remove(path)
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        # (last use time, size, path) of all entries
+        out = []
+        try:
+            names = os.listdir(self._directory)
+        except OSError:
+            return out
+        for name in names:
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self._directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            out.append((stat.st_mtime, stat.st_size, path))
+        return out
+
+    def _evict(self) -> None:
+        entries = self._entries()
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self._max_size:
+                break
+            _remove(path)
+            size -= entry_size
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        # removed by another process
+        pass
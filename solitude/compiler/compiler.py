@@ -14,6 +14,7 @@ from solitude.common import (
 from solitude.errors import CompilerError
 
 from solitude.compiler.solc_wrapper import SolcWrapper as SolcWrapper
+from solitude.compiler.compile_cache import CompileCache
 
 
 class Compiler:
@@ -33,18 +34,35 @@ class Compiler:
         # SolcWrapper.Out.RUNTIME_LINKREFS,
     ]
 
-    def __init__(self, executable: str, optimize: Optional[int]=None):
+    def __init__(
+            self,
+            executable: str,
+            optimize: Optional[int]=None,
+            cache_dir: Optional[str]=None,
+            cache_size: int=256 * 1024 * 1024,
+            jobs: int=1,
+            persistent: bool=False):
         """Create a compiler instance
 
         :param executable: path to compiler executable binary
         :param optimize: solidity optimizer runs, or None
+        :param cache_dir: directory where the compiler outputs are cached, or None to
+            always invoke the compiler (see :py:class:`CompileCache`)
+        :param cache_size: maximum size of the cache, in bytes
+        :param jobs: maximum number of compiler processes running in parallel. Sources
+            which do not import each other are compiled by separate processes.
+        :param persistent: with solc-js, compile in long-lived worker processes
+            instead of starting the compiler for each compilation (see :py:class:`SolcWorker`)
         """
         self._executable = executable
         self._solc = SolcWrapper(
             executable=executable,
             outputs=Compiler._OUTPUT_VALUES,
             optimize=optimize,
-            warnings_as_errors=False)  # TODO expose this option
+            warnings_as_errors=False,  # TODO expose this option
+            cache=CompileCache(cache_dir, cache_size) if cache_dir is not None else None,
+            jobs=jobs,
+            persistent=persistent)
 
     def compile(self, sourcelist: ContractSourceList) -> ContractObjectList:
         """Compile all contracts in a collection of sources
@@ -60,3 +78,13 @@ class Compiler:
         for (unitname, contractname), data in output_dict.items():
             compiled.add_contract(unitname, contractname, data)
         return compiled
+
+    def close(self) -> None:
+        """Stop the compiler worker processes, if any. The compiler can still be used."""
+        self._solc.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, value, traceback):
+        self.close()
@@ -0,0 +1,132 @@
+# Copyright (c) 2019, Solitude Developers
+#
+# This source code is licensed under the BSD-3-Clause license found in the
+# COPYING file in the root directory of this source tree
+
+from typing import List, Dict, Set, Iterable  # noqa
+import posixpath
+import re
+
+
+# import directives, and the comments and string literals which may contain text
+# looking like one; the first alternative matching at a position is used
+_TOKEN = re.compile(
+    r'//[^\n]*|/\*.*?\*/'
+    r'|\bimport\s+(?:[^;"\']*?\bfrom\s+)?(?:"((?:\\.|[^"\\])*)"|\'((?:\\.|[^\'\\])*)\')[^;]*;'
+    r'|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'',
+    re.DOTALL)
+
+
+def parse_imports(source: str) -> List[str]:
+    """Find the paths imported by a source unit
+
+    :param source: source code text
+    :return: list of imported paths, as written in the import directives
+    """
+    out = []
+    for m in _TOKEN.finditer(source):
+        if m.group(1) is not None:
+            out.append(m.group(1))
+        elif m.group(2) is not None:
+            out.append(m.group(2))
+    return out
+
+
+def resolve_import(unitname: str, path: str) -> str:
+    """Get the name of the source unit imported by an import directive, like solc
+    does without remappings: paths starting with "./" or "../" are relative to the
+    importing unit, the others are unit names.
+
+    :param unitname: name of the importing source unit
+    :param path: imported path
+    :return: imported source unit name
+    """
+    if path.startswith("./") or path.startswith("../"):
+        path = posixpath.join(posixpath.dirname(unitname), path)
+    normalized = posixpath.normpath(path)
+    if path.startswith("//"):
+        # normpath keeps a leading "//"
+        normalized = "/" + normalized.lstrip("/")
+    return normalized
+
+
+class ImportGraph:
+    """Dependency graph of a collection of source units, built from their import
+    directives. Imports of units outside the collection are ignored.
+    """
+    def __init__(self, sources: Dict[str, str]):
+        """Create an ImportGraph
+
+        :param sources: dictionary of (unit name -> source code text)
+        """
+        self._dependencies = {}  # type: Dict[str, Set[str]]
+        self._dependents = {unitname: set() for unitname in sources}  # type: Dict[str, Set[str]]
+        for unitname, source in sources.items():
+            dependencies = set()
+            for path in parse_imports(source):
+                imported = resolve_import(unitname, path)
+                if imported in sources and imported != unitname:
+                    dependencies.add(imported)
+                    self._dependents[imported].add(unitname)
+            self._dependencies[unitname] = dependencies
+
+    @property
+    def unitnames(self) -> List[str]:
+        """Names of all source units, sorted"""
+        return sorted(self._dependencies)
+
+    def dependencies(self, unitname: str) -> Set[str]:
+        """Get the units directly imported by a unit
+
+        :param unitname: source unit name
+        :return: set of unit names
+        """
+        return set(self._dependencies[unitname])
+
+    def dependents(self, unitname: str) -> Set[str]:
+        """Get the units which directly import a unit
+
+        :param unitname: source unit name
+        :return: set of unit names
+        """
+        return set(self._dependents[unitname])
+
+    def closure(self, unitnames: Iterable[str]) -> Set[str]:
+        """Get units and all the units they import, directly or indirectly
+
+        :param unitnames: source unit names
+        :return: set of unit names, including `unitnames`
+        """
+        out = set()  # type: Set[str]
+        pending = list(unitnames)
+        while pending:
+            unitname = pending.pop()
+            if unitname not in out:
+                out.add(unitname)
+                pending.extend(self._dependencies[unitname])
+        return out
+
+    def components(self) -> List[List[str]]:
+        """Partition the units into groups which do not import each other. Each group
+        contains the import closure of all its units, so it can be compiled on its own.
+
+        :return: list of groups, each a sorted list of unit names, ordered by their
+            first unit name
+        """
+        out = []
+        seen = set()  # type: Set[str]
+        for unitname in self.unitnames:
+            if unitname in seen:
+                continue
+            component = []
+            pending = [unitname]
+            seen.add(unitname)
+            while pending:
+                current = pending.pop()
+                component.append(current)
+                for other in self._dependencies[current] | self._dependents[current]:
+                    if other not in seen:
+                        seen.add(other)
+                        pending.append(other)
+            out.append(sorted(component))
+        return out
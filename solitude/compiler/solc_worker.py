@@ -0,0 +1,111 @@
+# Copyright (c) 2019, Solitude Developers
+#
+# This source code is licensed under the BSD-3-Clause license found in the
+# COPYING file in the root directory of this source tree
+
+from typing import Optional  # noqa
+import os
+import json
+import subprocess
+import threading
+import weakref
+
+from solitude.common.errors import CommunicationError
+
+
+# name of the server script, installed next to the solc-js launch script
+SOLCJS_SERVER = "solcjs_server"
+
+
+class SolcWorker:
+    """Long-lived solc-js process, which compiles standard JSON inputs sent over a pipe
+
+    Starting node and loading the compiler take much longer than compiling small
+    sources, so a worker is started once and reused for many compilations.
+    The native solc executable reads a single input until the end of its standard
+    input and cannot be used as a worker.
+    """
+    def __init__(self, script: str, node: str="node"):
+        """Create a SolcWorker, and start its process
+
+        :param script: path to the server script, see :py:meth:`find_script`
+        :param node: node executable
+        """
+        self._script = script
+        self._node = node
+        self._lock = threading.Lock()
+        self._process = None  # type: Optional[subprocess.Popen]
+        self._finalizer = None  # type: Optional[weakref.finalize]
+        self._start()
+
+    @staticmethod
+    def find_script(executable: str) -> Optional[str]:
+        """Find the server script of a solc-js installation
+
+        :param executable: path to the solc executable
+        :return: path to the server script, or None if the executable is not solc-js
+            or was installed without the script
+        """
+        path = os.path.join(os.path.dirname(os.path.realpath(executable)), SOLCJS_SERVER)
+        return path if os.path.isfile(path) else None
+
+    def _start(self) -> None:
+        try:
+            self._process = subprocess.Popen(
+                [self._node, self._script],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE)
+        except OSError as e:
+            raise CommunicationError("Cannot start the compiler worker: %s" % str(e)) from e
+        self._finalizer = weakref.finalize(self, _stop, self._process)
+
+    @property
+    def running(self) -> bool:
+        """Whether the worker process is running"""
+        return self._process is not None and self._process.poll() is None
+
+    def compile(self, data: dict) -> dict:
+        """Compile a standard JSON input
+
+        The process is restarted if it has exited since the last compilation.
+
+        :param data: compiler input, as standard JSON dictionary
+        :return: compiler output, as standard JSON dictionary
+        """
+        with self._lock:
+            if not self.running:
+                self.close()
+                self._start()
+            line = json.dumps(data, separators=(",", ":")) + "\n"
+            try:
+                self._process.stdin.write(line.encode("utf-8"))
+                self._process.stdin.flush()
+                out = self._process.stdout.readline()
+            except OSError as e:
+                self.close()
+                raise CommunicationError("Compiler worker failed: %s" % str(e)) from e
+            if not out:
+                self.close()
+                raise CommunicationError("Compiler worker exited unexpectedly")
+        return json.loads(out.decode("utf-8"))
+
+    def close(self) -> None:
+        """Stop the worker process"""
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+        self._process = None
+
+
+def _stop(process: subprocess.Popen) -> None:
+    # closing the standard input terminates the server
+    try:
+        process.stdin.close()
+    except OSError:
+        pass
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    process.stdout.close()
@@ -3,20 +3,29 @@
 # This source code is licensed under the BSD-3-Clause license found in the
 # COPYING file in the root directory of this source tree
 
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Callable
 import subprocess
 import re
 import json
 import datetime
 import os
 import sys
+import threading
+import zlib
+import bisect
+from concurrent.futures import ThreadPoolExecutor
 from solitude.errors import CompilerError
 from solitude.common import FileMessage, path_to_unitname
 from solitude._internal import (
     EnumType, RaiseForParam, isfile_assert, value_assert, type_assert)
+from solitude.compiler.compile_cache import CompileCache
+from solitude.compiler.import_graph import ImportGraph
+from solitude.compiler.solc_worker import SolcWorker
 
 
 UNDEFINED = "undefined"
+# source files are read by several threads, as reading is mostly waiting for I/O
+_READ_THREADS = 8
 
 
 class EvmVersion(EnumType):
@@ -64,7 +73,10 @@ class SolcWrapper:
             outputs: List[str]=None,
             optimize: Optional[int]=None,
             evm_version: Optional[str]=None,
-            warnings_as_errors: bool=False):
+            warnings_as_errors: bool=False,
+            cache: Optional[CompileCache]=None,
+            jobs: int=1,
+            persistent: bool=False):
 
         with RaiseForParam("executable"):
             isfile_assert(executable)
@@ -89,6 +101,21 @@ class SolcWrapper:
 
         self._warnings_as_errors = bool(warnings_as_errors)
 
+        with RaiseForParam("cache"):
+            type_assert(cache, (CompileCache, type(None)))
+            self._cache = cache
+
+        with RaiseForParam("jobs"):
+            type_assert(jobs, int)
+            value_assert(jobs > 0, "Number of jobs must be positive")
+            self._jobs = jobs
+
+        # with solc-js, compile in long-lived worker processes; idle workers are kept
+        #   for the next compilations, there are at most as many workers as jobs
+        self._worker_script = SolcWorker.find_script(executable) if persistent else None
+        self._workers = []  # type: List[SolcWorker]
+        self._workers_lock = threading.Lock()
+
     def compile(
             self,
             source_files: Optional[List[str]]=None,
@@ -110,9 +137,9 @@ class SolcWrapper:
                 type_assert(source_files, list)
                 for path in source_files:
                     isfile_assert(path)
-                    absolute_path = os.path.abspath(path)
-                    unitname = data.add_source_from_file(absolute_path)
-                    unitname_to_path[unitname] = absolute_path
+                absolute_paths = [os.path.abspath(path) for path in source_files]
+                unitnames = data.add_sources_from_files(absolute_paths)
+                unitname_to_path.update(zip(unitnames, absolute_paths))
 
         # include source strings in the JSON
         with RaiseForParam("source_strings"):
@@ -130,8 +157,24 @@ class SolcWrapper:
                         "Value must be a string containing the source code")
                     data.add_source(unitname, contents)
 
-        # invoke solc
-        solc_out = self.call_standard_json(data.value())
+        if self._cache is not None:
+            solc_out = self._compile_incremental(data)
+        elif self._jobs > 1:
+            # compile separately the groups of sources which do not import each
+            #   other, so that they can run in parallel
+            groups = ImportGraph(data.get_sources()).components()
+            group_outputs = self._call_all([data.subset(group).value() for group in groups])
+            if len(group_outputs) == 1:
+                solc_out = group_outputs[0]
+            else:
+                units = {}  # type: Dict[str, dict]
+                errors = []
+                for group_out in group_outputs:
+                    units.update(_split_output(group_out))
+                    errors.extend(group_out.get("errors", []))
+                solc_out = _merge_units(units, errors)
+        else:
+            solc_out = self.call_standard_json(data.value())
         timestamp = datetime.datetime.utcnow().isoformat()
 
         # collect errors and warnings
@@ -149,49 +192,59 @@ class SolcWrapper:
             raise CompilerError([
                 _convert_error(error) for error in errors])
 
-        contracts = solc_out.get("contracts", {})
-        sources = solc_out.get("sources", {})
-        sourceid_to_unitname = [None] * len(sources)
-
-        output = {}
-
-        # gather AST and source id for each source
-        unitname_to_ast = {}
-        for unitname, unit in sources.items():
-            unitname_to_ast[unitname] = unit.get("ast")
-            sourceid_to_unitname[unit["id"]] = unitname
-
-        # create output dictionary, (unitname, contractname) -> contract
-        # including the full source content and AST
-        for unitname, contracts_in_unit in contracts.items():
-            for contractname, contract in contracts_in_unit.items():
-                try:
-                    source_path = unitname_to_path[unitname]
-                except KeyError:
-                    source_path = unitname
-                out_contract_data = {}
-                out_contract_data["abi"] = contract.get("abi")
-                out_contract_data["bin"] = (
-                    contract.get("evm", {}).get("bytecode", {}).get("object"))
-                out_contract_data["srcmap"] = (
-                    contract.get("evm", {}).get("bytecode", {}).get("sourceMap"))
-                out_contract_data["bin-runtime"] = (
-                    contract.get("evm", {}).get("deployedBytecode", {}).get("object"))
-                out_contract_data["srcmap-runtime"] = (
-                    contract.get("evm", {}).get("deployedBytecode", {}).get("sourceMap"))
-                out_contract_data["_solitude"] = {
-                    "ast": unitname_to_ast[unitname],
-                    "unitName": unitname,
-                    "contractName": contractname,
-                    "sourceList": sourceid_to_unitname,
-                    "sourcePath": source_path,
-                    "source": data.get_source(unitname),
-                    "timestamp": timestamp
-                }
-                output[(unitname, contractname)] = out_contract_data
-        return output
+        return _make_output(solc_out, data, unitname_to_path, timestamp)
+
+    def _compile_incremental(self, data: "_SolcStandardJsonInput") -> dict:
+        # the output of each unit is cached, keyed by the sources of its import
+        #   closure. The units missing from the cache, i.e. the changed units and
+        #   the ones importing them directly or indirectly, are compiled with their
+        #   import closure, and the outputs of the others are not requested.
+        graph = ImportGraph(data.get_sources())
+        keys = {}  # type: Dict[str, str]
+        units = {}  # type: Dict[str, dict]
+        for unitname in graph.unitnames:
+            closure = sorted(graph.closure([unitname]))
+            keys[unitname] = self._cache.make_key(
+                self._executable, {"unit": unitname, "input": data.subset(closure).value()})
+            unit = self._cache.get(keys[unitname])
+            if unit is not None:
+                units[unitname] = unit
+        errors = []
+        for unitname in sorted(units):
+            for error in units[unitname]["errors"]:
+                if error not in errors:
+                    errors.append(error)
+
+        groups = [[unitname for unitname in group if unitname not in units] for group in graph.components()]
+        groups = [group for group in groups if group]
+        group_outputs = self._call_all([
+            data.subset(sorted(graph.closure(group)), outputs=group).value() for group in groups])
+        for group, group_out in zip(groups, group_outputs):
+            group_errors = group_out.get("errors", [])
+            errors.extend(group_errors)
+            failed = any(error.get("severity") == "error" for error in group_errors)
+            for unitname, unit in _split_output(group_out, group).items():
+                # warnings are kept with the units, so that they are reported
+                #   again when the units come from the cache
+                unit["errors"] = [
+                    error for error in group_errors
+                    if error.get("sourceLocation", {}).get("file", unitname) == unitname]
+                if not failed:
+                    self._cache.put(keys[unitname], unit)
+                units[unitname] = unit
+        return _merge_units(units, errors)
+
+    def _call_all(self, inputs: List[dict]) -> List[dict]:
+        # invoke solc for each input, in parallel up to the number of jobs
+        if self._jobs > 1 and len(inputs) > 1:
+            with ThreadPoolExecutor(max_workers=min(self._jobs, len(inputs))) as executor:
+                return list(executor.map(self.call_standard_json, inputs))
+        return [self.call_standard_json(solc_in) for solc_in in inputs]
 
     def call_standard_json(self, data: dict):
+        if self._worker_script is not None:
+            return self._call_worker(data)
+
         cmd = [self._executable, "--standard-json"]
 
         p = subprocess.Popen(
@@ -200,11 +253,239 @@ class SolcWrapper:
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE)
 
-        stdin_data = json.dumps(data, indent=2).encode("utf-8")
+        # compact, solc does not need the whitespace of an indented input
+        stdin_data = json.dumps(data, separators=(",", ":")).encode("utf-8")
         out, err = p.communicate(stdin_data)
         out_dict = json.loads(out.decode("utf-8"))
         return out_dict
 
+    def _call_worker(self, data: dict) -> dict:
+        with self._workers_lock:
+            worker = self._workers.pop() if self._workers else None
+        if worker is None:
+            worker = SolcWorker(self._worker_script)
+        out_dict = worker.compile(data)
+        with self._workers_lock:
+            self._workers.append(worker)
+        return out_dict
+
+    def close(self) -> None:
+        """Stop the compiler worker processes, if any"""
+        with self._workers_lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.close()
+
+
+# AST fields containing node ids, or lists of node ids
+_AST_ID_KEYS = set(["id", "referencedDeclaration", "scope", "sourceUnit"])
+_AST_ID_LIST_KEYS = set(["linearizedBaseContracts", "contractDependencies", "baseFunctions"])
+# node ids in type identifiers, like "t_contract$_Token_$42", as opposed to the
+#   other numbers they contain, like array lengths in "t_array$_t_uint256_$10_storage";
+#   a "$" in a name is escaped as "$$$"
+_TYPE_IDENTIFIER_ID = re.compile(r"(t_(?:contract|struct|enum)\$_(?:\w|\$\$\$)+?_\$)(\d+)")
+
+
+# the AST node ids of each unit are shifted into ranges of _AST_ID_RANGE ids, out
+#   of _AST_ID_RANGES, picked from the unit name
+_AST_ID_RANGE = 1 << 16
+_AST_ID_RANGES = 1 << 15
+
+
+def _split_output(solc_out: dict, unitnames: Optional[List[str]]=None) -> Dict[str, dict]:
+    # outputs of the units of a compilation, which can be merged with the units of
+    #   other compilations by _merge_units; each one keeps the source list and the
+    #   AST id ranges of the compilation, which its source ids and AST ids refer to
+    sources = solc_out.get("sources", {})
+    source_list = [None] * (max((unit["id"] for unit in sources.values()), default=-1) + 1)
+    ranges = {}  # type: Dict[str, List[int]]
+    for unitname, unit in sources.items():
+        source_list[unit["id"]] = unitname
+        id_range = _ast_id_range(unit.get("ast"))
+        if id_range is not None:
+            ranges[unitname] = id_range
+    out = {}
+    for unitname in (unitnames if unitnames is not None else sources):
+        if unitname in sources:
+            out[unitname] = {
+                "sourceList": source_list,
+                "ranges": ranges,
+                "ast": sources[unitname].get("ast"),
+                "contracts": solc_out.get("contracts", {}).get(unitname, {}),
+                "errors": []}
+    return out
+
+
+def _merge_units(units: Dict[str, dict], errors: List[dict]) -> dict:
+    # merge the outputs of units from separate compilations, as if they were a
+    #   single one: source ids follow the order of the unit names, and the AST node
+    #   ids of each unit are moved to the range picked for the unit. References to
+    #   the nodes of imported units are moved to the ranges of those units, so the
+    #   AST ids of a unit do not depend on which other units were compiled with it.
+    unitnames = sorted(units)
+    sourceids = {unitname: i for i, unitname in enumerate(unitnames)}
+    bases = _ast_id_bases({unitname: unit["ranges"].get(unitname) for unitname, unit in units.items()})
+    merged = {"sources": {}, "contracts": {}}  # type: dict
+    for unitname in unitnames:
+        unit = units[unitname]
+        fileids = {i: sourceids[name] for i, name in enumerate(unit["sourceList"]) if name in sourceids}
+        remap_id = _make_id_remap(unit["ranges"], bases)
+        merged["sources"][unitname] = {
+            "id": sourceids[unitname],
+            "ast": _remap_ast(unit["ast"], fileids, remap_id)}
+        merged["contracts"][unitname] = {
+            contractname: _remap_contract(contract, fileids)
+            for contractname, contract in unit["contracts"].items()}
+    if errors:
+        merged["errors"] = errors
+    return merged
+
+
+def _ast_id_bases(ranges: Dict[str, Optional[List[int]]]) -> Dict[str, int]:
+    # first AST id of each unit; a unit takes as many consecutive ranges as its ids
+    #   need, starting from the one picked by its name, or from the next free one
+    #   when it collides with a unit before it in name order
+    bases = {}  # type: Dict[str, int]
+    used = set()
+    for unitname in sorted(ranges):
+        id_range = ranges[unitname]
+        if id_range is None:
+            continue
+        count = (id_range[1] - id_range[0]) // _AST_ID_RANGE + 1
+        start = zlib.crc32(unitname.encode("utf-8")) % _AST_ID_RANGES
+        while any(start + k in used for k in range(count)):
+            start += 1
+        used.update(range(start, start + count))
+        bases[unitname] = start * _AST_ID_RANGE
+    return bases
+
+
+def _make_id_remap(ranges: Dict[str, List[int]], bases: Dict[str, int]) -> Callable[[int], int]:
+    # maps the AST ids of a compilation to the ranges of their units; negative ids
+    #   refer to builtin declarations and are kept
+    spans = sorted((first, last, bases[unitname]) for unitname, (first, last) in ranges.items() if unitname in bases)
+    firsts = [span[0] for span in spans]
+
+    def remap_id(value):
+        if not isinstance(value, int) or value < 0:
+            return value
+        i = bisect.bisect_right(firsts, value) - 1
+        if i >= 0 and value <= spans[i][1]:
+            return spans[i][2] + value - spans[i][0]
+        return value
+    return remap_id
+
+
+def _ast_id_range(node) -> Optional[List[int]]:
+    # [first, last] node id of an AST, or None if it has no nodes
+    ids = []  # type: List[int]
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, dict):
+            value = node.get("id")
+            if isinstance(value, int) and value >= 0:
+                ids.append(value)
+            nodes.extend(node.values())
+        elif isinstance(node, list):
+            nodes.extend(node)
+    return [min(ids), max(ids)] if ids else None
+
+
+def _remap_ast(node, fileids: Dict[int, int], remap_id: Callable[[int], int]):
+    # copy of an AST with new source ids and node ids
+    if isinstance(node, list):
+        return [_remap_ast(value, fileids, remap_id) for value in node]
+    if not isinstance(node, dict):
+        return node
+    out = {}
+    for key, value in node.items():
+        if key == "src" and isinstance(value, str):
+            out[key] = _remap_src(value, fileids)
+        elif key in _AST_ID_KEYS:
+            out[key] = remap_id(value)
+        elif key in _AST_ID_LIST_KEYS and isinstance(value, list):
+            out[key] = [remap_id(x) for x in value]
+        elif key == "exportedSymbols" and isinstance(value, dict):
+            out[key] = {name: [remap_id(x) for x in ids] for name, ids in value.items()}
+        elif key == "typeIdentifier" and isinstance(value, str):
+            out[key] = _TYPE_IDENTIFIER_ID.sub(
+                lambda m: "%s%d" % (m.group(1), remap_id(int(m.group(2)))), value)
+        else:
+            out[key] = _remap_ast(value, fileids, remap_id)
+    return out
+
+
+def _remap_contract(contract: dict, fileids: Dict[int, int]) -> dict:
+    # copy of a contract output with new source ids in its source maps
+    evm = dict(contract.get("evm", {}))
+    for key in ("bytecode", "deployedBytecode"):
+        bytecode = evm.get(key)
+        if bytecode is not None and bytecode.get("sourceMap"):
+            evm[key] = dict(bytecode, sourceMap=_remap_srcmap(bytecode["sourceMap"], fileids))
+    out = dict(contract)
+    if evm:
+        out["evm"] = evm
+    return out
+
+
+def _remap_src(src: str, fileids: Dict[int, int]) -> str:
+    # "start:length:source id"
+    fields = src.split(":")
+    if len(fields) > 2 and fields[2] and fields[2] != "-1":
+        fileid = int(fields[2])
+        fields[2] = str(fileids.get(fileid, fileid))
+    return ":".join(fields)
+
+
+def _remap_srcmap(srcmap: str, fileids: Dict[int, int]) -> str:
+    # compressed source map, "s:l:f:j;s:l:f:j;..." where fields may be omitted
+    return ";".join(_remap_src(entry, fileids) for entry in srcmap.split(";"))
+
+
+def _make_output(solc_out: dict, data: "_SolcStandardJsonInput", unitname_to_path: Dict[str, str], timestamp: str):
+    contracts = solc_out.get("contracts", {})
+    sources = solc_out.get("sources", {})
+    sourceid_to_unitname = [None] * len(sources)
+
+    output = {}
+
+    # gather AST and source id for each source
+    unitname_to_ast = {}
+    for unitname, unit in sources.items():
+        unitname_to_ast[unitname] = unit.get("ast")
+        sourceid_to_unitname[unit["id"]] = unitname
+
+    # create output dictionary, (unitname, contractname) -> contract
+    # including the full source content and AST
+    for unitname, contracts_in_unit in contracts.items():
+        for contractname, contract in contracts_in_unit.items():
+            try:
+                source_path = unitname_to_path[unitname]
+            except KeyError:
+                source_path = unitname
+            out_contract_data = {}
+            out_contract_data["abi"] = contract.get("abi")
+            out_contract_data["bin"] = (
+                contract.get("evm", {}).get("bytecode", {}).get("object"))
+            out_contract_data["srcmap"] = (
+                contract.get("evm", {}).get("bytecode", {}).get("sourceMap"))
+            out_contract_data["bin-runtime"] = (
+                contract.get("evm", {}).get("deployedBytecode", {}).get("object"))
+            out_contract_data["srcmap-runtime"] = (
+                contract.get("evm", {}).get("deployedBytecode", {}).get("sourceMap"))
+            out_contract_data["_solitude"] = {
+                "ast": unitname_to_ast[unitname],
+                "unitName": unitname,
+                "contractName": contractname,
+                "sourceList": sourceid_to_unitname,
+                "sourcePath": source_path,
+                "source": data.get_source(unitname),
+                "timestamp": timestamp
+            }
+            output[(unitname, contractname)] = out_contract_data
+    return output
+
 
 def _convert_error(error: dict) -> FileMessage:
     line, column = 1, 1
@@ -238,6 +519,11 @@ def _make_output_selection_dict(outputs: List[str]) -> dict:
     }
 
 
+def _read_source(path: str) -> str:
+    with open(path, "r") as fp:
+        return fp.read()
+
+
 class _SolcStandardJsonInput:
     def __init__(self):
         self._language = "Solidity"
@@ -272,17 +558,44 @@ class _SolcStandardJsonInput:
 
     def add_source_from_file(self, path) -> str:
         unitname = path_to_unitname(path)
-        with open(path, "r") as fp:
-            contents = fp.read()
-        self.add_source(unitname, contents)
+        self.add_source(unitname, _read_source(path))
         return unitname
 
+    def add_sources_from_files(self, paths: List[str]) -> List[str]:
+        if len(paths) > 1:
+            with ThreadPoolExecutor(max_workers=min(_READ_THREADS, len(paths))) as executor:
+                contents = list(executor.map(_read_source, paths))
+        else:
+            contents = [_read_source(path) for path in paths]
+        unitnames = [path_to_unitname(path) for path in paths]
+        for unitname, source in zip(unitnames, contents):
+            self.add_source(unitname, source)
+        return unitnames
+
     def add_source(self, unitname: str, contents: str):
         self._sources[unitname] = contents
 
     def get_source(self, unitname: str):
         return self._sources[unitname]
 
+    def get_sources(self) -> Dict[str, str]:
+        return dict(self._sources)
+
+    def subset(self, unitnames: List[str], outputs: Optional[List[str]]=None) -> "_SolcStandardJsonInput":
+        # input with some of the sources; if outputs is given, only the ASTs are
+        #   requested for the units not in it
+        out = _SolcStandardJsonInput()
+        out._language = self._language
+        out._settings = self._settings
+        if outputs is not None:
+            selection = self._settings["outputSelection"].get("*", {})
+            out._settings = dict(self._settings)
+            out._settings["outputSelection"] = {"*": {"": selection.get("", [])}}
+            for unitname in outputs:
+                out._settings["outputSelection"][unitname] = selection
+        out._sources = {unitname: self._sources[unitname] for unitname in unitnames}
+        return out
+
     def value(self):
         return {
             "language": self._language,
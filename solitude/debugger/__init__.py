@@ -4,11 +4,23 @@
 # COPYING file in the root directory of this source tree
 
 from solitude.debugger.evm_trace import EvmTrace, TraceStep, SourceMapping, CallStackElement, CallStackEvent
+from solitude.debugger.trace_store import TraceStore, MemoryWrite, StorageWrite
+from solitude.debugger.storage_layout import StorageLayout, StorageVariable
+from solitude.debugger.trace_file import TraceFile
 from solitude.debugger.evm_debug_core import EvmDebugCore, Function, Frame, Step, Value
 from solitude.debugger.oi_debugger import InteractiveDebuggerOI
+from solitude.debugger.debug_adapter import DebugAdapter
+from solitude.debugger.gas_profiler import GasProfiler, GasProfile, GasCost
+from solitude.debugger.coverage import Coverage, CoverageMap
+from solitude.debugger.trace_analyzer import TraceAnalyzer, TraceAnalysis
 
 __all__ = [
     "EvmTrace", "TraceStep", "SourceMapping", "CallStackElement", "CallStackEvent",
+    "TraceStore", "MemoryWrite", "StorageWrite", "TraceFile",
+    "StorageLayout", "StorageVariable",
     "EvmDebugCore", "Function", "Frame", "Step", "Value",
-    "InteractiveDebuggerOI"
+    "InteractiveDebuggerOI", "DebugAdapter",
+    "GasProfiler", "GasProfile", "GasCost",
+    "Coverage", "CoverageMap",
+    "TraceAnalyzer", "TraceAnalysis"
 ]
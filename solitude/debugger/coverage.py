@@ -0,0 +1,215 @@
+# Copyright (c) 2019, Solitude Developers
+#
+# This source code is licensed under the BSD-3-Clause license found in the
+# COPYING file in the root directory of this source tree
+
+from typing import List, Dict, Tuple, Set  # noqa
+import os
+import time
+import binascii
+import xml.etree.ElementTree as ET
+
+from solitude.common import ContractObjectList
+from solitude.debugger.evm_opcodes import OPCODES
+from solitude.debugger.evm_trace import FrameDecoder, SourceMapper
+from solitude.debugger.trace_store import TraceStore
+
+
+# a branch is identified by its JUMPI instruction, as
+#   (contractname, pc, start, length, fileno)
+BranchKey = Tuple[str, int, int, int, int]
+
+_JUMPI = OPCODES["JUMPI"]
+
+
+class CoverageMap:
+    """Lines and branches of the compiled contracts which can be covered, found
+    from the source maps of their deployment and runtime bytecode. Branches are
+    the conditional jumps (JUMPI) generated by the compiler.
+    """
+    def __init__(self, contracts: ContractObjectList):
+        """Create a CoverageMap
+
+        :param contracts: a collection of contracts (see ContractObjectList)
+        """
+        self.lines = {}  # type: Dict[str, Set[int]]
+        self.branches = {}  # type: Dict[Tuple[str, int], List[BranchKey]]
+        srcmapper = SourceMapper(contracts)
+        # contracts are loaded one at a time, grouped by source unit
+        for unitname, contractname in contracts.keys():
+            contract = contracts.get_contract(unitname, contractname)
+            for runtime, bin_key in ((False, "bin"), (True, "bin-runtime")):
+                if not contract.get(bin_key):
+                    continue
+                try:
+                    decoder = FrameDecoder(contract, runtime=runtime)
+                except (KeyError, AttributeError, binascii.Error):
+                    # missing source map, or unlinked libraries
+                    continue
+                for pc, opcode, (st, le, fi, _) in decoder.iter_instructions():
+                    if fi < 0:
+                        continue
+                    code = srcmapper.get_source(unitname, st, le, fi)
+                    if code.unitname is None:
+                        continue
+                    self.lines.setdefault(code.unitname, set()).add(code.line_index)
+                    if opcode == _JUMPI:
+                        self.branches.setdefault((code.unitname, code.line_index), []).append(
+                            (contractname, pc, st, le, fi))
+        for branches in self.branches.values():
+            branches.sort()
+
+
+class Coverage:
+    """Line and branch hit counts of one or more transactions
+    """
+    def __init__(self):
+        # (unitname, line index) -> number of times the line was entered
+        self.lines = {}  # type: Dict[Tuple[str, int], int]
+        # branch -> [times not taken, times taken]
+        self.branches = {}  # type: Dict[BranchKey, List[int]]
+
+    def merge(self, other: "Coverage") -> None:
+        """Add the hit counts of another coverage to this one
+
+        :param other: coverage to add
+        """
+        for key, value in other.lines.items():
+            self.lines[key] = self.lines.get(key, 0) + value
+        for key, value in other.branches.items():
+            counts = self.branches.setdefault(key, [0, 0])
+            counts[0] += value[0]
+            counts[1] += value[1]
+
+    def _iter_units(self, coverage_map: CoverageMap):
+        # (unitname, [(line index, hits, [branch counts or None])])
+        units = {}  # type: Dict[str, Set[int]]
+        for unitname, lines in coverage_map.lines.items():
+            units.setdefault(unitname, set()).update(lines)
+        for unitname, line_index in self.lines:
+            units.setdefault(unitname, set()).add(line_index)
+        for unitname in sorted(units):
+            lines = []
+            for line_index in sorted(units[unitname]):
+                branches = [
+                    self.branches.get(key)
+                    for key in coverage_map.branches.get((unitname, line_index), [])]
+                lines.append((line_index, self.lines.get((unitname, line_index), 0), branches))
+            yield unitname, lines
+
+    def to_lcov(self, coverage_map: CoverageMap) -> str:
+        """Create a coverage report in lcov tracefile format
+
+        :param coverage_map: lines and branches which can be covered
+        :return: report, as text
+        """
+        out = ["TN:"]
+        for unitname, lines in self._iter_units(coverage_map):
+            out.append("SF:%s" % unitname)
+            branches_found, branches_hit = 0, 0
+            for line_index, _, branches in lines:
+                for block, counts in enumerate(branches):
+                    for branch in (0, 1):
+                        if counts is None:
+                            taken = "-"
+                        else:
+                            taken = str(counts[branch])
+                            branches_hit += int(counts[branch] > 0)
+                        branches_found += 1
+                        out.append("BRDA:%d,%d,%d,%s" % (1 + line_index, block, branch, taken))
+            out.append("BRF:%d" % branches_found)
+            out.append("BRH:%d" % branches_hit)
+            for line_index, hits, _ in lines:
+                out.append("DA:%d,%d" % (1 + line_index, hits))
+            out.append("LF:%d" % len(lines))
+            out.append("LH:%d" % sum(1 for _, hits, _ in lines if hits > 0))
+            out.append("end_of_record")
+        return "\n".join(out) + "\n"
+
+    def to_cobertura(self, coverage_map: CoverageMap) -> str:
+        """Create a coverage report in Cobertura XML format
+
+        :param coverage_map: lines and branches which can be covered
+        :return: report, as text
+        """
+        def rate(hit, found):
+            return "%.4f" % (hit / found if found else 1.0)
+
+        total = [0, 0, 0, 0]  # lines valid, covered, branches valid, covered
+        classes = ET.Element("classes")
+        for unitname, lines in self._iter_units(coverage_map):
+            unit_total = [0, 0, 0, 0]
+            xml_class = ET.SubElement(classes, "class", {
+                "name": os.path.splitext(os.path.basename(unitname))[0],
+                "filename": unitname,
+                "complexity": "0"})
+            ET.SubElement(xml_class, "methods")
+            xml_lines = ET.SubElement(xml_class, "lines")
+            for line_index, hits, branches in lines:
+                attrib = {"number": str(1 + line_index), "hits": str(hits), "branch": "false"}
+                unit_total[0] += 1
+                unit_total[1] += int(hits > 0)
+                if branches:
+                    found = 2 * len(branches)
+                    hit = sum(int(c > 0) for counts in branches if counts is not None for c in counts)
+                    attrib["branch"] = "true"
+                    attrib["condition-coverage"] = "%d%% (%d/%d)" % (100 * hit // found, hit, found)
+                    unit_total[2] += found
+                    unit_total[3] += hit
+                ET.SubElement(xml_lines, "line", attrib)
+            xml_class.set("line-rate", rate(unit_total[1], unit_total[0]))
+            xml_class.set("branch-rate", rate(unit_total[3], unit_total[2]))
+            total = [a + b for a, b in zip(total, unit_total)]
+
+        root = ET.Element("coverage", {
+            "line-rate": rate(total[1], total[0]),
+            "branch-rate": rate(total[3], total[2]),
+            "lines-valid": str(total[0]),
+            "lines-covered": str(total[1]),
+            "branches-valid": str(total[2]),
+            "branches-covered": str(total[3]),
+            "complexity": "0",
+            "version": "solitude",
+            "timestamp": str(int(time.time()))})
+        ET.SubElement(ET.SubElement(root, "sources"), "source").text = "."
+        package = ET.SubElement(ET.SubElement(root, "packages"), "package", {
+            "name": "contracts",
+            "line-rate": root.get("line-rate"),
+            "branch-rate": root.get("branch-rate"),
+            "complexity": "0"})
+        package.append(classes)
+        return '<?xml version="1.0" ?>\n' + ET.tostring(root, encoding="unicode") + "\n"
+
+
+def trace_coverage(store: TraceStore) -> Coverage:
+    """Collect the line and branch hit counts of a transaction trace
+
+    :param store: trace of the transaction
+    :return: a :py:class:`Coverage`
+    """
+    out = Coverage()
+    n = len(store)
+    codes = store.code
+    ops = store.op
+    pc = store.pc
+    depth = store.depth
+
+    code_keys = {}  # type: Dict[int, tuple]
+    for code_id in set(codes):
+        code = store.get_code(code_id)
+        code_keys[code_id] = (code.unitname, code.line_index) if code.unitname is not None else None
+
+    prev_key = None
+    for i in range(n):
+        key = code_keys[codes[i]]
+        if key is not None and key != prev_key:
+            out.lines[key] = out.lines.get(key, 0) + 1
+        prev_key = key
+
+        if ops[i] == _JUMPI and i + 1 < n and depth[i + 1] == depth[i]:
+            branch = (
+                store.get_contractname(store.contract[i]), pc[i],
+                store.start[i], store.length[i], store.fileno[i])
+            counts = out.branches.setdefault(branch, [0, 0])
+            counts[int(pc[i + 1] != pc[i] + 1)] += 1
+    return out
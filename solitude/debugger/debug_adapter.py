@@ -0,0 +1,226 @@
+# Copyright (c) 2019, Solitude Developers
+#
+# This source code is licensed under the BSD-3-Clause license found in the
+# COPYING file in the root directory of this source tree
+
+from typing import Optional, Set, Callable  # noqa
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import sys
+import threading
+
+from solitude._internal.oi_interface import ObjectInterfaceException
+from solitude.debugger.oi_debugger import InteractiveDebuggerOI
+
+
+class DebugAdapter:
+    """Asynchronous server exposing an :py:class:`InteractiveDebuggerOI` to IDE front-ends
+
+    Messages are JSON objects, one per line, exchanged over the standard
+    input/output or a TCP connection.
+
+    - requests: `{"seq": 1, "command": "continue", "args": []}`
+    - responses: the result of :py:meth:`ObjectInterface.call`, with the `seq` of the request
+    - events: `{"event": "progress", "seq": 1, "steps": 2048}`, sent while the
+      request with the same `seq` runs, and `{"event": "output", "category":
+      "stderr", "output": "..."}`, for errors which are not the result of a request
+
+    Requests are executed one at a time, in order, by a worker thread, so that the
+    server keeps reading while a long command runs. The special request `cancel`
+    is handled immediately: it interrupts the last request received, which
+    returns an "interrupt" response at the step it reached. While no request is
+    pending, the worker decodes the steps following the current one.
+    """
+    def __init__(self, oi: InteractiveDebuggerOI):
+        """Create a DebugAdapter
+
+        :param oi: the debugger object interface, which must not be used elsewhere
+            while the adapter is serving
+        """
+        self._oi = oi
+        self._worker = ThreadPoolExecutor(max_workers=1)
+        self._loop = None  # type: Optional[asyncio.AbstractEventLoop]
+        self._send = None  # type: Optional[Callable[[dict], None]]
+        self._quit = False
+        # seq of the request being executed by the worker, of the last request
+        #   received, of the requests not answered yet and of the cancelled ones
+        self._current = None
+        self._last = None
+        self._pending = set()  # type: Set[object]
+        self._cancelled = set()  # type: Set[object]
+        # decoding of the steps following the current one, while no request is pending
+        self._prefetching = None  # type: Optional[asyncio.Future]
+        oi.set_progress(self._on_progress)
+
+    def serve_stdio(self) -> None:
+        """Serve requests from the standard input until it is closed, or the debugger quits"""
+        loop = asyncio.get_event_loop()
+        lines = asyncio.Queue()  # type: asyncio.Queue
+
+        def read():
+            for line in sys.stdin:
+                loop.call_soon_threadsafe(lines.put_nowait, line)
+            loop.call_soon_threadsafe(lines.put_nowait, "")
+
+        def write(text):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+        threading.Thread(target=read, daemon=True).start()
+        loop.run_until_complete(self._session(lines.get, write))
+
+    def serve_tcp(self, host: str, port: int) -> None:
+        """Serve requests from TCP connections, one at a time, until the debugger quits
+
+        :param host: address to listen on
+        :param port: port to listen on
+        """
+        loop = asyncio.get_event_loop()
+        server = loop.run_until_complete(self.start_tcp(host, port))
+        try:
+            loop.run_until_complete(self._wait_quit())
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+
+    async def start_tcp(self, host: str, port: int):
+        """Start listening for TCP connections in the running event loop
+
+        :param host: address to listen on
+        :param port: port to listen on, 0 to select a free port
+        :return: the asyncio server
+        """
+        lock = asyncio.Lock()
+
+        async def on_connection(reader, writer):
+            async def readline():
+                return (await reader.readline()).decode("utf-8")
+
+            def write(text):
+                writer.write(text.encode("utf-8"))
+
+            async with lock:
+                try:
+                    await self._session(readline, write)
+                finally:
+                    writer.close()
+
+        return await asyncio.start_server(on_connection, host, port)
+
+    async def _wait_quit(self):
+        while not self._quit:
+            await asyncio.sleep(0.1)
+
+    async def _session(self, readline, write) -> None:
+        self._loop = asyncio.get_event_loop()
+        await self._reset()
+        self._send = lambda obj: write(json.dumps(obj) + "\n")
+        requests = asyncio.Queue()  # type: asyncio.Queue
+        dispatcher = asyncio.ensure_future(self._dispatch(requests))
+        try:
+            while not dispatcher.done():
+                reading = asyncio.ensure_future(readline())
+                await asyncio.wait([reading, dispatcher], return_when=asyncio.FIRST_COMPLETED)
+                if not reading.done():
+                    reading.cancel()
+                    break
+                line = reading.result()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    obj = json.loads(line)
+                    if not isinstance(obj, dict):
+                        raise ValueError("Request must be an object")
+                except ValueError as e:
+                    self._send({
+                        "seq": None,
+                        "status": "error",
+                        "what": {"name": "SyntaxError", "message": str(e)}})
+                    continue
+                if obj.get("command") == "cancel":
+                    self._send(self._cancel(obj))
+                else:
+                    self._last = obj.get("seq")
+                    self._pending.add(self._last)
+                    requests.put_nowait(obj)
+        finally:
+            requests.put_nowait(None)
+            await dispatcher
+            await self._reset()
+
+    async def _reset(self) -> None:
+        # wait for the decoding started while no request was pending, and forget
+        #   the requests of the previous session
+        if self._prefetching is not None:
+            await asyncio.wait([self._prefetching])
+            self._prefetching = None
+        self._send = None
+        self._last = None
+        self._pending.clear()
+        self._cancelled.clear()
+
+    def _cancel(self, obj: dict) -> dict:
+        cancelled = self._last in self._pending
+        if cancelled:
+            self._cancelled.add(self._last)
+        return {
+            "seq": obj.get("seq"),
+            "status": "ok",
+            "response": {"type": "cancel", "cancelled": cancelled}}
+
+    async def _dispatch(self, requests: asyncio.Queue) -> None:
+        while True:
+            if requests.empty() and not self._quit:
+                self._prefetching = self._loop.run_in_executor(self._worker, self._prefetch)
+                self._prefetching.add_done_callback(self._on_prefetch_done)
+            obj = await requests.get()
+            if obj is None:
+                return
+            response = await self._loop.run_in_executor(self._worker, self._execute, obj)
+            self._pending.discard(response["seq"])
+            self._send(response)
+            if response["status"] == "quit":
+                self._quit = True
+                return
+
+    def _execute(self, obj: dict) -> dict:
+        seq = obj.get("seq")
+        self._current = seq
+        try:
+            response = self._oi.call(obj)
+        finally:
+            self._current = None
+            self._cancelled.discard(seq)
+        out = {"seq": seq}
+        out.update(response)
+        return out
+
+    def _prefetch(self) -> None:
+        try:
+            self._oi.dbg.prefetch()
+        except ObjectInterfaceException:
+            pass
+
+    def _on_prefetch_done(self, future: asyncio.Future) -> None:
+        # called in the event loop; the request which needs the steps fails with the
+        #   same error, it is reported as soon as it happens
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None and self._send is not None:
+            self._send({
+                "event": "output",
+                "category": "stderr",
+                "output": "Decoding steps failed: %s: %s\n" % (type(error).__name__, error)})
+
+    def _on_progress(self, steps: int) -> None:
+        # called by the worker thread
+        seq = self._current
+        if seq is None:
+            return
+        if seq in self._cancelled:
+            raise ObjectInterfaceException("interrupt")
+        self._loop.call_soon_threadsafe(self._send, {"event": "progress", "seq": seq, "steps": steps})
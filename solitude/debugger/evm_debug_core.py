@@ -3,14 +3,24 @@
 # This source code is licensed under the BSD-3-Clause license found in the
 # COPYING file in the root directory of this source tree
 
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Iterator, Tuple, Callable  # noqa
+from collections import OrderedDict, deque, namedtuple
+from array import array
+import bisect
+import hashlib
+import threading
+import weakref
 
 from web3 import Web3
 
 from solitude._internal.oi_serializable import ISerializable
-from solitude._internal import EnumType
+from solitude._internal import EnumType, RaiseForParam, value_assert
+from solitude.common import ContractObjectList
 from solitude.client.eth_client import ETHClient
-from solitude.debugger.evm_trace import EvmTrace, TraceStep, CallStackEvent  # noqa
+from solitude.debugger.evm_trace import EvmTrace, SourceMapper, TraceStep, CallStackEvent  # noqa
+from solitude.debugger.trace_store import TraceStore, MemoryWrite, StorageWrite  # noqa
+from solitude.debugger.storage_layout import StorageLayout, StorageVariable  # noqa
+from solitude.debugger.trace_file import TraceFile
 
 
 class ValueKind(EnumType):
@@ -165,247 +175,698 @@ class Step:
         return self.step is not None
 
 
+# AST indexes of recently used sources, shared by all EvmDebugCore instances
+#   and their background decoding threads
+_AST_INDEX_CACHE = OrderedDict()  # type: OrderedDict
+_AST_INDEX_CACHE_SIZE = 64
+_AST_INDEX_CACHE_LOCK = threading.Lock()
+
+
+def _create_ast_index(ast: dict) -> Dict[tuple, List[dict]]:
+    out = {}  # type: Dict[tuple, List[dict]]
+    nodes = deque([ast])
+    while nodes:
+        node = nodes.popleft()
+        if isinstance(node, dict):
+            if "src" in node:
+                st, le, fi = node["src"].split(":")
+                src = (int(st), int(le), int(fi))
+                try:
+                    out[src].append(node)
+                except KeyError:
+                    out[src] = [node]
+            for value in node.values():
+                if isinstance(value, dict):
+                    nodes.extend(value.values())
+                elif isinstance(value, list):
+                    nodes.extend(value)
+        elif isinstance(node, list):
+            nodes.extend(node)
+    return out
+
+
+def get_ast_index(contract: dict) -> Dict[tuple, List[dict]]:
+    """Get the AST nodes of a compiled contract's source unit, indexed by source
+    code range.
+
+    Indexes are cached by source content and source list, and shared across all
+    debugger instances.
+
+    :param contract: compiled contract, as in :py:attr:`ContractObjectList.contracts`
+    :return: dictionary of ((start, length, fileno) -> list of AST nodes)
+    """
+    info = contract["_solitude"]
+    h = hashlib.sha1()
+    h.update((info["source"] or "").encode("utf-8"))
+    for unitname in info["sourceList"]:
+        h.update(b"\0")
+        h.update(str(unitname).encode("utf-8"))
+    key = (info["sourcePath"], h.hexdigest())
+    with _AST_INDEX_CACHE_LOCK:
+        try:
+            index = _AST_INDEX_CACHE[key]
+            _AST_INDEX_CACHE.move_to_end(key)
+            return index
+        except KeyError:
+            pass
+    index = _create_ast_index(info["ast"])
+    with _AST_INDEX_CACHE_LOCK:
+        _AST_INDEX_CACHE[key] = index
+        if len(_AST_INDEX_CACHE) > _AST_INDEX_CACHE_SIZE:
+            _AST_INDEX_CACHE.popitem(last=False)
+    return index
+
+
+class _AstMaps:
+    """AST indexes of the source units, by unit name. The index of a unit is
+    created on its first lookup, from the first contract of the unit.
+    """
+    def __init__(self, contracts: ContractObjectList):
+        self._contracts = contracts
+        self._maps = {}  # type: Dict[str, Optional[Dict[tuple, List[dict]]]]
+        # lookups come from the debugger and from the background decoding thread
+        self._lock = threading.Lock()
+
+    def __getitem__(self, unitname: str) -> Dict[tuple, List[dict]]:
+        with self._lock:
+            try:
+                index = self._maps[unitname]
+            except KeyError:
+                index = None
+                for contract_id in self._contracts.find_unit(unitname):
+                    index = get_ast_index(self._contracts.get_contract(*contract_id))
+                    break
+                self._maps[unitname] = index
+        if index is None:
+            raise KeyError(unitname)
+        return index
+
+
+# steps decoded or analyzed between two progress reports
+_PROGRESS_INTERVAL = 1024
+
+
+def _find_ast_nodes(astmaps: _AstMaps, unitname: str, start: int, length: int, fileno: int) -> Dict[str, dict]:
+    out = {}
+    try:
+        for node in astmaps[unitname][(start, length, fileno)]:
+            out[node["nodeType"]] = node
+    except KeyError:
+        pass
+    return out
+
+
+def _decode_steps(steps: Iterator, astmaps: _AstMaps) -> Iterator[Step]:
+    for step, event in steps:
+        s = Step(step, event)
+        s.ast = _find_ast_nodes(astmaps, step.code.unitname, step.start, step.length, step.fileno)
+        yield s
+
+
+# maximum number of steps decoded ahead by the background producer
+_PRODUCER_MAX_AHEAD = 4096
+
+
+class _StepProducer:
+    """Decodes steps in a background thread, ahead of the consumer, into a bounded
+    buffer. The bound starts at the window size; it doubles whenever the consumer
+    has to wait for a step, and shrinks back slowly while the buffer stays full.
+    """
+    def __init__(self, steps: Iterator, astmaps: _AstMaps, limit: int):
+        self._cond = threading.Condition()
+        self._items = deque()  # type: deque
+        self._min_limit = max(1, limit)
+        self._limit = self._min_limit
+        self._done = False
+        self._closed = False
+        self._error = None  # type: Optional[BaseException]
+        thread = threading.Thread(target=self._run, args=(steps, astmaps), daemon=True)
+        thread.start()
+
+    def _run(self, steps: Iterator, astmaps: _AstMaps) -> None:
+        try:
+            for s in _decode_steps(steps, astmaps):
+                with self._cond:
+                    while len(self._items) >= self._limit and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        return
+                    self._items.append(s)
+                    self._cond.notify_all()
+        except BaseException as e:
+            self._error = e
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Step:
+        with self._cond:
+            if not self._items and not self._done:
+                # the consumer is faster than the producer, decode further ahead
+                self._limit = min(2 * self._limit, _PRODUCER_MAX_AHEAD)
+                self._cond.notify_all()
+                while not self._items and not self._done:
+                    self._cond.wait()
+            elif len(self._items) >= self._limit and self._limit > self._min_limit:
+                self._limit -= 1
+            if self._items:
+                self._cond.notify_all()
+                return self._items.popleft()
+            if self._error is not None:
+                error, self._error = self._error, None
+                raise error
+            raise StopIteration
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._items.clear()
+            self._cond.notify_all()
+
+
+# variable extraction handlers, see EvmDebugCore._compile_plan
+_HANDLER_VALUES = 0
+_HANDLER_FUNCTION_RETURN = 1
+_HANDLER_FUNCTION_DEFINITION = 2
+_HANDLER_CALLVALUE = 3
+
+# how to extract a value from the stack of an instruction
+_ValueSpec = namedtuple("_ValueSpec", ["vtype", "name", "kind", "stackpos", "origin"])
+
+
+class _FrameRecord:
+    """Frame information collected while analyzing the trace. A :py:class:`Frame`
+    can be reconstructed from it at any step within the lifetime of the frame.
+    """
+    def __init__(self, parent: int, prev_index: Optional[int], cur_index: Optional[int], start: int):
+        self.parent = parent
+        self.prev_index = prev_index
+        self.cur_index = cur_index
+        self.start = start
+        self.end = None  # type: Optional[int]
+        self.function = None  # type: Optional[Function]
+        self.function_index = None  # type: Optional[int]
+        self._locals_index = []  # type: List[int]
+        self._locals = []  # type: List[Value]
+        self._return_values_index = []  # type: List[int]
+        self._return_values = []  # type: List[Value]
+
+    def add_local(self, index: int, value: Value) -> None:
+        self._locals_index.append(index)
+        self._locals.append(value)
+
+    def add_return_value(self, index: int, value: Value) -> None:
+        self._return_values_index.append(index)
+        self._return_values.append(value)
+
+    def get_locals(self, index: int) -> Dict[str, Value]:
+        out = {}  # type: Dict[str, Value]
+        for value in self._locals[:bisect.bisect_right(self._locals_index, index)]:
+            out[value.name] = value
+        return out
+
+    def get_return_values(self, index: int) -> List[Value]:
+        return self._return_values[:bisect.bisect_right(self._return_values_index, index)]
+
+    def get_function(self, index: int) -> Optional[Function]:
+        if self.function_index is not None and self.function_index <= index:
+            return self.function
+        return None
+
+
 class EvmDebugCore:
     """Provides common debugger-like access to the EVM's debug information
+
+    Steps are decoded from the ETH node on demand and kept in a compact
+    :py:class:`TraceStore`, together with the call stack frames and values found
+    while analyzing them. Any step that has been decoded can be reached again
+    instantly, either forward or backward.
+
+    The trace can be exported to a file (see :py:meth:`export`) and debugged later
+    without the ETH node (see :py:meth:`from_file`).
     """
     INVALID_STEP = Step(None, CallStackEvent(None, None))
 
-    def __init__(self, client: ETHClient, txhash: bytes, windowsize=50):
+    def __init__(self, client: ETHClient, txhash: bytes, windowsize=50, memory=True, storage=True, background=False):
         """Create an EvmDebugCore.
 
         :param client: an `ETHClient` connected to the ETH node
         :param txhash: transaction hash, as bytes
-        :param windowsize: amount of previous and next steps buffered, for a total
-            of previous (windowsize) + current (1) + next (windowsize).
+        :param windowsize: amount of steps around the current one which are kept ready
+            for access, as :py:class:`Step` objects. Steps outside the window are still
+            accessible, but they are reconstructed from the trace.
+        :param memory: whether to request the EVM memory from the ETH node; if False,
+            the memory of all steps is None
+        :param storage: whether to request the EVM storage from the ETH node; if False,
+            the storage of all steps is None
+        :param background: whether to decode steps in a background thread, ahead of
+            the current one. The number of steps decoded ahead starts at the window
+            size, and grows when stepping is faster than decoding. The thread uses
+            the client's RPC connection, which must not be used by the caller while
+            the trace is being decoded.
         """
         self._client = client
         self._dbg = EvmTrace(client.rpc, client.contracts)
         self._txhash = txhash
+        self._init(
+            client.contracts,
+            TraceStore(memory=memory, storage=storage),
+            self._dbg.trace_iter(txhash, memory=memory, storage=storage),
+            windowsize,
+            background)
 
-        self._astmaps = self._create_ast_maps(client.contracts)
-
-        self._windowsize = windowsize
-        self._window_offset = 0
-        self._window = [EvmDebugCore.INVALID_STEP] * (1 + 2 * self._windowsize)
-
-        self._frames = []  # type: List[Frame]
-
-        self._iter = self._dbg.trace_iter(txhash)
-        self._move_window(self._windowsize + 1)
-        first_step = self._get_window_rel(0).step
-        self._push_frame(Frame(prev=first_step, cur=first_step))
-
-    def _create_ast_maps(self, compiled):
-        out = {}
-        for cname, contract in compiled.contracts.items():
-            castmap = {}
-            source_path = contract["_solitude"]["sourcePath"]
-            if source_path in out:
-                continue
-            cast = contract["_solitude"]["ast"]
-            nodes = [cast]
-            while nodes:
-                node = nodes[0]
-                del nodes[0]
-                if isinstance(node, dict):
-                    if "src" in node:
-                        src = node["src"]
-                        try:
-                            castmap[src].append(node)
-                        except KeyError:
-                            castmap[src] = [node]
-                    for key, value in node.items():
-                        if isinstance(value, dict):
-                            nodes.extend(list(value.values()))
-                        elif isinstance(value, list):
-                            nodes.extend(value)
-                elif isinstance(node, list):
-                    nodes.extend(node)
-            out[source_path] = castmap
-        return out
-
-    def _get_window_rel(self, i):
-        if self._windowsize + i < len(self._window):
-            return self._window[self._windowsize + i]
-        return EvmDebugCore.INVALID_STEP
-
-    def _get_window_abs(self, i):
-        return self._get_window_rel(i - self._window_offset)
+    @staticmethod
+    def from_file(path: str, windowsize=50) -> "EvmDebugCore":
+        """Create an EvmDebugCore from a trace file, without connecting to the ETH node
 
-    def _push_frame(self, f):
-        self._frames.append(f)
+        :param path: path of a trace file (see :py:meth:`export`)
+        :param windowsize: amount of steps around the current one which are kept ready
+            for access (see :py:class:`EvmDebugCore`)
+        :return: an EvmDebugCore, with all the steps already available
+        """
+        trace = TraceFile(path)
+        dbg = EvmDebugCore.__new__(EvmDebugCore)
+        dbg._client = None
+        dbg._dbg = None
+        dbg._txhash = trace.txhash
+        dbg._init(trace.contracts, trace.store, iter(()), windowsize)
+        return dbg
+
+    def _init(
+            self,
+            contracts: ContractObjectList,
+            store: TraceStore,
+            steps: Iterator,
+            windowsize: int,
+            background: bool=False):
+        self._contracts = contracts
+        self._srcmapper = SourceMapper(contracts) if self._dbg is None else self._dbg.srcmapper
+        self._astmaps = _AstMaps(contracts)
 
-    def _pop_frame(self):
-        del self._frames[-1]
+        self._windowsize = windowsize
+        self._steps = OrderedDict()  # type: OrderedDict
+        self._steps_max = 4 * self._windowsize + 1
+
+        self._store = store
+        if background:
+            producer = _StepProducer(steps, self._astmaps, windowsize)
+            # stop the producer thread when the debugger is discarded
+            weakref.finalize(self, producer.close)
+            self._iter = producer  # type: Iterator[Step]
+        else:
+            self._iter = _decode_steps(steps, self._astmaps)
+        self._iter_done = False
+
+        # analysis results, for each step: the top frame and the call stack depth
+        self._records = []  # type: List[_FrameRecord]
+        self._live_records = []  # type: List[int]
+        self._step_record = array("i")
+        self._step_depth = array("I")
+        self._step_values = {}  # type: Dict[int, Dict[str, Value]]
+        self._plans = {}  # type: Dict[tuple, tuple]
+        self._layouts = None  # type: Optional[Dict[Tuple[str, str], StorageLayout]]
+        self._progress = None  # type: Optional[Callable[[int], None]]
+
+        self._index = 0
+        self._frames_cache = None  # type: Optional[tuple]
+        self._analyze_until(1)
+
+    def _decode_next(self) -> bool:
+        if self._iter_done:
+            return False
+        if self._progress is not None and len(self._store) % _PROGRESS_INTERVAL == 0:
+            self._progress(len(self._store))
+        try:
+            s = next(self._iter)
+        except StopIteration:
+            self._iter_done = True
+            return False
+        self._store.append(s.step, s.event)
+        self._cache_step(s.step.index, s)
+        return True
+
+    def _cache_step(self, index: int, s: Step) -> None:
+        self._steps[index] = s
+        if len(self._steps) > self._steps_max:
+            self._steps.popitem(last=False)
+
+    def _get_step_abs(self, index: int) -> Step:
+        if index < 0 or index >= len(self._store):
+            return EvmDebugCore.INVALID_STEP
+        try:
+            s = self._steps[index]
+            self._steps.move_to_end(index)
+            return s
+        except KeyError:
+            pass
+        s = Step(self._store[index], self._store.get_event(index))
+        s.ast = self._get_ast_nodes(s.step)
+        s.values = self._step_values.get(index, s.values)
+        self._cache_step(index, s)
+        return s
+
+    def _analyze_until(self, stop: int) -> None:
+        # the analysis of a step may look at the following one
+        while len(self._step_record) < stop:
+            index = len(self._step_record)
+            if self._progress is not None and index % _PROGRESS_INTERVAL == 0:
+                self._progress(index)
+            while len(self._store) <= index + 1 and self._decode_next():
+                pass
+            if index >= len(self._store):
+                if not self._records:
+                    # empty trace
+                    self._records.append(_FrameRecord(-1, None, None, 0))
+                return
+            self._analyze(index)
+
+    def _analyze(self, index: int) -> None:
+        s = self._get_step_abs(index)
+        if index == 0:
+            self._push_record(_FrameRecord(-1, 0, 0, 0))
+        elif s.event.event == "push":
+            parent = self._live_records[-1] if self._live_records else -1
+            self._push_record(_FrameRecord(parent, index - 1, index, index))
+        elif s.event.event == "pop":
+            for _ in range(min(s.event.data or 1, len(self._live_records))):
+                self._records[self._live_records.pop()].end = index
 
-    def _get_frame(self, i):
-        return self._frames[-1 - i]
+        self._step_record.append(self._live_records[-1] if self._live_records else -1)
+        self._step_depth.append(len(self._live_records))
+        if index == 0 or not self._live_records:
+            return
+        f = self._records[self._live_records[-1]]
 
-    def _move_window(self, n):
-        for _ in range(n):
-            del self._window[0]
+        # analyze locals
+        plan = self._get_plan(s)
+        if not plan:
+            return
+        values = self._run_plan(plan, s, f, index)
+        for var in values:
+            if var.kind == ValueKind.TEMPORARY:
+                self._step_values.setdefault(index, {})[var.name] = var
+            elif var.kind == ValueKind.VARIABLE:
+                f.add_local(index, var)
+            elif var.kind == ValueKind.RETURN:
+                f.add_return_value(index, var)
+        if index in self._step_values:
+            s.values = self._step_values[index]
+
+    def _push_record(self, record: _FrameRecord) -> None:
+        self._live_records.append(len(self._records))
+        self._records.append(record)
+
+    def _get_record_index(self) -> int:
+        # after the end of the trace, the frames are the ones of the last step
+        index = min(self._index, len(self._store) - 1)
+        if index < 0:
+            return 0
+        self._analyze_until(index + 1)
+        return self._step_record[index]
+
+    def _make_frame(self, record: _FrameRecord, index: int) -> Frame:
+        prev = self._get_step_abs(record.prev_index).step if record.prev_index is not None else None
+        cur = self._get_step_abs(record.cur_index).step if record.cur_index is not None else None
+        f = Frame(prev=prev, cur=cur)
+        f.locals = record.get_locals(index)
+        f.return_values = record.get_return_values(index)
+        f.function = record.get_function(index)
+        return f
+
+    def _get_frame(self, i) -> Frame:
+        return self.get_frames()[i]
+
+    def _get_plan(self, s: Step) -> tuple:
+        step = s.step
+        key = (step.contractname, step.code.unitname, step.start, step.length, step.fileno, step.op)
+        try:
+            return self._plans[key]
+        except KeyError:
+            plan = self._compile_plan(step, s.ast)
+            self._plans[key] = plan
+            return plan
+
+    def _compile_plan(self, step: TraceStep, ast: Dict[str, dict]) -> tuple:
+        # Instructions mapped to the same source range, with the same opcode, always
+        #   extract the same variables, from the same stack positions. The AST nodes
+        #   are examined once, and turned into a list of handlers which are tried in
+        #   order when the instruction is executed, until one produces values:
+        #   (handler type, function name, minimum stack size, value specifications)
+        handlers = []  # type: List[tuple]
+        op = step.op
+        if "ExpressionStatement" in ast and op == "SWAP1":
+            try:
+                expression = ast["ExpressionStatement"]["expression"]
+                if expression["nodeType"] == "Assignment":
+                    handlers.append((_HANDLER_VALUES, None, 0, [
+                        self._compile_value(step, expression["leftHandSide"], 0, "ExpressionStatement")]))
+            except KeyError:
+                pass
+        if "VariableDeclarationStatement" in ast and op in ("SWAP1", "SWAP2", "SWAP3"):
+            try:
+                declaration = ast["VariableDeclarationStatement"]["declarations"][0]
+                if declaration["nodeType"] == "VariableDeclaration":
+                    handlers.append((_HANDLER_VALUES, None, 0, [
+                        self._compile_value(step, declaration, 0, "VariableDeclarationStatement")]))
+            except KeyError:
+                pass
+        if "FunctionDefinition" in ast and op == "JUMP":
+            try:
+                node = ast["FunctionDefinition"]
+                params = node["returnParameters"]["parameters"]
+                handlers.append((_HANDLER_FUNCTION_RETURN, node["name"], len(params) + 2, [
+                    self._compile_value(
+                        step, param, len(params) - i, "FunctionReturn")._replace(kind=ValueKind.RETURN)
+                    for i, param in enumerate(params)]))
+            except KeyError:
+                pass
+        if "FunctionDefinition" in ast and op == "JUMPDEST":
             try:
-                step, event = next(self._iter)
-                s = Step(step, event)
-                s.ast = self._get_ast_nodes(s.step)
-                self._window.append(s)
-            except StopIteration:
-                self._window.append(EvmDebugCore.INVALID_STEP)
-            self._window_offset += 1
-
-    def _extract_variable(self, step: TraceStep, astnode: dict, stackpos: int, origin=None) -> List[Value]:
+                node = ast["FunctionDefinition"]
+                params = node["parameters"]["parameters"]
+                handlers.append((_HANDLER_FUNCTION_DEFINITION, node["name"], len(params) + 1, [
+                    self._compile_value(step, param, len(params) - i - 1, "FunctionDefinition")
+                    for i, param in enumerate(params)]))
+            except KeyError:
+                pass
+        if op == "CALLVALUE":
+            handlers.append((_HANDLER_CALLVALUE, None, 0, []))
+        return tuple(handlers)
+
+    def _compile_value(self, step: TraceStep, astnode: dict, stackpos: int, origin: str) -> _ValueSpec:
         vartype = astnode.get("typeDescriptions", {}).get("typeString", "T?")
         varname = astnode.get("name", None)
         varkind = ValueKind.VARIABLE
         if varname is None:
             st, le, fi = [int(x) for x in astnode["src"].split(":")]
-            source = self._dbg.srcmapper.get_source(step.contractname, st, le, fi)
+            source = self._srcmapper.get_source(step.contractname, st, le, fi)
             varname = source.source[st:st + le]
             varkind = ValueKind.TEMPORARY
-        try:
-            varvalue = int(step.stack[-1 - stackpos], 16)
-        except IndexError:
-            return []
-        return [Value(vtype=vartype, name=varname, value=varvalue, kind=varkind, origin=origin)]
+        return _ValueSpec(vtype=vartype, name=varname, kind=varkind, stackpos=stackpos, origin=origin)
+
+    def _run_plan(self, plan: tuple, s: Step, f: _FrameRecord, index: int) -> List[Value]:
+        stack = s.step.stack
+        for handler, name, min_stack, specs in plan:
+            if handler == _HANDLER_CALLVALUE:
+                snext = self._get_step_abs(index + 1)
+                if snext.valid:
+                    varvalue = int(snext.step.stack[-1], 16)
+                    return [Value(vtype="uint256", name="msg.value", value=varvalue, kind=ValueKind.VARIABLE)]
+                continue
+            if len(stack) < min_stack:
+                continue
+            values = [
+                Value(
+                    vtype=spec.vtype, name=spec.name, value=int(stack[-1 - spec.stackpos], 16),
+                    kind=spec.kind, origin=spec.origin)
+                for spec in specs if spec.stackpos < len(stack)]
+            if handler == _HANDLER_FUNCTION_RETURN:
+                if f.function is None or f.function.name != name:
+                    continue
+            elif handler == _HANDLER_FUNCTION_DEFINITION:
+                if f.function is not None:
+                    continue
+                f.function = Function(name=name, parameters=values)
+                f.function_index = index
+            if values:
+                return values
+        return []
 
     def _get_ast_nodes(self, step: TraceStep):
-        ast_src = "%d:%d:%d" % (step.start, step.length, step.fileno)
-        out = {}
-        try:
-            for node in self._astmaps[step.code.unitname][ast_src]:
-                out[node["nodeType"]] = node
-        except KeyError:
-            pass
-        return out
+        return self.get_ast_nodes(step.code.unitname, step.start, step.length, step.fileno)
 
-    def _search_ExpressionStatement(self, s: Step, stmt: dict) -> List[Value]:
-        values = []
-        try:
-            if stmt["expression"]["nodeType"] == "Assignment":
-                node = stmt["expression"]["leftHandSide"]
-                values.extend(
-                    self._extract_variable(s.step, node, 0, origin="ExpressionStatement"))
-        except KeyError:
-            pass
-        return values
+    def get_ast_nodes(self, unitname: str, start: int, length: int, fileno: int) -> Dict[str, dict]:
+        """Get the AST nodes mapped to a source code range
 
-    def _search_VariableDeclarationStatement(self, s: Step, stmt: dict) -> List[Value]:
-        values = []
-        try:
-            if stmt["declarations"][0]["nodeType"] == "VariableDeclaration":
-                node = stmt["declarations"][0]
-                values.extend(
-                    self._extract_variable(s.step, node, 0, origin="VariableDeclarationStatement"))
-        except KeyError:
+        :param unitname: name of the source unit
+        :param start: start of the source code range
+        :param length: length of the source code range
+        :param fileno: source unit index
+        :return: dictionary of (node type -> AST node)
+        """
+        return _find_ast_nodes(self._astmaps, unitname, start, length, fileno)
+
+    def step(self):
+        """Step one instruction forward
+        """
+        self.seek(self._index + 1)
+
+    def step_back(self) -> bool:
+        """Step one instruction backward
+
+        :return: True if the current step changed, False if the current step is
+            already the first one. After the end of the trace, it moves to the last step.
+        """
+        if self._index <= 0:
+            return False
+        self.seek(min(self._index, len(self._store)) - 1)
+        return True
+
+    def seek(self, index: int) -> None:
+        """Move to any step. Steps which were already visited are reached
+        instantly; moving forward to new steps decodes them from the trace.
+
+        :param index: absolute index of the step. If it is past the end of the trace,
+            the current step is invalid (see :py:attr:`Step.valid`).
+        """
+        with RaiseForParam("index"):
+            value_assert(index >= 0, "Step index must be positive")
+        self._analyze_until(index + 1)
+        self._index = index
+
+    def set_progress(self, callback: Optional[Callable[[int], None]]) -> None:
+        """Set a function to be notified while long operations decode and analyze steps
+
+        The callback receives the number of steps processed so far. It may raise
+        an exception to interrupt the operation: the debugger is left at a
+        consistent state, and the operation can be resumed later.
+
+        :param callback: function called periodically, or None to remove it
+        """
+        self._progress = callback
+
+    def prefetch(self) -> None:
+        """Decode and analyze the steps following the current one, up to the window size,
+        so that moving forward to them is instantaneous
+        """
+        self._analyze_until(self._index + self._windowsize + 1)
+
+    def get_trace(self) -> TraceStore:
+        """Decode all the steps of the transaction which were not decoded yet
+
+        :return: the :py:class:`TraceStore` containing all steps
+        """
+        while self._decode_next():
             pass
-        return values
+        return self._store
 
-    def _search_FunctionDefinition(self, s: Step, stmt: dict) -> Optional[Function]:
-        values = []
-        try:
-            name = stmt["name"]
-            params = stmt["parameters"]["parameters"]
-            num_params = len(params)
-            if len(s.step.stack) < num_params + 1:
-                return None
-            for param_index, param_node in enumerate(params):
-                values.extend(
-                    self._extract_variable(
-                        s.step, param_node, num_params - param_index - 1,
-                        origin="FunctionDefinition"))
-        except KeyError:
-            return None
-        return Function(name=name, parameters=values)
+    def export(self, path: str) -> None:
+        """Decode all the steps of the transaction, and write them to a trace file
+        which can be debugged offline (see :py:meth:`from_file`)
 
-    def _search_FunctionReturn(self, s: Step, stmt: dict) -> Optional[Function]:
-        values = []
-        try:
-            name = stmt["name"]
-            params = stmt["returnParameters"]["parameters"]
-            num_params = len(params)
-            if len(s.step.stack) < num_params + 2:
-                return None
-            for param_index, param_node in enumerate(params):
-                values.extend(
-                    self._extract_variable(
-                        s.step, param_node, num_params - param_index,
-                        origin="FunctionReturn"))
-                for var in values:
-                    var.kind = ValueKind.RETURN
-        except KeyError:
+        :param path: output file path
+        """
+        TraceFile.write(path, self.get_trace(), self._contracts, self._txhash)
+
+    def get_memory_writes(self) -> Optional[List[MemoryWrite]]:
+        """Get the EVM memory ranges written by the current step
+
+        :return: list of :py:class:`MemoryWrite`, or None if the memory is not
+            available (see :py:meth:`TraceStore.get_memory_writes`)
+        """
+        index = self._index
+        if index >= len(self._store) and not self._decode_until(index):
+            return []
+        # the writes are known once the step which follows in the same frame is decoded
+        while not self._store.is_resolved(index):
+            if not self._decode_next():
+                break
+        return self._store.get_memory_writes(index)
+
+    def get_storage_writes(self) -> Optional[List[Tuple[StorageWrite, List[Tuple[StorageVariable, object]]]]]:
+        """Get the EVM storage slots written by the current step, decoded according
+        to the storage layout of the contract
+
+        :return: list of tuples of (slot write, decoded variables), or None if
+            the stack is not available (see :py:meth:`TraceStore.get_storage_writes`
+            and :py:meth:`StorageLayout.decode`)
+        """
+        index = self._index
+        if index >= len(self._store) and not self._decode_until(index):
+            return []
+        writes = self._store.get_storage_writes(index)
+        if writes is None:
             return None
-        return Function(name=name, parameters=values)
+        step = self._store[index]
+        layout = self.get_storage_layout(step.unitname, step.contractname)
+        return [(w, layout.decode(w.slot, w.value) if layout is not None else []) for w in writes]
 
-    def step(self):
-        """Step one instruction forward
+    def get_storage_layout(self, unitname: str, contractname: str) -> Optional[StorageLayout]:
+        """Get the storage layout of a contract
+
+        :param unitname: source unit containing the contract
+        :param contractname: contract name
+        :return: a :py:class:`StorageLayout`, or None if the contract is unknown
         """
-        self._move_window(1)
-        s = self._get_window_rel(0)
-        if not s.valid:
-            return
-        if s.event.event == "push":
-            self._push_frame(
-                Frame(prev=s.event.data.prev, cur=s.event.data.step))
-        elif s.event.event == "pop":
-            self._pop_frame()
+        if self._layouts is None:
+            self._layouts = StorageLayout.create_all(self._contracts)
+        return self._layouts.get((unitname, contractname))
 
-        try:
-            f = self._get_frame(0)
-        except IndexError:
-            # TODO inline assembly delegatecall not detected and no frame being
-            #   pushed on the stack. When using proxy contracts, causes the first
-            #   frame to be missing, and the last return to be unmatched
-            return
+    def _decode_until(self, index: int) -> bool:
+        while len(self._store) <= index:
+            if not self._decode_next():
+                return False
+        return True
 
-        # analyze locals
-        ast = s.ast
-
-        # print(list(ast))
-        # print(s.step.op)
-        # print(s.step.stack)
-        # print("pc=%d ast=%s op=%s" % (s.step.pc, repr(list(ast)), repr(s.step.op)))
-
-        values = []
-        if not values and "ExpressionStatement" in ast and s.step.op == "SWAP1":
-            values.extend(
-                self._search_ExpressionStatement(s, ast["ExpressionStatement"]))
-        if not values and "VariableDeclarationStatement" in ast and s.step.op in ("SWAP1", "SWAP2", "SWAP3"):
-            values.extend(
-                self._search_VariableDeclarationStatement(s, ast["VariableDeclarationStatement"]))
-        if not values and "FunctionDefinition" in ast and s.step.op == "JUMP":
-            function = self._search_FunctionReturn(s, ast["FunctionDefinition"])
-            if function is not None and f.function is not None and f.function.name == function.name:
-                values.extend(function.parameters)
-        if not values and "FunctionDefinition" in ast and s.step.op == "JUMPDEST":
-            function = self._search_FunctionDefinition(s, ast["FunctionDefinition"])
-            if function is not None and f.function is None:
-                values.extend(function.parameters)
-                f.function = function
-        if not values and s.step.op == "CALLVALUE":
-            snext = self._get_window_rel(1)
-            if snext.valid:
-                varvalue = int(snext.step.stack[-1], 16)
-                values.extend([
-                    Value(vtype="uint256", name="msg.value", value=varvalue, kind=ValueKind.VARIABLE)])
-        for var in values:
-            if var.kind == ValueKind.TEMPORARY:
-                s.values[var.name] = var
-            elif var.kind == ValueKind.VARIABLE:
-                f.locals[var.name] = var
-            elif var.kind == ValueKind.RETURN:
-                f.return_values.append(var)
+    @property
+    def index(self) -> int:
+        """Absolute index of the current step"""
+        return self._index
 
     def get_frames(self) -> List[Frame]:
         """Get call stack frames
         :return: a list of :py:class:`Frame`
         """
-        return self._frames[::-1]
+        record_index = self._get_record_index()
+        step_index = min(self._index, len(self._store) - 1)
+        key = (record_index, step_index)
+        if self._frames_cache is None or self._frames_cache[0] != key:
+            frames = []
+            while record_index >= 0:
+                record = self._records[record_index]
+                frames.append(self._make_frame(record, step_index))
+                record_index = record.parent
+            self._frames_cache = (key, frames)
+        return self._frames_cache[1][:]
+
+    def get_frame_end(self) -> Optional[int]:
+        """Get the end of the current call stack frame, if the steps up to it were
+        already analyzed
+
+        :return: index of the first step after the frame, the number of steps if the
+            frame lasts until the end of the trace, or None if it is not known yet
+        """
+        record_index = self._get_record_index()
+        if record_index < 0:
+            return None
+        end = self._records[record_index].end
+        if end is None and self._iter_done and len(self._step_record) >= len(self._store):
+            return len(self._store)
+        return end
 
     def get_callstack_depth(self) -> int:
         """Get the call stack depth
         :return: number of frames in the call stack
         """
-        return len(self._frames)
+        index = min(self._index, len(self._store) - 1)
+        if index < 0:
+            return 1
+        self._analyze_until(index + 1)
+        return self._step_depth[index]
 
     def get_values(self) -> Dict[str, Value]:
         """Get named values in the current step, from function parameters and
@@ -413,7 +874,7 @@ class EvmDebugCore:
 
         :return: list of :py:class:`Value`
         """
-        s = self._get_window_rel(0)
+        s = self.get_step(0)
         f = self._get_frame(0)
         out = {}  # type: Dict[str, Value]
         out.update(f.locals)
@@ -423,9 +884,10 @@ class EvmDebugCore:
     def get_step(self, offset=0) -> Step:
         """Get step, relative to current step.
 
-        :param offset: step offset, relative to the current one. Can be in range
-            (-windowsize, windowsize), according to the windowsize value provided in the
-            constructor.
-        :return: a :py:class:`Step`
+        :param offset: step offset, relative to the current one
+        :return: a :py:class:`Step`, which is invalid if the offset falls outside
+            of the trace
         """
-        return self._get_window_rel(offset)
+        index = self._index + offset
+        self._analyze_until(index + 1)
+        return self._get_step_abs(index)
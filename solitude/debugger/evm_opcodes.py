@@ -0,0 +1,67 @@
+# Copyright (c) 2019, Solitude Developers
+#
+# This source code is licensed under the BSD-3-Clause license found in the
+# COPYING file in the root directory of this source tree
+
+from typing import List, Dict  # noqa
+
+
+INVALID = 0xfe
+
+_OPCODE_TABLE = [
+    (0x00, "STOP"), (0x01, "ADD"), (0x02, "MUL"), (0x03, "SUB"), (0x04, "DIV"),
+    (0x05, "SDIV"), (0x06, "MOD"), (0x07, "SMOD"), (0x08, "ADDMOD"), (0x09, "MULMOD"),
+    (0x0a, "EXP"), (0x0b, "SIGNEXTEND"),
+
+    (0x10, "LT"), (0x11, "GT"), (0x12, "SLT"), (0x13, "SGT"), (0x14, "EQ"),
+    (0x15, "ISZERO"), (0x16, "AND"), (0x17, "OR"), (0x18, "XOR"), (0x19, "NOT"),
+    (0x1a, "BYTE"), (0x1b, "SHL"), (0x1c, "SHR"), (0x1d, "SAR"),
+
+    (0x20, "SHA3"),
+
+    (0x30, "ADDRESS"), (0x31, "BALANCE"), (0x32, "ORIGIN"), (0x33, "CALLER"),
+    (0x34, "CALLVALUE"), (0x35, "CALLDATALOAD"), (0x36, "CALLDATASIZE"),
+    (0x37, "CALLDATACOPY"), (0x38, "CODESIZE"), (0x39, "CODECOPY"), (0x3a, "GASPRICE"),
+    (0x3b, "EXTCODESIZE"), (0x3c, "EXTCODECOPY"), (0x3d, "RETURNDATASIZE"),
+    (0x3e, "RETURNDATACOPY"), (0x3f, "EXTCODEHASH"),
+
+    (0x40, "BLOCKHASH"), (0x41, "COINBASE"), (0x42, "TIMESTAMP"), (0x43, "NUMBER"),
+    (0x44, "DIFFICULTY"), (0x45, "GASLIMIT"), (0x46, "CHAINID"), (0x47, "SELFBALANCE"),
+
+    (0x50, "POP"), (0x51, "MLOAD"), (0x52, "MSTORE"), (0x53, "MSTORE8"), (0x54, "SLOAD"),
+    (0x55, "SSTORE"), (0x56, "JUMP"), (0x57, "JUMPI"), (0x58, "PC"), (0x59, "MSIZE"),
+    (0x5a, "GAS"), (0x5b, "JUMPDEST"),
+] + [
+    (0x60 + i, "PUSH%d" % (i + 1)) for i in range(32)
+] + [
+    (0x80 + i, "DUP%d" % (i + 1)) for i in range(16)
+] + [
+    (0x90 + i, "SWAP%d" % (i + 1)) for i in range(16)
+] + [
+    (0xa0 + i, "LOG%d" % i) for i in range(5)
+] + [
+    (0xf0, "CREATE"), (0xf1, "CALL"), (0xf2, "CALLCODE"), (0xf3, "RETURN"),
+    (0xf4, "DELEGATECALL"), (0xf5, "CREATE2"), (0xfa, "STATICCALL"), (0xfd, "REVERT"),
+    (INVALID, "INVALID"), (0xff, "SELFDESTRUCT")
+]
+
+# alternative names used by some nodes
+_OPCODE_ALIASES = [
+    (0x20, "KECCAK256"),
+    (0xff, "SUICIDE")
+]
+
+OPCODE_NAMES = ["INVALID"] * 256  # type: List[str]
+for _code, _name in _OPCODE_TABLE:
+    OPCODE_NAMES[_code] = _name
+
+OPCODES = {name: code for code, name in _OPCODE_TABLE + _OPCODE_ALIASES}  # type: Dict[str, int]
+
+
+def opcode_from_name(name: str) -> int:
+    """Get the opcode of an instruction from its name
+
+    :param name: instruction name, as reported by the ETH node (e.g. "PUSH1")
+    :return: opcode value, or INVALID (0xfe) if the name is not known
+    """
+    return OPCODES.get(name.upper(), INVALID)
@@ -3,17 +3,24 @@
 # This source code is licensed under the BSD-3-Clause license found in the
 # COPYING file in the root directory of this source tree
 
-from typing import List, Dict, Tuple, Optional, Iterator, Sequence
-from collections import namedtuple
+from typing import List, Dict, Tuple, Set, Optional, Iterator, Sequence, TYPE_CHECKING
+from collections import namedtuple, OrderedDict
 import hashlib
+import re
 import binascii
 import bisect
+import threading
 
 from solitude.common import RPCClient
 from solitude.common import ContractObjectList, hex_repr
+from solitude.debugger.evm_opcodes import OPCODES, opcode_from_name
 
+if TYPE_CHECKING:
+    # trace_store imports this module
+    from solitude.debugger.trace_store import TraceStore
 
-TraceStackItem = namedtuple("TraceStackItem", ["unitname", "contractname", "decoder"])
+
+TraceStackItem = namedtuple("TraceStackItem", ["unitname", "contractname", "decoder", "runtime"])
 
 SourceMapping = namedtuple("SourceMapping", [
     "unitname", "source", "lines", "line_index", "line_start", "line_pos"])
@@ -30,7 +37,9 @@ TraceStep = namedtuple("TraceStep", [
     "index", "depth", "contractname",
     "pc", "op", "stack", "memory", "storage", "gas", "error",
     "start", "length", "fileno", "jumptype",
-    "code"])
+    "code", "gas_cost", "unitname"])
+# for steps created without it, the unit of the contract is unknown
+TraceStep.__new__.__defaults__ = (None,)
 TraceStep.__doc__ = "Debugger step (instruction) information"
 TraceStep.index.__doc__ = "incrementing index of the step"
 TraceStep.depth.__doc__ = "call stack depth"
@@ -40,7 +49,7 @@ TraceStep.op.__doc__ = "opcode string"
 TraceStep.stack.__doc__ = "EVM stack as list of hex strings"
 TraceStep.memory.__doc__ = "EVM memory as list of hex strings"
 TraceStep.storage.__doc__ = "EVM storage as dictionary of hex strings"
-TraceStep.gas.__doc__ = "Gas cost of the instruction"
+TraceStep.gas.__doc__ = "Gas available before executing the instruction"
 TraceStep.error.__doc__ = "Error message"
 TraceStep.start.__doc__ = """\
 index of the character in the source file where the source code mapped to \
@@ -51,6 +60,12 @@ TraceStep.jumptype.__doc__ = """\
 type of jump, `'i'` for 'jump into call', `'o'`, for 'jump out of call', or empty (`''`)"""
 TraceStep.code.__doc__ = """\
 a SourceMapping object containing the source code and line information"""
+TraceStep.gas_cost.__doc__ = """\
+Gas cost of the instruction, as reported by the ETH node. For instructions which \
+make a call, it may include the gas made available to the callee"""
+TraceStep.unitname.__doc__ = """\
+source unit of the executed contract, or None if the contract is unknown. The \
+source code mapped to the instruction can be in another unit (see `code`)"""
 
 CallStackElement = namedtuple("CallStackElement", ["prev", "step"])
 CallStackElement.__doc__ = "Basic stack frame information"
@@ -60,64 +75,179 @@ CallStackElement.step.__doc__ = "the TraceStep after entering a call"
 CallStackEvent = namedtuple("CallStackEvent", ["event", "data"])
 CallStackEvent.__doc__ = "Call stack event information"
 CallStackEvent.event.__doc__ = "Type of event. Can be `'push'`, `'pop'` or `None`"
-CallStackEvent.data.__doc__ = "Event data. If the event is of type `'push'`, a :py:class:`CallStackElement`"
+CallStackEvent.data.__doc__ = """\
+Event data. If the event is of type `'push'`, a :py:class:`CallStackElement`; if it \
+is of type `'pop'`, the number of frames exited"""
 
 
 class EvmTrace:
     """Access debug information from the ETH server
     """
-    def __init__(self, rpc: RPCClient, contracts: ContractObjectList):
+    def __init__(
+            self,
+            rpc: RPCClient,
+            contracts: ContractObjectList,
+            address_to_contract: Optional["AddressToContract"]=None,
+            decoders: Optional[Dict[Tuple[str, str, bool], "FrameDecoder"]]=None,
+            srcmapper: Optional["SourceMapper"]=None):
         """Create an EvmTrace instance
 
         :param rpc: RPC client connected to the ETH server
         :param contracts: a collection of contracts (see ContractObjectList)
+        :param address_to_contract: contract addresses, from another EvmTrace
+            connected to the same server (see :py:attr:`address_to_contract`). If None,
+            they are collected from the blocks of the server.
+        :param decoders: contract decoders, from another EvmTrace of the same
+            contracts (see :py:attr:`decoders`)
+        :param srcmapper: source tables, from another EvmTrace of the same contracts
         """
         self._rpc = rpc
         self._compiled = contracts
-        self._address_to_contract = AddressToContract()
-        self._address_to_contract.initialize(rpc, self._compiled)
-        self.srcmapper = SourceMapper(self._compiled)
+        if address_to_contract is None:
+            address_to_contract = AddressToContract()
+            address_to_contract.initialize(rpc, self._compiled)
+        self._address_to_contract = address_to_contract
+        self._decoders = dict(decoders or {})  # type: Dict[Tuple[str, str, bool], FrameDecoder]
+        # (unitname, contractname) of the contracts executed
+        self._traced = set()  # type: Set[Tuple[str, str]]
+        self.srcmapper = SourceMapper(self._compiled) if srcmapper is None else srcmapper
+
+    @property
+    def address_to_contract(self) -> "AddressToContract":
+        """Map of contract addresses to contract identifiers"""
+        return self._address_to_contract
+
+    @property
+    def traced_contracts(self) -> Set[Tuple[str, str]]:
+        """Identifiers (unitname, contractname) of the contracts executed in the
+        transactions traced so far"""
+        return set(self._traced)
 
-    def trace_iter(self, txhash: bytes) -> Iterator[Tuple[TraceStep, CallStackEvent]]:
+    @property
+    def decoders(self) -> Dict[Tuple[str, str, bool], "FrameDecoder"]:
+        """Decoders of the contracts, created so far, as dictionary of
+        ((unitname, contractname, runtime) -> FrameDecoder)"""
+        return dict(self._decoders)
+
+    def preload(self) -> None:
+        """Create the decoders and the source tables of the contracts deployed at the
+        known addresses, e.g. before sharing them with other instances
+        """
+        for unitname, contractname in sorted(self._address_to_contract.contract_ids):
+            for runtime in (True, False):
+                try:
+                    self._create_decoder(unitname, contractname, runtime)
+                except (KeyError, TypeError, binascii.Error):
+                    # unknown contract, or missing bytecode
+                    pass
+            self.srcmapper.preload(unitname)
+
+    def _get_decoder(self, unitname: str, contractname: str, runtime: bool=True) -> "FrameDecoder":
+        decoder = self._create_decoder(unitname, contractname, runtime)
+        self._traced.add((unitname, contractname))
+        return decoder
+
+    def _create_decoder(self, unitname: str, contractname: str, runtime: bool) -> "FrameDecoder":
+        # decoders only depend on the contract, they are created on first use
+        try:
+            return self._decoders[(unitname, contractname, runtime)]
+        except KeyError:
+            contract = self._compiled.get_contract(unitname, contractname)
+            decoder = FrameDecoder(contract=contract, runtime=runtime)
+            self._decoders[(unitname, contractname, runtime)] = decoder
+            return decoder
+
+    def _get_callee(
+            self,
+            logs: List[dict],
+            i: int,
+            transaction: dict,
+            txhash_hex: str,
+            stack: bool,
+            memory: bool) -> Tuple[Tuple[str, str], bool]:
+        # find the contract called at step i, and whether its runtime code is
+        #   executed, or its constructor. Raises KeyError if not found.
+        if i == 0:
+            address = transaction["to"]
+            if address is not None:
+                return self._address_to_contract.get_contract_id(address), True
+            # contract creation, the constructor code is executed
+            receipt = self._rpc.eth_getTransactionReceipt(txhash_hex)
+            return self._address_to_contract.get_contract_id(receipt["contractAddress"]), False
+        prev = logs[i - 1]
+        if _opcode(prev["op"]) in _CREATE_OPCODES:
+            # contract created by a contract, its address is not known yet, but its
+            #   creation code is in memory
+            if not (stack and memory):
+                raise KeyError(i)
+            offset, size = int(prev["stack"][-2], 16), int(prev["stack"][-3], 16)
+            code = binascii.unhexlify("".join(prev["memory"]))[offset:offset + size]
+            return self._address_to_contract.get_contract_id_by_code(code), False
+        if not stack:
+            raise KeyError(i)
+        # contract address is in element -2 of stack, for all call instructions
+        return self._address_to_contract.get_contract_id("0x" + prev["stack"][-2][24:]), True
+
+    def trace_iter(
+            self,
+            txhash: bytes,
+            stack: bool=True,
+            memory: bool=True,
+            storage: bool=True) -> Iterator[Tuple[TraceStep, CallStackEvent]]:
         """Iterate contract execution steps (instructions)
 
+        The stack, memory and storage can be excluded from the trace, in which
+        case the ETH node does not send them and the corresponding fields of the
+        steps are None. Excluding unneeded data greatly reduces the size of the
+        response and the time required to trace the transaction.
+
         :param txhash: transaction hash to inspect, as byte array
+        :param stack: whether to include the EVM stack in the steps. The stack is
+            also used to find the contract called by CALL instructions; if it is
+            excluded, code executed in external calls is not mapped to the source.
+        :param memory: whether to include the EVM memory in the steps
+        :param storage: whether to include the EVM storage in the steps
         :return: generator of tuples of (TraceStep, CallStackEvent)
         """
         txhash_hex = hex_repr(txhash)
         transaction = self._rpc.eth_getTransactionByHash(txhash_hex)
-        debug_trace = self._rpc.debug_traceTransaction(txhash_hex, {})
+        debug_trace = self._rpc.debug_traceTransaction(
+            txhash_hex, make_trace_options(stack=stack, memory=memory, storage=storage))
         logs = debug_trace["structLogs"]
         callstack = CallStack()
 
         tracestack = []  # type: List[TraceStackItem]
         prev_depth = -1
         for i, log in enumerate(logs):
-            depth, pc, op, error, gas, memory, stack, storage = (
-                log["depth"], log["pc"], log["op"], log["error"], log["gas"], log["memory"], 
-                log["stack"], log["storage"])
+            depth, pc, op, error, gas, gas_cost = (
+                log["depth"], log["pc"], log["op"], log.get("error"), log["gas"], log.get("gasCost", 0))
+            step_stack = log.get("stack") if stack else None
+            step_memory = log.get("memory") if memory else None
+            step_storage = log.get("storage") if storage else None
 
             # when entering call, create a new decoder for the relevant contract
             if depth == prev_depth + 1:  # enter CALL
-                if i == 0:
-                    address = transaction["to"]
-                else:
-                    # contract address is in element -2 of stack
-                    address = "0x" + logs[i - 1]["stack"][-2][24:]
+                call_unitname, call_contractname, runtime = None, None, True
                 try:
-                    call_unitname, call_contractname = self._address_to_contract.get_contract_id(address)
-                    contract = self._compiled.contracts[(call_unitname, call_contractname)]
-                    tracestack.append(TraceStackItem(
-                        unitname=call_unitname,
-                        contractname=call_contractname,
-                        decoder=FrameDecoder(contract=contract)))
+                    (call_unitname, call_contractname), runtime = self._get_callee(
+                        logs, i, transaction, txhash_hex, stack, memory)
+                    decoder = self._get_decoder(call_unitname, call_contractname, runtime)
                 except KeyError:
-                    tracestack.append(TraceStackItem(
-                        unitname=call_unitname,
-                        contractname=call_contractname,
-                        decoder=FrameDecoderDummy()))
+                    decoder = FrameDecoderDummy()
+                tracestack.append(TraceStackItem(
+                    unitname=call_unitname,
+                    contractname=call_contractname,
+                    decoder=decoder,
+                    runtime=runtime))
             elif depth == prev_depth - 1:
-                del tracestack[-1]
+                item = tracestack.pop()
+                if not item.runtime and item.unitname is not None and stack:
+                    # returning from a contract creation, the new address is on top
+                    #   of the stack, and it is 0 if the creation failed
+                    address = "0x" + log["stack"][-1][24:]
+                    if int(address, 16) != 0:
+                        self._address_to_contract.add_contract_id(
+                            address, (item.unitname, item.contractname))
             prev_depth = depth
 
             # use the relevant decoder to map source
@@ -128,46 +258,131 @@ class EvmTrace:
 
             step = TraceStep(
                 index=i, depth=depth, contractname=frame.contractname,
-                pc=pc, op=op, stack=stack, memory=memory, storage=storage, gas=gas, error=error,
+                pc=pc, op=op, stack=step_stack, memory=step_memory, storage=step_storage,
+                gas=gas, error=error,
                 start=st, length=le, fileno=fi, jumptype=ju,
-                code=source)
+                code=source, gas_cost=gas_cost, unitname=frame.unitname)
             callstack_event = callstack.add(step)
             yield step, callstack_event
 
+    def trace_store(
+            self,
+            txhash: bytes,
+            stack: bool=True,
+            memory: bool=True,
+            storage: bool=True) -> "TraceStore":
+        """Decode all contract execution steps into a compact, columnar store
+
+        :param txhash: transaction hash to inspect, as byte array
+        :param stack: whether to include the EVM stack (see :py:meth:`trace_iter`)
+        :param memory: whether to include the EVM memory
+        :param storage: whether to include the EVM storage
+        :return: a TraceStore containing all steps and call stack events
+        """
+        from solitude.debugger.trace_store import TraceStore
+        store = TraceStore(stack=stack, memory=memory, storage=storage)
+        for step, callstack_event in self.trace_iter(
+                txhash, stack=stack, memory=memory, storage=storage):
+            store.append(step, callstack_event)
+        return store
+
+
+def make_trace_options(stack: bool=True, memory: bool=True, storage: bool=True) -> dict:
+    """Create the options for the debug_traceTransaction request
+
+    :param stack: whether the ETH node should include the EVM stack in the trace
+    :param memory: whether the ETH node should include the EVM memory in the trace
+    :param storage: whether the ETH node should include the EVM storage in the trace
+    :return: options dictionary
+    """
+    options = {}
+    if not stack:
+        options["disableStack"] = True
+    if not memory:
+        options["disableMemory"] = True
+    if not storage:
+        options["disableStorage"] = True
+    return options
+
+
+_JUMP = OPCODES["JUMP"]
+_JUMPDEST = OPCODES["JUMPDEST"]
+_CREATE_OPCODES = (OPCODES["CREATE"], OPCODES["CREATE2"])
+
+
+def _opcode(name: str) -> int:
+    # names are normally reported in upper case, avoid converting them
+    try:
+        return OPCODES[name]
+    except KeyError:
+        return opcode_from_name(name)
+
 
 class CallStack:
+    """Track the call stack frames of a trace, one step at a time
+
+    External calls (any CALL, CALLCODE, DELEGATECALL, STATICCALL, CREATE or CREATE2)
+    are found from the call depth reported by the ETH node. They are exited when
+    the depth decreases, whatever the reason (STOP, RETURN, REVERT, errors), together
+    with the internal calls still open in the callee.
+
+    Internal calls are found from jumps: a jump into a function (jump type 'i')
+    enters a call, and a jump to the instruction which follows the jump of the
+    current call exits it.
+    """
     def __init__(self):
-        self._stack = [[]]
-        self._prev_step = None
+        # for each external call: (element, internal calls)
+        self._stack = [(None, [])]  # type: List[Tuple[Optional[CallStackElement], List[CallStackElement]]]
+        self._prev_step = None  # type: Optional[TraceStep]
+        self._prev_opcode = None  # type: Optional[int]
 
     def add(self, step: TraceStep) -> CallStackEvent:
+        """Add the next step of the trace
+
+        :param step: step information
+        :return: the call stack event caused by the step. "pop" events contain the
+            number of frames exited.
+        """
         event = None
         event_data = None
-        prev_op = self._prev_step.op.lower() if (self._prev_step is not None) else None
-        op = step.op.lower()
-        # print("op %s prev %s" % (op, prev_op))
-        if op == 'jumpdest':
-            if prev_op == 'jump':
-                if (len(self._stack[-1]) > 0) and (step.pc == self._stack[-1][-1].prev.pc + 1):
-                    del self._stack[-1][-1]
-                    event = "pop"
-                elif self._prev_step.jumptype == 'i':
-                    event_data = CallStackElement(self._prev_step, step)
-                    event = "push"
-                    self._stack[-1].append(event_data)
-        elif step.pc == 0 and prev_op == 'call':
-            event_data = CallStackElement(self._prev_step, step)
+        opcode = _opcode(step.op)
+        prev = self._prev_step
+        if prev is None:
+            pass
+        elif step.depth > prev.depth:
+            event_data = CallStackElement(prev, step)
             event = "push"
-            self._stack.append([event_data])
-        elif prev_op == 'stop':
-            event = "pop"
-            del self._stack[-1]
+            self._stack.append((event_data, []))
+        elif step.depth < prev.depth:
+            count = 0
+            for _ in range(min(prev.depth - step.depth, len(self._stack) - 1)):
+                count += 1 + len(self._stack.pop()[1])
+            if count:
+                event = "pop"
+                event_data = count
+        elif opcode == _JUMPDEST and self._prev_opcode == _JUMP:
+            calls = self._stack[-1][1]
+            if calls and step.pc == calls[-1].prev.pc + 1:
+                del calls[-1]
+                event = "pop"
+                event_data = 1
+            elif prev.jumptype == "i":
+                event_data = CallStackElement(prev, step)
+                event = "push"
+                calls.append(event_data)
         self._prev_step = step
+        self._prev_opcode = opcode
         return CallStackEvent(event=event, data=event_data)
 
     @property
-    def stack(self):
-        return [x for y in self._stack for x in y]
+    def stack(self) -> List[CallStackElement]:
+        """Frames currently open, from the outermost"""
+        out = []  # type: List[CallStackElement]
+        for element, calls in self._stack:
+            if element is not None:
+                out.append(element)
+            out.extend(calls)
+        return out
 
 
 class IFrameDecoder:
@@ -187,11 +402,13 @@ class FrameDecoderDummy(IFrameDecoder):
 
 
 class FrameDecoder(IFrameDecoder):
-    def __init__(self, contract: dict):
+    def __init__(self, contract: dict, runtime: bool=True):
         super().__init__(contract)
         assert(self._contract is not None)
 
-        self._bytecode = binascii.unhexlify(self._contract["bin-runtime"])
+        # the deployment bytecode runs the constructor and returns the runtime bytecode
+        bin_key, srcmap_key = ("bin-runtime", "srcmap-runtime") if runtime else ("bin", "srcmap")
+        self._bytecode = binascii.unhexlify(self._contract[bin_key])
 
         # instruction address (bytes offset) to instruction number
         #   which can be related to program counter
@@ -203,13 +420,35 @@ class FrameDecoder(IFrameDecoder):
         # The source map in the compiler output is compressed, we need to
         #   expand it
         self._instruction_number_to_source = (
-            FrameDecoder._decode_source_map(self._contract["srcmap-runtime"]))
+            FrameDecoder._decode_source_map(self._contract[srcmap_key]))
+
+    def __getstate__(self):
+        # the contract is only needed to create the tables, it is left out when
+        #   sending the decoder to worker processes
+        state = self.__dict__.copy()
+        state["_contract"] = None
+        return state
 
     def get_mapping(self, address: int) -> Tuple[int, int, int, str]:
         instruction_number = self._address_to_instruction_number[address]
         mapping = self._instruction_number_to_source[instruction_number]
         return mapping
 
+    def iter_instructions(self) -> Iterator[Tuple[int, int, Tuple[int, int, int, str]]]:
+        """Iterate the instructions covered by the source map
+
+        :return: generator of tuples of (address, opcode, (start, length, fileno, jumptype))
+        """
+        address = 0
+        for mapping in self._instruction_number_to_source:
+            if address >= len(self._bytecode):
+                break
+            instr = self._bytecode[address]
+            yield address, instr, mapping
+            address += 1
+            if instr >= 0x60 and instr <= 0x7f:
+                address += instr - 0x5f
+
     @staticmethod
     def _decode_source_map(srcmap: str) -> List[Tuple[int, int, int, str]]:
         out = []
@@ -265,9 +504,25 @@ class SourcePosToLine:
         else:
             self._source = source
             self._lines = source.split('\n')
-            for i, c in enumerate(source):
-                if c == '\n':
-                    self._splits.append(i)
+            self._splits = [m.start() for m in _NEWLINE.finditer(source)]
+
+    @staticmethod
+    def get(source: Optional[str]) -> "SourcePosToLine":
+        """Get the shared SourcePosToLine of a source text, creating it on first use
+
+        :param source: full source text, or None
+        :return: a SourcePosToLine, shared by all users of the same source text
+        """
+        with _POSMAPPER_CACHE_LOCK:
+            try:
+                posmapper = _POSMAPPER_CACHE[source]
+                _POSMAPPER_CACHE.move_to_end(source)
+            except KeyError:
+                posmapper = SourcePosToLine(source)
+                _POSMAPPER_CACHE[source] = posmapper
+                if len(_POSMAPPER_CACHE) > _POSMAPPER_CACHE_SIZE:
+                    _POSMAPPER_CACHE.popitem(last=False)
+        return posmapper
 
     def line_of(self, index: int):
         line_index = bisect.bisect_right(self._splits, index)
@@ -286,28 +541,75 @@ class SourcePosToLine:
         return self._lines
 
 
+_NEWLINE = re.compile("\n")
+
+# line tables of recently used sources, keyed by source text and shared by all
+#   SourceMapper instances, in any thread
+_POSMAPPER_CACHE = OrderedDict()  # type: OrderedDict
+_POSMAPPER_CACHE_SIZE = 256
+_POSMAPPER_CACHE_LOCK = threading.Lock()
+
+
 class SourceMapper:
     def __init__(self, contracts: ContractObjectList):
         self._compiled = contracts
-        # collect sources
+        # sources and source lists are read on first use of each unit, as contracts
+        #   loaded from a directory store them in separate files
         self._unitname_to_posmapper = {}  # type: Dict[str, SourcePosToLine]
-        self._unitname_fi_to_unitname = {}  # type: Dict[Tuple[str, int], str]
-        # self._contractname_fi_to_unitname = {}  # type: Dict[Tuple[str, int], str]
-        for (unitname, contractname), contract in self._compiled.contracts.items():
-            self._unitname_to_posmapper[unitname] = (
-                SourcePosToLine(contract["_solitude"]["source"]))
-            for fi, fi_unitname in enumerate(contract["_solitude"]["sourceList"]):
-                self._unitname_fi_to_unitname[(unitname, fi)] = fi_unitname
-        self._nullposmapper = SourcePosToLine(None)
+        self._unitname_to_sourcelist = {}  # type: Dict[str, List[str]]
+        self._nullposmapper = SourcePosToLine.get(None)
+        # source mappings are immutable, the same object is returned for all
+        #   instructions mapped to the same source position
+        self._mappings = {}  # type: Dict[Tuple[str, int, int], SourceMapping]
+
+    def _get_unit_info(self, unitname: str) -> dict:
+        # compiler information of the first contract of a unit
+        for contract_id in self._compiled.find_unit(unitname):
+            return self._compiled.get_contract(*contract_id)["_solitude"]
+        raise KeyError(unitname)
 
     def get_unitname(self, unitname: str, fi: int) -> str:
-        return self._unitname_fi_to_unitname[(unitname, fi)]
+        try:
+            sourcelist = self._unitname_to_sourcelist[unitname]
+        except KeyError:
+            sourcelist = self._get_unit_info(unitname)["sourceList"]
+            self._unitname_to_sourcelist[unitname] = sourcelist
+        if not 0 <= fi < len(sourcelist):
+            raise KeyError((unitname, fi))
+        return sourcelist[fi]
+
+    def preload(self, unitname: str) -> None:
+        """Read the source list of a unit, and the line tables of the sources it lists
+
+        :param unitname: name of the source unit
+        """
+        try:
+            self.get_unitname(unitname, 0)
+        except KeyError:
+            return
+        for fi_unitname in self._unitname_to_sourcelist[unitname]:
+            try:
+                self._get_posmapper(fi_unitname)
+            except KeyError:
+                pass
+
+    def _get_posmapper(self, unitname: str) -> "SourcePosToLine":
+        try:
+            return self._unitname_to_posmapper[unitname]
+        except KeyError:
+            posmapper = SourcePosToLine.get(self._get_unit_info(unitname)["source"])
+            self._unitname_to_posmapper[unitname] = posmapper
+            return posmapper
 
     def get_source(self, unitname: str, st: int, le: int, fi: int) -> SourceMapping:
+        try:
+            return self._mappings[(unitname, st, fi)]
+        except KeyError:
+            pass
         unitname_fi = None  # type: Optional[str]
         try:
             unitname_fi = self.get_unitname(unitname, fi)
-            posmapper = self._unitname_to_posmapper[unitname_fi]
+            posmapper = self._get_posmapper(unitname_fi)
         except KeyError:
             unitname_fi = None
             posmapper = self._nullposmapper
@@ -315,35 +617,53 @@ class SourceMapper:
         line_pos = st - line_start
         if line_pos < 0:
             line_pos = len(posmapper.lines[line_index])
-        return SourceMapping(
+        mapping = SourceMapping(
             unitname=unitname_fi,
             source=posmapper.source,
             lines=posmapper.lines,
             line_index=line_index,
             line_start=line_start,
             line_pos=line_pos)
+        self._mappings[(unitname, st, fi)] = mapping
+        return mapping
 
 
 class AddressToContract:
     def __init__(self):
         self._address_to_contract_id = {}  # type: Dict[str, Tuple[str, str]]
+        self._compiled = None  # type: Optional[ContractObjectList]
+        # bytecodes of the contracts, collected on the first search
+        self._contracts_bin = None  # type: Optional[List[Tuple[str, str, bytes]]]
+        # first block not scanned yet
+        self._next_block = 0
 
     def initialize(self, client: RPCClient, compiled: ContractObjectList):
         earliest_block = client.eth_getBlockByNumber("earliest", False)
-        start_block = int(earliest_block["number"][2:], 16)
+        self._next_block = int(earliest_block["number"][2:], 16)
+        self._compiled = compiled
+        self._contracts_bin = None
+        self.update(client)
+
+    def _get_contracts_bin(self) -> List[Tuple[str, str, bytes]]:
+        if self._contracts_bin is None:
+            # the bytecode is stored with each contract, the unit data is not loaded
+            self._contracts_bin = []
+            if self._compiled is not None:
+                for (unitname, contractname), contract in self._compiled.contracts.items():
+                    if contract["bin"]:
+                        self._contracts_bin.append((unitname, contractname, binascii.unhexlify(contract["bin"])))
+        return self._contracts_bin
+
+    def update(self, client: RPCClient):
+        """Collect the addresses of the contracts created in the blocks mined since
+        the last update
+
+        :param client: RPC client connected to the ETH server
+        """
         latest_block = client.eth_getBlockByNumber("latest", False)
         end_block = int(latest_block["number"][2:], 16)
 
-        contracts_bin = [
-            (
-                unitname,
-                contractname,
-                binascii.unhexlify(contract["bin"])
-            ) for (
-                (unitname, contractname), contract) in compiled.contracts.items()
-        ]
-
-        for block_number in range(start_block, end_block + 1):
+        for block_number in range(self._next_block, end_block + 1):
             block = client.eth_getBlockByNumber(hex(block_number), True)
             for transaction in block["transactions"]:
                 if len(transaction["input"]) > 4:
@@ -352,10 +672,11 @@ class AddressToContract:
                     if contract_address is not None:
                         contract_bytecode = binascii.unhexlify(transaction["input"][2:])
 
-                        contract_id = self._search_contract(contracts_bin, contract_bytecode)
+                        contract_id = self._search_contract(self._get_contracts_bin(), contract_bytecode)
                         # print("ContractAddress: %s" % contract_address)
                         # print("ContractID: %s" % repr(contract_id))
                         self._address_to_contract_id[contract_address] = contract_id
+        self._next_block = end_block + 1
 
     def _search_contract(self, contracts_bin: Tuple[str, str, bytes], contract_bytecode: bytes) -> Tuple[str, str]:
         match_length = 0
@@ -366,5 +687,21 @@ class AddressToContract:
                 match_id = (unitname, contractname)
         return match_id
 
+    @property
+    def contract_ids(self) -> Set[Tuple[str, str]]:
+        """Identifiers (unitname, contractname) of the contracts deployed at the known
+        addresses"""
+        return set(
+            contract_id for contract_id in self._address_to_contract_id.values() if contract_id[0] is not None)
+
     def get_contract_id(self, address: str) -> Tuple[str, str]:
         return self._address_to_contract_id[address]
+
+    def get_contract_id_by_code(self, bytecode: bytes) -> Tuple[str, str]:
+        contract_id = self._search_contract(self._get_contracts_bin(), bytecode)
+        if contract_id[0] is None:
+            raise KeyError(bytecode)
+        return contract_id
+
+    def add_contract_id(self, address: str, contract_id: Tuple[str, str]) -> None:
+        self._address_to_contract_id[address] = contract_id
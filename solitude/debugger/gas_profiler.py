@@ -0,0 +1,310 @@
+# Copyright (c) 2019, Solitude Developers
+#
+# This source code is licensed under the BSD-3-Clause license found in the
+# COPYING file in the root directory of this source tree
+
+from typing import List, Dict, Tuple, Optional  # noqa
+from collections import namedtuple
+from array import array
+import bisect
+
+from solitude.common import RPCClient, ContractObjectList
+from solitude.debugger.evm_trace import EvmTrace
+from solitude.debugger.trace_store import TraceStore
+
+
+GasCost = namedtuple("GasCost", ["inclusive", "exclusive"])
+GasCost.__doc__ = "Gas spent by a function or contract"
+GasCost.inclusive.__doc__ = "gas spent, including the calls made to other functions or contracts"
+GasCost.exclusive.__doc__ = "gas spent by its own instructions only"
+
+
+class FunctionIndex:
+    """Find the function which contains a source code range, from the AST of the
+    compiled contracts
+    """
+    def __init__(self, contracts: ContractObjectList):
+        """Create a FunctionIndex
+
+        :param contracts: a collection of contracts (see ContractObjectList)
+        """
+        # unitname -> sorted list of (start, end, function name)
+        self._functions = {}  # type: Dict[str, List[Tuple[int, int, str]]]
+        self._starts = {}  # type: Dict[str, List[int]]
+        for contract in contracts.contracts.values():
+            unitname = contract["_solitude"]["unitName"]
+            if unitname in self._functions:
+                continue
+            functions = []
+            for node in contract["_solitude"]["ast"].get("nodes", []):
+                if node.get("nodeType") != "ContractDefinition":
+                    continue
+                for subnode in node.get("nodes", []):
+                    if subnode.get("nodeType") != "FunctionDefinition":
+                        continue
+                    st, le, _ = [int(x) for x in subnode["src"].split(":")]
+                    functions.append((st, st + le, node["name"] + "." + _function_name(subnode)))
+            functions.sort()
+            self._functions[unitname] = functions
+            self._starts[unitname] = [x[0] for x in functions]
+
+    def find(self, unitname: Optional[str], start: int, length: int) -> Optional[str]:
+        """Find the function containing a source code range
+
+        :param unitname: name of the source unit
+        :param start: start of the source code range
+        :param length: length of the source code range
+        :return: function name, as "Contract.function", or None if the range is
+            not within a function
+        """
+        try:
+            starts = self._starts[unitname]
+        except KeyError:
+            return None
+        i = bisect.bisect_right(starts, start) - 1
+        if i >= 0:
+            st, end, name = self._functions[unitname][i]
+            if start + length <= end:
+                return name
+        return None
+
+
+def _function_name(node: dict) -> str:
+    if node.get("kind") == "constructor" or node.get("isConstructor"):
+        return "constructor"
+    return node.get("name") or "fallback"
+
+
+def step_gas_costs(store: TraceStore) -> array:
+    """Compute the gas spent by each step of a trace, excluding the gas spent by
+    the calls it makes.
+
+    The cost of a step is the difference between its available gas and the one
+    of the next step in the same call. The cost of a call instruction is the gas
+    it took, minus the gas spent by the steps of the call.
+
+    :param store: trace of a transaction
+    :return: array of gas costs, one for each step
+    """
+    depth = store.depth
+    gas = store.gas
+    gas_cost = store.gas_cost
+    n = len(store)
+    costs = array("q", [0]) * n
+    spent = 0
+    # (step index, gas spent before the call) for each call in progress
+    calls = []  # type: List[Tuple[int, int]]
+    for i in range(n):
+        if i + 1 < n and depth[i + 1] == depth[i]:
+            costs[i] = gas[i] - gas[i + 1]
+        elif i + 1 < n and depth[i + 1] > depth[i]:
+            calls.append((i, spent))
+            continue
+        else:
+            costs[i] = gas_cost[i]
+        spent += costs[i]
+        # return from calls
+        while calls and i + 1 < n and depth[i + 1] <= depth[calls[-1][0]]:
+            call_index, call_spent = calls.pop()
+            if depth[i + 1] == depth[call_index]:
+                costs[call_index] = gas[call_index] - gas[i + 1] - (spent - call_spent)
+            else:
+                costs[call_index] = gas_cost[call_index]
+            spent += costs[call_index]
+    for call_index, _ in calls:
+        costs[call_index] = gas_cost[call_index]
+    return costs
+
+
+class _Frame:
+    def __init__(self, parent: Optional["_Frame"], contractname: str):
+        self.parent = parent
+        self.contractname = contractname
+        self.function = None  # type: Optional[str]
+        self.exclusive = 0
+        self.inclusive = 0
+
+    @property
+    def name(self) -> str:
+        if self.function is not None:
+            return self.function
+        return str(self.contractname)
+
+
+class GasProfile:
+    """Gas spent by one or more transactions, by source line, function, contract
+    and call stack
+    """
+    def __init__(self):
+        self.total = 0
+        self.lines = {}  # type: Dict[Tuple[str, int], int]
+        self.functions = {}  # type: Dict[str, GasCost]
+        self.contracts = {}  # type: Dict[str, GasCost]
+        self.stacks = {}  # type: Dict[Tuple[str, ...], int]
+
+    def merge(self, other: "GasProfile") -> None:
+        """Add the gas spent in another profile to this one
+
+        :param other: profile to add
+        """
+        self.total += other.total
+        for key, value in other.lines.items():
+            self.lines[key] = self.lines.get(key, 0) + value
+        for key, value in other.stacks.items():
+            self.stacks[key] = self.stacks.get(key, 0) + value
+        for dst, src in ((self.functions, other.functions), (self.contracts, other.contracts)):
+            for key, value in src.items():
+                prev = dst.get(key, GasCost(0, 0))
+                dst[key] = GasCost(
+                    inclusive=prev.inclusive + value.inclusive,
+                    exclusive=prev.exclusive + value.exclusive)
+
+    def collapsed(self) -> str:
+        """Get the gas spent by call stack, in the collapsed stack format used by
+        flame graph tools (one "frame;frame;frame gas" line per call stack).
+
+        :return: collapsed stacks, as text
+        """
+        return "".join(
+            "%s %d\n" % (";".join(stack), gas)
+            for stack, gas in sorted(self.stacks.items()) if gas > 0)
+
+    def report(self, limit: Optional[int]=None) -> str:
+        """Get a text report of the gas spent, sorted by cost
+
+        :param limit: maximum number of entries in each section, or None for all
+        :return: report, as text
+        """
+        out = ["Total gas: %d" % self.total, ""]
+        for title, costs in (("CONTRACT", self.contracts), ("FUNCTION", self.functions)):
+            out.append("%12s %12s  %s" % ("INCLUSIVE", "EXCLUSIVE", title))
+            items = sorted(costs.items(), key=lambda x: (-x[1].inclusive, -x[1].exclusive, x[0]))
+            for name, cost in items[:limit]:
+                out.append("%12d %12d  %s" % (cost.inclusive, cost.exclusive, name))
+            out.append("")
+        out.append("%12s  %s" % ("GAS", "LINE"))
+        items = sorted(self.lines.items(), key=lambda x: (-x[1], x[0]))
+        for (unitname, line_index), gas in items[:limit]:
+            out.append("%12d  %s:%d" % (gas, unitname, 1 + line_index))
+        return "\n".join(out) + "\n"
+
+
+class GasProfiler:
+    """Aggregate the gas spent by transactions by source line, function and contract
+    """
+    def __init__(self, rpc: RPCClient, contracts: ContractObjectList):
+        """Create a GasProfiler
+
+        :param rpc: RPC client connected to the ETH server
+        :param contracts: a collection of contracts (see ContractObjectList)
+        """
+        self._trace = EvmTrace(rpc, contracts)
+        self._function_index = FunctionIndex(contracts)
+
+    def profile(self, txhash: bytes) -> GasProfile:
+        """Trace a transaction and profile its gas usage
+
+        :param txhash: transaction hash, as bytes
+        :return: a :py:class:`GasProfile`
+        """
+        return self.profile_trace(
+            self._trace.trace_store(txhash, memory=False, storage=False))
+
+    def profile_trace(self, store: TraceStore) -> GasProfile:
+        """Profile the gas usage of a transaction trace
+
+        :param store: trace of the transaction
+        :return: a :py:class:`GasProfile`
+        """
+        return profile_trace(store, self._function_index)
+
+
+def profile_trace(store: TraceStore, function_index: FunctionIndex) -> GasProfile:
+    """Profile the gas usage of a transaction trace
+
+    :param store: trace of the transaction
+    :param function_index: functions of the traced contracts
+    :return: a :py:class:`GasProfile`
+    """
+    profile = GasProfile()
+    n = len(store)
+    if n == 0:
+        return profile
+    costs = step_gas_costs(store)
+    events = store.event
+    codes = store.code
+    contract_ids = store.contract
+
+    functions = {}  # type: Dict[tuple, Optional[str]]
+    frames = []  # type: List[_Frame]
+    frame = None  # type: Optional[_Frame]
+    contracts = {}  # type: Dict[str, int]
+    for i in range(n):
+        contractname = store.get_contractname(contract_ids[i])
+        if i == 0 or (events[i] == TraceStore.EVENT_PUSH):
+            frame = _Frame(frame, contractname)
+            frames.append(frame)
+        elif events[i] == TraceStore.EVENT_POP:
+            for _ in range(store.get_pop_count(i)):
+                if frame.parent is not None:
+                    frame = frame.parent
+
+        code = store.get_code(codes[i])
+        cost = costs[i]
+        frame.exclusive += cost
+        if frame.function is None:
+            key = (code.unitname, store.start[i], store.length[i])
+            try:
+                function = functions[key]
+            except KeyError:
+                function = function_index.find(*key)
+                functions[key] = function
+            frame.function = function
+        contracts[contractname] = contracts.get(contractname, 0) + cost
+        if code.unitname is not None:
+            line = (code.unitname, code.line_index)
+            profile.lines[line] = profile.lines.get(line, 0) + cost
+        profile.total += cost
+
+    # frames are created in call order, children always come after their parent
+    for frame in reversed(frames):
+        frame.inclusive += frame.exclusive
+        if frame.parent is not None:
+            frame.parent.inclusive += frame.inclusive
+
+    function_costs = {}  # type: Dict[str, List[int]]
+    contract_costs = {}  # type: Dict[str, List[int]]
+    for frame in frames:
+        names = []
+        ancestor = frame
+        while ancestor is not None:
+            names.append(ancestor.name)
+            ancestor = ancestor.parent
+        stack = tuple(reversed(names))
+        profile.stacks[stack] = profile.stacks.get(stack, 0) + frame.exclusive
+
+        # in recursive calls, count the inclusive cost of the outermost call only
+        cost = function_costs.setdefault(frame.name, [0, 0])
+        cost[1] += frame.exclusive
+        if frame.name not in stack[:-1]:
+            cost[0] += frame.inclusive
+        cost = contract_costs.setdefault(str(frame.contractname), [0, 0])
+        if not _has_contract_ancestor(frame):
+            cost[0] += frame.inclusive
+
+    profile.functions = {
+        name: GasCost(inclusive=cost[0], exclusive=cost[1])
+        for name, cost in function_costs.items()}
+    profile.contracts = {
+        str(name): GasCost(inclusive=contract_costs.get(str(name), [0])[0], exclusive=cost)
+        for name, cost in contracts.items()}
+    return profile
+
+
+def _has_contract_ancestor(frame: _Frame) -> bool:
+    ancestor = frame.parent
+    while ancestor is not None:
+        if ancestor.contractname == frame.contractname:
+            return True
+        ancestor = ancestor.parent
+    return False
@@ -4,20 +4,200 @@
 # COPYING file in the root directory of this source tree
 
 import os
+import bisect
+from array import array
+from typing import Dict, List, Set, Optional, Callable  # noqa
 from solitude._internal.oi_common_objects import ColorText
 from solitude._internal.oi_interface import ObjectInterface, ObjectInterfaceException
 from solitude.debugger.evm_trace import TraceStep
 from solitude.debugger.evm_debug_core import EvmDebugCore
+from solitude.debugger.evm_opcodes import OPCODES
+from solitude.debugger.trace_store import TraceStore
+
+# maximum number of steps scanned after a function's JUMPDEST, to tell apart the
+#   jump to the function body from the jump to its entry point
+_FUNCTION_LOOK_AHEAD = 50
+
+# steps executed by a command between two progress reports
+_PROGRESS_INTERVAL = 256
+
+
+class _BreakpointIndex:
+    """Steps of the whole trace at which breakpoints can be hit, computed in one
+    pass over the trace columns, so that 'continue' can jump directly to them.
+
+    Building the index decodes the whole trace, so the other commands check the
+    current step only.
+    """
+    def __init__(self, dbg: EvmDebugCore):
+        store = dbg.get_trace()
+        self._size = len(store)
+        ops = store.op
+        events = store.event
+        codes = store.code
+
+        # call stack level of each step, relative to the first one
+        self.level = array("i")
+        level = 0
+        for i, event in enumerate(events):
+            if event == TraceStore.EVENT_PUSH:
+                level += 1
+            elif event == TraceStore.EVENT_POP:
+                level -= store.get_pop_count(i)
+            self.level.append(level)
+
+        revert = OPCODES["REVERT"]
+        self.reverts = [i for i, op in enumerate(ops) if op == revert]
+
+        # line breakpoints, hit when entering a new line
+        code_names = {}  # type: Dict[int, Optional[str]]
+        code_keys = {}  # type: Dict[int, tuple]
+        for code_id in set(codes):
+            code = store.get_code(code_id)
+            code_keys[code_id] = (code.unitname, code.line_index)
+            if code.unitname is None:
+                code_names[code_id] = None
+            else:
+                code_names[code_id] = "%s:%d" % (os.path.split(code.unitname)[-1], 1 + code.line_index)
+        self.lines = {}  # type: Dict[str, List[int]]
+        prev_key = None
+        for i, code_id in enumerate(codes):
+            key = code_keys[code_id]
+            name = code_names[code_id]
+            if name is not None and (i == 0 or key != prev_key):
+                self.lines.setdefault(name, []).append(i)
+            prev_key = key
+
+        # function breakpoints, hit at the JUMPDEST of the function body
+        function_names = {}  # type: Dict[tuple, Optional[str]]
+
+        def function_name(index):
+            key = (codes[index], store.start[index], store.length[index], store.fileno[index])
+            try:
+                return function_names[key]
+            except KeyError:
+                ast = dbg.get_ast_nodes(
+                    store.get_code(codes[index]).unitname, *key[1:])
+                name = ast["FunctionDefinition"]["name"] if "FunctionDefinition" in ast else None
+                function_names[key] = name
+                return name
+
+        def look_ahead(index, name):
+            push_found = False
+            for i in range(index + 1, min(index + _FUNCTION_LOOK_AHEAD, self._size)):
+                if events[i] == TraceStore.EVENT_PUSH:
+                    push_found = True
+                if function_name(i) != name:
+                    return False
+                if ops[i] == jumpdest and not push_found:
+                    return True
+            return False
+
+        jumpdest = OPCODES["JUMPDEST"]
+        self.functions = {}  # type: Dict[str, List[int]]
+        # jumps to the entry point of a function, where line breakpoints are not hit
+        #   within calls
+        self.entries = set()  # type: Set[int]
+        for i in range(1, self._size):
+            if ops[i] != jumpdest or store.get_jumptype(store.jumptype[i - 1]) == "o":
+                continue
+            name = function_name(i)
+            if name is None:
+                continue
+            if look_ahead(i, name):
+                self.entries.add(i)
+                continue
+            contractname = store.get_contractname(store.contract[i])
+            for bp_name in (name, contractname + "." + name):
+                self.functions.setdefault(bp_name, []).append(i)
+
+    def is_revert(self, index: int) -> bool:
+        i = bisect.bisect_left(self.reverts, index)
+        return i < len(self.reverts) and self.reverts[i] == index
+
+    def is_breakpoint(self, index: int, breakpoints: Set[str], in_call: bool) -> bool:
+        """Check whether a step hits any breakpoint
+
+        :param index: step index
+        :param breakpoints: breakpoint names
+        :param in_call: whether the step is within a call made after execution was
+            resumed. Function breakpoints are only hit within calls.
+        """
+        for name in breakpoints:
+            indices = self.lines.get(name, [])
+            i = bisect.bisect_left(indices, index)
+            if i < len(indices) and indices[i] == index and not (in_call and index in self.entries):
+                return True
+            indices = self.functions.get(name, [])
+            i = bisect.bisect_left(indices, index)
+            if i < len(indices) and indices[i] == index and in_call:
+                return True
+        return False
+
+    def frame_end(self, index: int) -> int:
+        """Find the end of the call stack frame of a step
+
+        :param index: step index
+        :return: index of the first step after the frame, or the trace size if the
+            frame lasts until the end of the trace
+        """
+        level = self.level[index]
+        for i in range(index + 1, self._size):
+            if self.level[i] < level:
+                return i
+        return self._size
+
+    def next_break(self, origin: int, breakpoints: Set[str], in_call: Optional[bool]=None) -> int:
+        """Find the first step after `origin` which reverts or hits a breakpoint
+
+        :param origin: index of the step from which execution is resumed
+        :param breakpoints: breakpoint names
+        :param in_call: whether all the steps are considered within a call (see
+            :py:meth:`is_breakpoint`); by default, the steps within calls are the
+            ones deeper in the call stack than `origin`
+        :return: step index, or the trace size if no step is found
+        """
+        out = self._size
+        i = bisect.bisect_right(self.reverts, origin)
+        if i < len(self.reverts):
+            out = self.reverts[i]
+        origin_level = self.level[origin] if origin < self._size else 0
+
+        def step_in_call(index):
+            return in_call if in_call is not None else self.level[index] > origin_level
+
+        for name in breakpoints:
+            indices = self.lines.get(name, [])
+            for i in range(bisect.bisect_right(indices, origin), len(indices)):
+                if indices[i] >= out:
+                    break
+                if not (indices[i] in self.entries and step_in_call(indices[i])):
+                    out = indices[i]
+                    break
+            indices = self.functions.get(name, [])
+            for i in range(bisect.bisect_right(indices, origin), len(indices)):
+                if indices[i] >= out:
+                    break
+                if step_in_call(indices[i]):
+                    out = indices[i]
+                    break
+        return out
 
 
 class InteractiveDebuggerOI(ObjectInterface):
-    def __init__(self, txhash, client, code_lines=(3, 6)):
+    def __init__(
+            self, txhash, client, code_lines=(3, 6), memory=False, storage=False, dbg=None, background=False):
         super().__init__()
         self.client = client
-        self.dbg = EvmDebugCore(client, txhash, windowsize=50)
+        if dbg is None:
+            dbg = EvmDebugCore(
+                client, txhash, windowsize=50, memory=memory, storage=storage, background=background)
+        self.dbg = dbg
         self._breakpoints = set()
+        self._breakpoint_index = None  # type: Optional[_BreakpointIndex]
         self._current_frame = 0
         self._running = False
+        self._progress = None  # type: Optional[Callable[[int], None]]
 
         assert len(code_lines) == 2 and all(isinstance(x, int) for x in code_lines)
         self._code_lines = code_lines
@@ -26,12 +206,14 @@ class InteractiveDebuggerOI(ObjectInterface):
         self.command(self.cmd_info_locals, ["info_locals"])
         self.command(self.cmd_info_args, ["info_args"])
         self.command(self.cmd_info_breakpoints, ["info_breakpoints"])
+        self.command(self.cmd_info_changes, ["info_changes"])
         self.command(self.cmd_break, ["break"])
         self.command(self.cmd_delete, ["delete"])
         self.command(self.cmd_frame, ["frame"])
         self.command(self.cmd_continue, ["continue"])
         self.command(self.cmd_step, ["step"])
         self.command(self.cmd_stepi, ["stepi"])
+        self.command(self.cmd_reverse_step, ["reverse_step"])
         self.command(self.cmd_next, ["next"])
         self.command(self.cmd_finish, ["finish"])
         self.command(self.cmd_backtrace, ["backtrace"])
@@ -41,7 +223,8 @@ class InteractiveDebuggerOI(ObjectInterface):
         self.error(self.on_breakpoint, ["breakpoint"])
         self.error(self.on_revert, ["revert"])
         self.error(self.on_terminate, ["terminate"])
-        self.error(self.on_step, ["step", "stepi", "finish"])
+        self.error(self.on_interrupt, ["interrupt"])
+        self.error(self.on_step, ["step", "stepi", "reverse_step", "finish"])
 
     def on_step(self, args):
         s = self.dbg.get_step(0)
@@ -84,25 +267,22 @@ class InteractiveDebuggerOI(ObjectInterface):
             "type": "end"
         }
 
-    def _get_function_name(self, s: "Step"):
-        if "FunctionDefinition" in s.ast:
-            return s.ast["FunctionDefinition"]["name"]
-        return None
+    def on_interrupt(self, args):
+        s = self.dbg.get_step(0)
+        return {
+            "type": "interrupt",
+            "code": self.format_code(s.step) if s.valid else None
+        }
 
-    def _function_def_look_ahead(self, name):
-        push_found = False
-        for i in range(1, 50):
-            s = self.dbg.get_step(i)
-            if s.event.event == "push":
-                push_found = True
-            if not s.valid:
-                return False
-            next_name = self._get_function_name(s)
-            if next_name != name:
-                return False
-            if s.step.op == "JUMPDEST" and not push_found:
-                return True
-        return False
+    def set_progress(self, callback: Optional[Callable[[int], None]]) -> None:
+        """Set a function to be notified while commands run, with the number of steps
+        processed so far. It may raise ObjectInterfaceException("interrupt") to stop
+        the command, which then returns an "interrupt" response at the current step.
+
+        :param callback: function called periodically, or None to remove it
+        """
+        self._progress = callback
+        self.dbg.set_progress(callback)
 
     def format_code(self, step, before=None, after=None):
         colortext = InteractiveDebuggerOI.get_source_lines(
@@ -122,21 +302,44 @@ class InteractiveDebuggerOI(ObjectInterface):
             "colortext": colortext.to_obj()
         }
 
+    def _get_breakpoint_index(self) -> _BreakpointIndex:
+        if self._breakpoint_index is None:
+            self._breakpoint_index = _BreakpointIndex(self.dbg)
+        return self._breakpoint_index
+
+    @staticmethod
+    def _get_function_name(s) -> Optional[str]:
+        if "FunctionDefinition" in s.ast:
+            return s.ast["FunctionDefinition"]["name"]
+        return None
+
+    def _function_def_look_ahead(self, name):
+        push_found = False
+        for i in range(1, _FUNCTION_LOOK_AHEAD):
+            s = self.dbg.get_step(i)
+            if s.event.event == "push":
+                push_found = True
+            if not s.valid:
+                return False
+            if InteractiveDebuggerOI._get_function_name(s) != name:
+                return False
+            if s.step.op == "JUMPDEST" and not push_found:
+                return True
+        return False
+
     def _check_break(self, depth):
+        # only looks at the current step and the steps around it, so that stepping
+        #   does not require the whole trace to be decoded
         s = self.dbg.get_step(0)
         prev = self.dbg.get_step(-1)
         if s.step.op == "REVERT":
             raise ObjectInterfaceException("revert")
         if s.step.op == "JUMPDEST" and prev.valid and prev.step.jumptype != "o" and depth > 0:
-            if "FunctionDefinition" in s.ast:
-                ast = s.ast["FunctionDefinition"]
-                function_name = ast["name"]
+            function_name = InteractiveDebuggerOI._get_function_name(s)
+            if function_name is not None:
                 if self._function_def_look_ahead(function_name):
                     return
-                names = [
-                    function_name,
-                    s.step.contractname + "." + function_name]
-                for name in names:
+                for name in (function_name, s.step.contractname + "." + function_name):
                     if name in self._breakpoints:
                         raise ObjectInterfaceException("breakpoint")
 
@@ -159,13 +362,29 @@ class InteractiveDebuggerOI(ObjectInterface):
         prev_depth = self.dbg.get_callstack_depth()
         prev = self.dbg.get_step()
         depth = 0
+        if function == "continue":
+            breakpoint_index = self._get_breakpoint_index()
+            origin = self.dbg.index
+            self.dbg.seek(breakpoint_index.next_break(origin, self._breakpoints))
+            index = self.dbg.index
+            if not self.dbg.get_step().valid:
+                raise ObjectInterfaceException("terminate")
+            if breakpoint_index.is_revert(index):
+                raise ObjectInterfaceException("revert")
+            in_call = breakpoint_index.level[index] > breakpoint_index.level[origin]
+            if breakpoint_index.is_breakpoint(index, self._breakpoints, in_call):
+                raise ObjectInterfaceException("breakpoint")
+        count = 0
         while True:
+            count += 1
+            if self._progress is not None and count % _PROGRESS_INTERVAL == 0:
+                self._progress(count)
             self.dbg.step()
             s = self.dbg.get_step()
             if s.event.event == "push":
                 depth += 1
             elif s.event.event == "pop":
-                depth -= 1
+                depth -= s.event.data or 1
             if not s.valid:
                 raise ObjectInterfaceException("terminate")
             self._check_break(depth)
@@ -270,6 +489,33 @@ class InteractiveDebuggerOI(ObjectInterface):
             "breakpoints": [x for x in self._breakpoints]
         }
 
+    def cmd_info_changes(self, args):
+        obj = {
+            "type": "info_changes",
+            "memory_available": False,
+            "storage_available": False,
+            "memory": [],
+            "storage": []
+        }
+        memory_writes = self.dbg.get_memory_writes()
+        if memory_writes is not None:
+            obj["memory_available"] = True
+            for write in memory_writes:
+                obj["memory"].append({
+                    "offset": write.offset,
+                    "data": "0x" + write.data})
+        storage_writes = self.dbg.get_storage_writes()
+        if storage_writes is not None:
+            obj["storage_available"] = True
+            for write, variables in storage_writes:
+                obj["storage"].append({
+                    "slot": hex(write.slot),
+                    "value": hex(write.value),
+                    "variables": [
+                        {"name": var.name, "type": var.type, "value": str(value)}
+                        for var, value in variables]})
+        return obj
+
     def cmd_delete(self, args):
         name = args[0]
         obj = {
@@ -315,12 +561,54 @@ class InteractiveDebuggerOI(ObjectInterface):
     def cmd_step(self, args):
         return self._continue(function="step")
 
+    def cmd_reverse_step(self, args):
+        # move back to the previous source range, then to its first step
+        s = self.dbg.get_step()
+        while self.dbg.step_back():
+            prev = self.dbg.get_step()
+            if not s.valid or not InteractiveDebuggerOI._same_source(prev.step, s.step):
+                break
+        while True:
+            s = self.dbg.get_step()
+            prev = self.dbg.get_step(-1)
+            if not prev.valid or not InteractiveDebuggerOI._same_source(prev.step, s.step):
+                break
+            self.dbg.step_back()
+        raise ObjectInterfaceException("step")
+
     def cmd_next(self, args):
         return self._continue(function="next")
 
     def cmd_finish(self, args):
         self.dbg.step()
-        return self._continue(function="finish")
+        origin = self.dbg.index
+        end = None
+        if self.dbg.get_step().valid:
+            end = self.dbg.get_frame_end()
+            if end is None and self._breakpoint_index is not None:
+                end = self._breakpoint_index.frame_end(origin)
+        if end is None or end - 1 <= origin:
+            # the end of the frame is not known yet, step until it is reached
+            return self._continue(function="finish")
+
+        # stop at the last step of the frame, unless a breakpoint is hit before; as
+        #   when stepping, function breakpoints are hit at any call stack depth
+        #   after the first step
+        breakpoint_index = self._get_breakpoint_index()
+        index = origin + 1
+        in_call = breakpoint_index.level[index] > breakpoint_index.level[origin]
+        if not (breakpoint_index.is_revert(index) or
+                breakpoint_index.is_breakpoint(index, self._breakpoints, in_call)):
+            index = breakpoint_index.next_break(index, self._breakpoints, in_call=True)
+        if index <= end - 1:
+            self.dbg.seek(index)
+            if breakpoint_index.is_revert(index):
+                raise ObjectInterfaceException("revert")
+            raise ObjectInterfaceException("breakpoint")
+        self.dbg.seek(end - 1)
+        if not self.dbg.get_step(1).valid:
+            raise ObjectInterfaceException("step", args=["warning", "program_terminated"])
+        raise ObjectInterfaceException("step", args=["return"])
 
     def cmd_break(self, args):
         name = args[0]
@@ -0,0 +1,209 @@
+# Copyright (c) 2019, Solitude Developers
+#
+# This source code is licensed under the BSD-3-Clause license found in the
+# COPYING file in the root directory of this source tree
+
+from typing import List, Dict, Tuple, Optional  # noqa
+from collections import namedtuple
+import re
+
+from solitude.common import ContractObjectList
+
+
+StorageVariable = namedtuple("StorageVariable", ["name", "type", "slot", "offset", "size", "value_type"])
+StorageVariable.__doc__ = "State variable location in the contract storage"
+StorageVariable.name.__doc__ = "variable name, prefixed by the name of the contract which declares it"
+StorageVariable.type.__doc__ = "variable type name"
+StorageVariable.slot.__doc__ = "first storage slot of the variable"
+StorageVariable.offset.__doc__ = "offset of the variable within the slot, in bytes"
+StorageVariable.size.__doc__ = "size of the variable, in bytes; it may span several slots"
+StorageVariable.value_type.__doc__ = """\
+True if the variable is a value type, whose content is stored entirely at its location"""
+
+_SLOT_SIZE = 32
+
+_INT_TYPE = re.compile(r"^u?int(\d*)$")
+_BYTES_TYPE = re.compile(r"^bytes(\d+)$")
+_STATIC_ARRAY_TYPE = re.compile(r"^(.*)\[(\d+)\]$")
+_STRUCT_TYPE = re.compile(r"^struct ([\w.]+)")
+
+
+class StorageLayout:
+    """Storage layout of a contract, computed from the AST of its state variables,
+    following the rules used by the Solidity compiler to pack variables in slots.
+    """
+    def __init__(self, variables: List[StorageVariable]):
+        """Create a StorageLayout
+
+        :param variables: state variables of the contract
+        """
+        self._variables = variables
+        self._slots = {}  # type: Dict[int, List[StorageVariable]]
+        for var in variables:
+            for slot in range(var.slot, var.slot + max(1, (var.offset + var.size + _SLOT_SIZE - 1) // _SLOT_SIZE)):
+                self._slots.setdefault(slot, []).append(var)
+
+    @property
+    def variables(self) -> List[StorageVariable]:
+        """State variables, in declaration order"""
+        return list(self._variables)
+
+    def get_variables(self, slot: int) -> List[StorageVariable]:
+        """Get the state variables stored in a slot
+
+        :param slot: storage slot
+        :return: list of :py:class:`StorageVariable`; empty if the slot is not the
+            location of a state variable, for example if it contains an element of a
+            mapping or of a dynamic array
+        """
+        return self._slots.get(slot, [])
+
+    def decode(self, slot: int, value: int) -> List[Tuple[StorageVariable, object]]:
+        """Decode the content of a slot
+
+        :param slot: storage slot
+        :param value: content of the slot, as integer
+        :return: list of tuples of (variable, value). Value types are decoded as
+            integers, booleans or hex strings; the value of other variables is the
+            raw content of the slot, as integer.
+        """
+        out = []  # type: List[Tuple[StorageVariable, object]]
+        for var in self.get_variables(slot):
+            if not var.value_type:
+                out.append((var, value))
+                continue
+            raw = (value >> (8 * var.offset)) & ((1 << (8 * var.size)) - 1)
+            out.append((var, _decode_value(var.type, var.size, raw)))
+        return out
+
+    @staticmethod
+    def create_all(contracts: ContractObjectList) -> Dict[Tuple[str, str], "StorageLayout"]:
+        """Compute the storage layout of all contracts in a collection
+
+        :param contracts: a collection of contracts (see ContractObjectList)
+        :return: dictionary of ((unitname, contractname) -> :py:class:`StorageLayout`)
+        """
+        # AST ids are only unique within a compiler invocation, identified by its source list
+        definitions = {}  # type: Dict[Tuple[tuple, int], dict]
+        structs = {}  # type: Dict[str, dict]
+        # definition of each contract, with the compilation it belongs to
+        contract_nodes = {}  # type: Dict[Tuple[str, str], Tuple[tuple, dict]]
+        for (unitname, contractname), contract in contracts.contracts.items():
+            compilation = tuple(contract["_solitude"]["sourceList"])
+            for node in contract["_solitude"]["ast"].get("nodes", []):
+                if node.get("nodeType") != "ContractDefinition":
+                    continue
+                definitions[(compilation, node["id"])] = node
+                if node["name"] == contractname:
+                    contract_nodes[(unitname, contractname)] = (compilation, node)
+                for subnode in node.get("nodes", []):
+                    if subnode.get("nodeType") == "StructDefinition":
+                        structs[subnode.get("canonicalName", node["name"] + "." + subnode["name"])] = subnode
+
+        out = {}  # type: Dict[Tuple[str, str], StorageLayout]
+        for key, (compilation, node) in contract_nodes.items():
+            allocator = _SlotAllocator(structs)
+            variables = []
+            for base_id in reversed(node.get("linearizedBaseContracts", [node["id"]])):
+                base = definitions.get((compilation, base_id))
+                if base is None:
+                    continue
+                for subnode in base.get("nodes", []):
+                    if (subnode.get("nodeType") != "VariableDeclaration" or
+                            not subnode.get("stateVariable") or subnode.get("constant")):
+                        continue
+                    vartype = subnode.get("typeDescriptions", {}).get("typeString", "")
+                    slot, offset, size, value_type = allocator.allocate(vartype)
+                    variables.append(StorageVariable(
+                        name=base["name"] + "." + subnode["name"],
+                        type=vartype,
+                        slot=slot,
+                        offset=offset,
+                        size=size,
+                        value_type=value_type))
+            out[key] = StorageLayout(variables)
+        return out
+
+
+class _SlotAllocator:
+    def __init__(self, structs: Dict[str, dict]):
+        self._structs = structs
+        self._slot = 0
+        self._offset = 0
+
+    def allocate(self, vartype: str) -> Tuple[int, int, int, bool]:
+        # (slot, offset, size, value type) of the next variable
+        size = _value_size(vartype)
+        if size is not None:
+            if self._offset + size > _SLOT_SIZE:
+                self._next_slot()
+            location = (self._slot, self._offset, size, True)
+            self._offset += size
+            return location
+        slots = self.slot_count(vartype)
+        self._next_slot()
+        location = (self._slot, 0, slots * _SLOT_SIZE, False)
+        self._slot += slots
+        return location
+
+    def _next_slot(self):
+        if self._offset > 0:
+            self._slot += 1
+            self._offset = 0
+
+    def slot_count(self, vartype: str) -> int:
+        # number of slots used by a reference type
+        match = _STATIC_ARRAY_TYPE.match(_strip_location(vartype))
+        if match is not None:
+            element_type, length = match.group(1), int(match.group(2))
+            element_size = _value_size(element_type)
+            if element_size is not None:
+                per_slot = _SLOT_SIZE // element_size
+                return (length + per_slot - 1) // per_slot
+            return length * self.slot_count(element_type)
+        match = _STRUCT_TYPE.match(vartype)
+        if match is not None and match.group(1) in self._structs:
+            allocator = _SlotAllocator(self._structs)
+            for member in self._structs[match.group(1)].get("members", []):
+                allocator.allocate(member.get("typeDescriptions", {}).get("typeString", ""))
+            allocator._next_slot()
+            return max(1, allocator._slot)
+        # mappings, dynamic arrays, strings and bytes use one slot
+        return 1
+
+
+def _strip_location(vartype: str) -> str:
+    for suffix in (" storage ref", " storage pointer", " memory", " calldata"):
+        if vartype.endswith(suffix):
+            return vartype[:-len(suffix)]
+    return vartype
+
+
+def _value_size(vartype: str) -> Optional[int]:
+    if vartype in ("bool", "byte"):
+        return 1
+    if vartype in ("address", "address payable") or vartype.startswith("contract "):
+        return 20
+    if vartype.startswith("enum "):
+        return 1
+    if vartype.startswith("function "):
+        return 24 if " external" in vartype else 8
+    match = _INT_TYPE.match(vartype)
+    if match is not None:
+        return int(match.group(1) or 256) // 8
+    match = _BYTES_TYPE.match(vartype)
+    if match is not None:
+        return int(match.group(1))
+    return None
+
+
+def _decode_value(vartype: str, size: int, raw: int):
+    if vartype == "bool":
+        return raw != 0
+    if vartype.startswith("int"):
+        if raw >= 1 << (8 * size - 1):
+            raw -= 1 << (8 * size)
+        return raw
+    if vartype.startswith("uint") or vartype.startswith("enum "):
+        return raw
+    return "0x{:0{width}x}".format(raw, width=2 * size)
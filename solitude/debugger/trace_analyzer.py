@@ -0,0 +1,154 @@
+# Copyright (c) 2019, Solitude Developers
+#
+# This source code is licensed under the BSD-3-Clause license found in the
+# COPYING file in the root directory of this source tree
+
+from typing import List, Dict, Tuple, Set, Iterable, Optional  # noqa
+import multiprocessing
+
+from solitude.common import RPCClient, ContractObjectList, hex_repr
+from solitude.debugger.evm_trace import EvmTrace, AddressToContract, FrameDecoder, SourceMapper
+from solitude.debugger.gas_profiler import GasProfile, FunctionIndex, profile_trace
+from solitude.debugger.coverage import Coverage, trace_coverage
+
+
+class TraceAnalysis:
+    """Results of the analysis of one or more transactions
+    """
+    def __init__(self):
+        self.transactions = 0
+        self.steps = 0
+        self.gas = GasProfile()
+        self.coverage = Coverage()
+        self.errors = {}  # type: Dict[str, Dict[int, str]]
+        # (unitname, contractname) of the contracts executed
+        self.contracts = set()  # type: Set[Tuple[str, str]]
+
+    def merge(self, other: "TraceAnalysis") -> None:
+        """Add the results of another analysis to this one
+
+        :param other: analysis to add
+        """
+        self.transactions += other.transactions
+        self.steps += other.steps
+        self.gas.merge(other.gas)
+        self.coverage.merge(other.coverage)
+        self.errors.update(other.errors)
+        self.contracts.update(other.contracts)
+
+
+class TraceAnalyzer:
+    """Trace and analyze many transactions, optionally in a pool of worker processes
+    """
+    def __init__(
+            self,
+            rpc: RPCClient,
+            contracts: ContractObjectList,
+            address_to_contract: Optional[AddressToContract]=None,
+            gas: bool=True):
+        """Create a TraceAnalyzer
+
+        :param rpc: RPC client connected to the ETH server
+        :param contracts: a collection of contracts (see ContractObjectList)
+        :param address_to_contract: contract addresses, if already collected (see
+            :py:attr:`EvmTrace.address_to_contract`)
+        :param gas: whether to profile the gas usage; if False, the `gas` field of
+            the results is empty
+        """
+        self._rpc = rpc
+        self._contracts = contracts
+        self._gas = gas
+        self._trace = EvmTrace(rpc, contracts, address_to_contract=address_to_contract)
+        self._function_index = FunctionIndex(contracts) if gas else None
+
+    def update_addresses(self) -> None:
+        """Collect the addresses of the contracts created since the analyzer was
+        created, so that it can be reused for later transactions
+        """
+        self._trace.address_to_contract.update(self._rpc)
+
+    def analyze(self, txhash: bytes) -> TraceAnalysis:
+        """Trace and analyze a single transaction
+
+        :param txhash: transaction hash, as bytes
+        :return: a :py:class:`TraceAnalysis`
+        """
+        store = self._trace.trace_store(txhash, memory=False, storage=False)
+        out = TraceAnalysis()
+        out.transactions = 1
+        out.steps = len(store)
+        if self._gas:
+            out.gas = profile_trace(store, self._function_index)
+        out.coverage = trace_coverage(store)
+        out.contracts = self._trace.traced_contracts
+        errors = store.errors
+        if errors:
+            out.errors[hex_repr(txhash)] = errors
+        return out
+
+    def run(self, txhashes: Iterable[bytes], workers: int=1) -> TraceAnalysis:
+        """Trace and analyze many transactions, and merge the results
+
+        Fetching and decoding the traces is CPU bound, with `workers` greater than 1
+        the transactions are distributed to a pool of processes. The workers reuse
+        the contract addresses collected by this analyzer, and the contract decoders,
+        source tables and function index it creates for the deployed contracts.
+
+        :param txhashes: transaction hashes, as bytes
+        :param workers: number of worker processes; if 1, the transactions are
+            analyzed in the calling process
+        :return: a :py:class:`TraceAnalysis`, with the merged results
+        """
+        out = TraceAnalysis()
+        txhashes = list(txhashes)
+        if workers <= 1 or len(txhashes) <= 1:
+            for txhash in txhashes:
+                out.merge(self.analyze(txhash))
+            return out
+
+        # tables are created once, instead of by each worker
+        self._trace.preload()
+        pool = multiprocessing.Pool(
+            processes=min(workers, len(txhashes)),
+            initializer=_worker_init,
+            initargs=(
+                self._rpc.endpoint, self._contracts, self._trace.address_to_contract,
+                self._trace.decoders, self._trace.srcmapper, self._function_index))
+        try:
+            # results are merged in transaction order, regardless of the order
+            #   in which they complete
+            for result in pool.imap(_worker_analyze, txhashes):
+                out.merge(result)
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        return out
+
+
+_worker_analyzer = None  # type: Optional[TraceAnalyzer]
+
+
+def _worker_init(
+        endpoint: str,
+        contracts: ContractObjectList,
+        address_to_contract: AddressToContract,
+        decoders: Dict[Tuple[str, str, bool], FrameDecoder],
+        srcmapper: SourceMapper,
+        function_index: Optional[FunctionIndex]):
+    global _worker_analyzer
+    rpc = RPCClient(endpoint)
+    analyzer = TraceAnalyzer.__new__(TraceAnalyzer)
+    analyzer._rpc = rpc
+    analyzer._contracts = contracts
+    analyzer._gas = function_index is not None
+    analyzer._trace = EvmTrace(
+        rpc, contracts, address_to_contract=address_to_contract, decoders=decoders, srcmapper=srcmapper)
+    analyzer._function_index = function_index
+    _worker_analyzer = analyzer
+
+
+def _worker_analyze(txhash: bytes) -> TraceAnalysis:
+    return _worker_analyzer.analyze(txhash)
@@ -0,0 +1,179 @@
+# Copyright (c) 2019, Solitude Developers
+#
+# This source code is licensed under the BSD-3-Clause license found in the
+# COPYING file in the root directory of this source tree
+
+from typing import List, Dict, Tuple, Optional  # noqa
+from array import array
+import sys
+import mmap
+import json
+import struct
+import zlib
+
+from solitude.common import ContractObjectList, hex_repr
+from solitude.common.errors import TraceFileError
+from solitude.debugger.trace_store import TraceStore
+
+
+# File layout, all integers little endian:
+#
+#   header:   magic, version, byte order of the arrays, number of sections
+#   sections: table of (name, typecode, item size, offset, size)
+#   data:     the content of the sections, each aligned to 8 bytes
+#
+# Sections with a typecode contain a typed array, stored uncompressed so that
+#   it can be used directly from the memory mapped file. The others contain
+#   zlib-compressed JSON.
+_MAGIC = b"SOLTRACE"
+_VERSION = 2
+# versions which can be read; version 1 identifies contracts by name only
+_READ_VERSIONS = (1, 2)
+_HEADER = struct.Struct("<8sHcxI")
+_SECTION = struct.Struct("<32scB6xQQ")
+_ALIGN = 8
+_JSON = b"-"
+
+# data of the compiled contracts needed to debug a trace
+_CONTRACT_KEYS = ("unitName", "contractName", "sourcePath", "source", "sourceList", "ast")
+
+
+class TraceFile:
+    """Exported transaction trace, which can be debugged without the ETH node
+
+    A trace file contains the steps of a transaction, as stored in a
+    :py:class:`TraceStore`, and the sources and ASTs of the contracts it executed.
+    The step columns are memory mapped, only the source mappings and the stack,
+    memory and storage values are decompressed when the file is opened.
+    """
+    def __init__(self, path: str):
+        """Open a trace file
+
+        :param path: path of the file, created with :py:meth:`TraceFile.write`
+        """
+        with open(path, "rb") as fp:
+            try:
+                self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file
+                raise TraceFileError("Not a trace file: %s" % path)
+        view = memoryview(self._mmap)
+
+        if len(view) < _HEADER.size:
+            raise TraceFileError("Not a trace file: %s" % path)
+        magic, version, byteorder, count = _HEADER.unpack_from(view, 0)
+        if magic != _MAGIC:
+            raise TraceFileError("Not a trace file: %s" % path)
+        if version not in _READ_VERSIONS:
+            raise TraceFileError("Unsupported trace file version: %d" % version)
+        swap = (byteorder == b"<") != (sys.byteorder == "little")
+
+        arrays = {}  # type: Dict[str, object]
+        objects = {}  # type: Dict[str, object]
+        for i in range(count):
+            name, typecode, itemsize, offset, size = _SECTION.unpack_from(
+                view, _HEADER.size + i * _SECTION.size)
+            name = name.rstrip(b"\0").decode("utf-8")
+            data = view[offset:offset + size]
+            if typecode == _JSON:
+                objects[name] = json.loads(zlib.decompress(data).decode("utf-8"))
+            else:
+                arrays[name] = _load_array(typecode.decode("ascii"), itemsize, data, swap)
+
+        meta = objects.pop("meta")
+        self._txhash = bytes.fromhex(meta["txhash"][2:]) if meta["txhash"] else None
+        self._contracts = ContractObjectList()
+        for info in objects.pop("contracts"):
+            self._contracts.add_contract(info["unitName"], info["contractName"], {"_solitude": info})
+        self._store = TraceStore.from_sections(arrays, objects)
+
+    @property
+    def txhash(self) -> Optional[bytes]:
+        """Hash of the traced transaction"""
+        return self._txhash
+
+    @property
+    def store(self) -> TraceStore:
+        """Steps of the transaction"""
+        return self._store
+
+    @property
+    def contracts(self) -> ContractObjectList:
+        """Contracts executed by the transaction, with their sources and ASTs only"""
+        return self._contracts
+
+    @staticmethod
+    def write(
+            path: str,
+            store: TraceStore,
+            contracts: ContractObjectList,
+            txhash: Optional[bytes]=None) -> None:
+        """Write a trace file
+
+        :param path: output file path
+        :param store: steps of the transaction
+        :param contracts: a collection of contracts, containing the ones executed by
+            the transaction. Only their sources and ASTs are written.
+        :param txhash: hash of the traced transaction, as bytes
+        """
+        arrays, objects = store.to_sections()
+        objects["meta"] = {"txhash": hex_repr(txhash) if txhash is not None else None}
+        objects["contracts"] = _select_contracts(store, contracts)
+
+        sections = []  # type: List[Tuple[bytes, bytes, int, bytes]]
+        for name, values in sorted(arrays.items()):
+            if isinstance(values, memoryview):
+                values = array(values.format, values)
+            sections.append((
+                name.encode("utf-8"), values.typecode.encode("ascii"), values.itemsize, values.tobytes()))
+        for name, obj in sorted(objects.items()):
+            text = json.dumps(obj, separators=(",", ":"))
+            sections.append((name.encode("utf-8"), _JSON, 0, zlib.compress(text.encode("utf-8"))))
+
+        byteorder = b"<" if sys.byteorder == "little" else b">"
+        table = []
+        chunks = []
+        offset = _HEADER.size + len(sections) * _SECTION.size
+        for name, typecode, itemsize, data in sections:
+            offset = _align(offset)
+            table.append(_SECTION.pack(name, typecode, itemsize, offset, len(data)))
+            chunks.append((offset, data))
+            offset += len(data)
+
+        with open(path, "wb") as fp:
+            fp.write(_HEADER.pack(_MAGIC, _VERSION, byteorder, len(sections)))
+            fp.write(b"".join(table))
+            for offset, data in chunks:
+                fp.write(b"\0" * (offset - fp.tell()))
+                fp.write(data)
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _load_array(typecode: str, itemsize: int, data: memoryview, swap: bool):
+    if not swap and array(typecode).itemsize == itemsize:
+        # used in place, from the memory mapped file
+        return data.cast(typecode)
+    if array(typecode).itemsize != itemsize:
+        raise TraceFileError("Unsupported array item size in trace file")
+    values = array(typecode)
+    values.frombytes(data)
+    values.byteswap()
+    return values
+
+
+def _select_contracts(store: TraceStore, contracts: ContractObjectList) -> List[dict]:
+    unitnames = set(store.get_code(code_id).unitname for code_id in set(store.code))
+    keys = set(store.get_contract(contract_id) for contract_id in set(store.contract))
+    for unitname in unitnames:
+        keys.update(contracts.find_unit(unitname))
+    out = []
+    for unitname, contractname in sorted(key for key in keys if key[0] is not None):
+        try:
+            info = contracts.get_contract(unitname, contractname)["_solitude"]
+        except KeyError:
+            continue
+        out.append({key: info[key] for key in _CONTRACT_KEYS})
+    return out
@@ -0,0 +1,719 @@
+# Copyright (c) 2019, Solitude Developers
+#
+# This source code is licensed under the BSD-3-Clause license found in the
+# COPYING file in the root directory of this source tree
+
+from typing import List, Dict, Tuple, Optional, Iterator, Sequence  # noqa
+from array import array
+import bisect
+from collections import namedtuple
+
+from solitude.debugger.evm_opcodes import OPCODE_NAMES, opcode_from_name
+from solitude.debugger.evm_trace import (
+    TraceStep, SourceMapping, SourcePosToLine, CallStackEvent, CallStackElement)
+
+
+MemoryWrite = namedtuple("MemoryWrite", ["offset", "data"])
+MemoryWrite.__doc__ = "Range of the EVM memory written by a step"
+MemoryWrite.offset.__doc__ = "byte offset of the range"
+MemoryWrite.data.__doc__ = "new content of the range, as hex string of whole 32 byte words"
+
+StorageWrite = namedtuple("StorageWrite", ["slot", "value"])
+StorageWrite.__doc__ = "EVM storage slot written by a step"
+StorageWrite.slot.__doc__ = "storage slot, as integer"
+StorageWrite.value.__doc__ = "new content of the slot, as integer"
+
+_WORD_SIZE = 32
+_OP_SSTORE = opcode_from_name("SSTORE")
+
+# a full row is stored at least every _CHECKPOINT_INTERVAL steps, so that
+#   accessing a single step never replays more than this many deltas
+_CHECKPOINT_INTERVAL = 256
+
+_NEXT_PENDING = -2
+_NEXT_NONE = -1
+
+_EVENTS = [None, "push", "pop"]
+_EVENT_TO_ID = {name: i for i, name in enumerate(_EVENTS)}
+
+# scalar columns, one typed array for each
+_SCALAR_COLUMNS = (
+    "depth", "pc", "op", "gas", "gas_cost", "start", "length", "fileno",
+    "jumptype", "contract", "code", "event")
+
+
+def _common_prefix_length(a: list, b: list) -> int:
+    n = min(len(a), len(b))
+    # instructions only modify the topmost 17 elements of the stack (SWAP16),
+    #   compare the rest in one go
+    k = max(0, n - 17)
+    if a[:k] != b[:k]:
+        k = 0
+    while k < n and a[k] == b[k]:
+        k += 1
+    return k
+
+
+class _PrefixDeltaColumn:
+    """Column of lists, each stored as the length of the prefix in common with
+    the previous row, followed by the remaining items. Suitable for the EVM stack.
+    """
+    KIND = "prefix"
+    ARRAYS = ("_keep", "_offset", "_checkpoints")
+    LISTS = ("_values",)
+
+    def __init__(self):
+        self._keep = array("I")
+        self._offset = array("I")
+        self._values = []  # type: List[str]
+        self._checkpoints = array("I")
+        self._prev = None  # type: Optional[list]
+
+    def append(self, row: list) -> None:
+        index = len(self._keep)
+        if self._prev is None or index % _CHECKPOINT_INTERVAL == 0:
+            keep = 0
+        else:
+            keep = _common_prefix_length(self._prev, row)
+        if keep == 0:
+            self._checkpoints.append(index)
+        self._keep.append(keep)
+        self._offset.append(len(self._values))
+        self._values.extend(row[keep:])
+        self._prev = row
+
+    def _end(self, index: int) -> int:
+        try:
+            return self._offset[index + 1]
+        except IndexError:
+            return len(self._values)
+
+    def iter_rows(self, start: int, stop: int) -> Iterator[list]:
+        checkpoint = self._checkpoints[bisect.bisect_right(self._checkpoints, start) - 1]
+        row = []  # type: list
+        for i in range(checkpoint, stop):
+            row = row[:self._keep[i]] + self._values[self._offset[i]:self._end(i)]
+            if i >= start:
+                yield row
+
+    def get(self, index: int) -> list:
+        return next(self.iter_rows(index, index + 1))
+
+
+class _SparseDeltaColumn:
+    """Column of lists, each stored as its length and the items that changed
+    with respect to the previous row. Suitable for the EVM memory.
+    """
+    KIND = "sparse"
+    ARRAYS = ("_size", "_offset", "_indexes", "_checkpoints")
+    LISTS = ("_values",)
+
+    def __init__(self):
+        self._size = array("I")
+        self._offset = array("I")
+        self._indexes = array("I")
+        self._values = []  # type: List[str]
+        self._checkpoints = array("I")
+        self._prev = None  # type: Optional[list]
+
+    def append(self, row: list) -> None:
+        index = len(self._size)
+        prev = self._prev
+        self._offset.append(len(self._values))
+        if prev is None or index % _CHECKPOINT_INTERVAL == 0 or len(row) < len(prev):
+            self._checkpoints.append(index)
+            self._indexes.extend(range(len(row)))
+            self._values.extend(row)
+        elif row != prev:
+            for k in range(len(prev)):
+                if row[k] != prev[k]:
+                    self._indexes.append(k)
+                    self._values.append(row[k])
+            self._indexes.extend(range(len(prev), len(row)))
+            self._values.extend(row[len(prev):])
+        self._size.append(len(row))
+        self._prev = row
+
+    def _end(self, index: int) -> int:
+        try:
+            return self._offset[index + 1]
+        except IndexError:
+            return len(self._values)
+
+    def iter_rows(self, start: int, stop: int) -> Iterator[list]:
+        checkpoint = self._checkpoints[bisect.bisect_right(self._checkpoints, start) - 1]
+        row = []  # type: list
+        for i in range(checkpoint, stop):
+            size = self._size[i]
+            if size < len(row):
+                del row[size:]
+            else:
+                row.extend([None] * (size - len(row)))
+            for k in range(self._offset[i], self._end(i)):
+                row[self._indexes[k]] = self._values[k]
+            if i >= start:
+                yield list(row)
+
+    def get(self, index: int) -> list:
+        return next(self.iter_rows(index, index + 1))
+
+    def get_changes(self, prev_index: int, index: int) -> List[Tuple[int, str]]:
+        # items that differ between two rows, as (position, new value); items
+        #   appended with a zero value are not considered changes
+        if index == prev_index + 1 and not self._is_checkpoint(index):
+            prev_size = self._size[prev_index]
+            changes = [
+                (self._indexes[k], self._values[k]) for k in range(self._offset[index], self._end(index))]
+        else:
+            prev = self.get(prev_index)
+            row = self.get(index)
+            prev_size = len(prev)
+            changes = [(k, row[k]) for k in range(len(row)) if k >= prev_size or row[k] != prev[k]]
+        return [(k, value) for k, value in changes if k < prev_size or int(value, 16) != 0]
+
+    def _is_checkpoint(self, index: int) -> bool:
+        k = bisect.bisect_left(self._checkpoints, index)
+        return k < len(self._checkpoints) and self._checkpoints[k] == index
+
+
+class _DictDeltaColumn:
+    """Column of dictionaries, each stored as the items that changed with respect
+    to the previous row. Suitable for the EVM storage.
+    """
+    KIND = "dict"
+    ARRAYS = ("_offset", "_checkpoints")
+    LISTS = ("_keys", "_values")
+
+    def __init__(self):
+        self._offset = array("I")
+        self._keys = []  # type: List[str]
+        self._values = []  # type: List[str]
+        self._checkpoints = array("I")
+        self._prev = None  # type: Optional[dict]
+
+    def append(self, row: dict) -> None:
+        index = len(self._offset)
+        prev = self._prev
+        self._offset.append(len(self._keys))
+        if prev is None or index % _CHECKPOINT_INTERVAL == 0 or not (prev.keys() <= row.keys()):
+            self._checkpoints.append(index)
+            self._keys.extend(row.keys())
+            self._values.extend(row.values())
+        elif row != prev:
+            for key, value in row.items():
+                if prev.get(key) != value:
+                    self._keys.append(key)
+                    self._values.append(value)
+        self._prev = row
+
+    def _end(self, index: int) -> int:
+        try:
+            return self._offset[index + 1]
+        except IndexError:
+            return len(self._keys)
+
+    def iter_rows(self, start: int, stop: int) -> Iterator[dict]:
+        k = bisect.bisect_right(self._checkpoints, start) - 1
+        checkpoints = set(self._checkpoints[k:bisect.bisect_left(self._checkpoints, stop)])
+        row = {}  # type: dict
+        for i in range(self._checkpoints[k], stop):
+            if i in checkpoints:
+                row = {}
+            for j in range(self._offset[i], self._end(i)):
+                row[self._keys[j]] = self._values[j]
+            if i >= start:
+                yield dict(row)
+
+    def get(self, index: int) -> dict:
+        return next(self.iter_rows(index, index + 1))
+
+
+class _NullColumn:
+    """Column for data excluded from the trace
+    """
+    KIND = "null"
+    ARRAYS = ()  # type: Tuple[str, ...]
+    LISTS = ()  # type: Tuple[str, ...]
+
+    def append(self, row) -> None:
+        pass
+
+    def iter_rows(self, start: int, stop: int) -> Iterator[None]:
+        for _ in range(start, stop):
+            yield None
+
+    def get(self, index: int) -> None:
+        return None
+
+    def get_changes(self, prev_index: int, index: int) -> list:
+        return []
+
+
+_DELTA_COLUMNS = {
+    cls.KIND: cls for cls in (_PrefixDeltaColumn, _SparseDeltaColumn, _DictDeltaColumn, _NullColumn)}
+
+
+class TraceStore:
+    """Compact, columnar storage of all the steps of a transaction trace
+
+    Scalar step fields are kept in typed arrays, one per field, which can be used
+    directly for whole-trace queries. Source code information is interned, and the
+    stack, memory and storage are stored as differences from the previous step.
+    Steps are reconstructed as :py:class:`TraceStep` objects on access.
+    """
+    EVENTS = _EVENTS
+    EVENT_PUSH = _EVENT_TO_ID["push"]
+    EVENT_POP = _EVENT_TO_ID["pop"]
+
+    def __init__(self, stack: bool=True, memory: bool=True, storage: bool=True):
+        """Create an empty TraceStore. Steps are added with :py:meth:`append`.
+
+        :param stack: whether to store the EVM stack; if False, the stack of all
+            steps is None
+        :param memory: whether to store the EVM memory; if False, the memory of all
+            steps is None
+        :param storage: whether to store the EVM storage; if False, the storage of all
+            steps is None
+        """
+        self._depth = array("H")
+        self._pc = array("I")
+        self._op = array("B")
+        self._gas = array("q")
+        self._gas_cost = array("q")
+        self._start = array("i")
+        self._length = array("i")
+        self._fileno = array("i")
+        self._jumptype = array("B")
+        self._contract = array("I")
+        self._code = array("I")
+        self._event = array("B")
+        # number of frames exited by "pop" events, when it is not 1
+        self._pop_counts = {}  # type: Dict[int, int]
+
+        self._errors = {}  # type: Dict[int, str]
+        self._no_error = None  # type: Optional[str]
+        self._op_names = {}  # type: Dict[int, str]
+
+        self._jumptypes = []  # type: List[str]
+        self._jumptype_to_id = {}  # type: Dict[str, int]
+        self._contracts = []  # type: List[Tuple[Optional[str], Optional[str]]]
+        self._contract_to_id = {}  # type: Dict[Tuple[Optional[str], Optional[str]], int]
+        self._codes = []  # type: List[SourceMapping]
+        self._code_to_id = {}  # type: Dict[tuple, int]
+
+        self._stack = _PrefixDeltaColumn() if stack else _NullColumn()
+        self._memory = _SparseDeltaColumn() if memory else _NullColumn()
+        self._storage = _DictDeltaColumn() if storage else _NullColumn()
+
+        # index of the next step in the same call frame, linked as steps are added:
+        #   _NEXT_PENDING until it is known, _NEXT_NONE if the frame ends first
+        self._next_step = array("i")  # type: Optional[array]
+        # steps whose next step is pending, by increasing depth
+        self._open_steps = []  # type: List[int]
+
+    @staticmethod
+    def _intern(value, key, table: list, table_index: dict) -> int:
+        try:
+            return table_index[key]
+        except KeyError:
+            table_index[key] = len(table)
+            table.append(value)
+            return table_index[key]
+
+    def append(self, step: TraceStep, event: CallStackEvent) -> None:
+        """Add a step to the end of the trace
+
+        :param step: step information
+        :param event: call stack event associated with the step
+        """
+        index = len(self._pc)
+        opcode = opcode_from_name(step.op)
+        if OPCODE_NAMES[opcode] != step.op:
+            self._op_names[index] = step.op
+        if index == 0 and not step.error:
+            self._no_error = step.error
+        if step.error != self._no_error:
+            self._errors[index] = step.error
+
+        self._depth.append(step.depth)
+        self._pc.append(step.pc)
+        self._op.append(opcode)
+        self._gas.append(step.gas)
+        self._gas_cost.append(step.gas_cost)
+        self._start.append(step.start)
+        self._length.append(step.length)
+        self._fileno.append(step.fileno)
+        self._jumptype.append(self._intern(
+            step.jumptype, step.jumptype, self._jumptypes, self._jumptype_to_id))
+        contract = (step.unitname, step.contractname)
+        self._contract.append(self._intern(contract, contract, self._contracts, self._contract_to_id))
+        code = step.code
+        self._code.append(self._intern(
+            code, (code.unitname, code.line_index, code.line_start, code.line_pos),
+            self._codes, self._code_to_id))
+        self._event.append(_EVENT_TO_ID[event.event])
+        if event.event == "pop" and event.data is not None and event.data != 1:
+            self._pop_counts[index] = event.data
+        self._link_step(index, step.depth)
+
+        self._stack.append(step.stack)
+        self._memory.append(step.memory)
+        self._storage.append(step.storage)
+
+    def __len__(self):
+        return len(self._pc)
+
+    def to_sections(self) -> Tuple[Dict[str, array], Dict[str, object]]:
+        """Get the content of the store as flat data, for saving it (see :py:class:`TraceFile`)
+
+        :return: tuple of (typed arrays, JSON serializable objects), both as
+            dictionaries of (section name -> data)
+        """
+        arrays = {}  # type: Dict[str, array]
+        objects = {}  # type: Dict[str, object]
+        for name in _SCALAR_COLUMNS:
+            arrays[name] = getattr(self, "_" + name)
+
+        # source texts are shared by many source mappings, store them once
+        sources = []  # type: List[str]
+        source_to_id = {}  # type: Dict[str, int]
+        codes = []
+        for code in self._codes:
+            source_id = self._intern(code.source, code.source, sources, source_to_id)
+            codes.append([code.unitname, source_id, code.line_index, code.line_start, code.line_pos])
+
+        columns = {}
+        for column_name in ("stack", "memory", "storage"):
+            column = getattr(self, "_" + column_name)
+            columns[column_name] = column.KIND
+            for name in column.ARRAYS:
+                arrays[column_name + name] = getattr(column, name)
+            for name in column.LISTS:
+                objects[column_name + name] = getattr(column, name)
+
+        objects["store"] = {
+            "columns": columns,
+            "errors": sorted(self._errors.items()),
+            "no_error": self._no_error,
+            "op_names": sorted(self._op_names.items()),
+            "pop_counts": sorted(self._pop_counts.items()),
+            "jumptypes": self._jumptypes,
+            "contracts": [list(contract) for contract in self._contracts],
+            "codes": codes}
+        objects["sources"] = sources
+        return arrays, objects
+
+    @staticmethod
+    def from_sections(arrays: Dict[str, Sequence[int]], objects: Dict[str, object]) -> "TraceStore":
+        """Create a TraceStore from the flat data produced by :py:meth:`to_sections`
+
+        The arrays are used as they are, they can be memoryviews of a memory mapped
+        file. Steps cannot be appended to the resulting store.
+
+        :param arrays: typed arrays or memoryviews, as dictionary of (section name -> data)
+        :param objects: JSON deserialized objects, as dictionary of (section name -> data)
+        :return: a TraceStore
+        """
+        info = objects["store"]
+        store = TraceStore(stack=False, memory=False, storage=False)
+        for name in _SCALAR_COLUMNS:
+            setattr(store, "_" + name, arrays[name])
+
+        # linked on first use
+        store._next_step = None
+        store._errors = {index: error for index, error in info["errors"]}
+        store._no_error = info["no_error"]
+        store._op_names = {index: op for index, op in info["op_names"]}
+        store._pop_counts = {index: count for index, count in info["pop_counts"]}
+        store._jumptypes = list(info["jumptypes"])
+        # version 1 trace files only have the contract names
+        store._contracts = [
+            tuple(contract) if isinstance(contract, list) else (None, contract)
+            for contract in info["contracts"]]
+        sources = [SourcePosToLine.get(source) for source in objects["sources"]]
+        store._codes = [
+            SourceMapping(
+                unitname=unitname,
+                source=sources[source_id].source,
+                lines=sources[source_id].lines,
+                line_index=line_index,
+                line_start=line_start,
+                line_pos=line_pos)
+            for unitname, source_id, line_index, line_start, line_pos in info["codes"]]
+
+        for column_name, kind in info["columns"].items():
+            column = _DELTA_COLUMNS[kind]()
+            for name in column.ARRAYS:
+                setattr(column, name, arrays[column_name + name])
+            for name in column.LISTS:
+                setattr(column, name, objects[column_name + name])
+            setattr(store, "_" + column_name, column)
+        return store
+
+    def _make_step(self, index: int, stack: list, memory: list, storage: dict) -> TraceStep:
+        unitname, contractname = self._contracts[self._contract[index]]
+        return TraceStep(
+            index=index,
+            depth=self._depth[index],
+            contractname=contractname,
+            pc=self._pc[index],
+            op=self._op_names.get(index, OPCODE_NAMES[self._op[index]]),
+            stack=stack,
+            memory=memory,
+            storage=storage,
+            gas=self._gas[index],
+            error=self._errors.get(index, self._no_error),
+            start=self._start[index],
+            length=self._length[index],
+            fileno=self._fileno[index],
+            jumptype=self._jumptypes[self._jumptype[index]],
+            code=self._codes[self._code[index]],
+            gas_cost=self._gas_cost[index],
+            unitname=unitname)
+
+    def __getitem__(self, index: int) -> TraceStep:
+        """Get a step
+
+        :param index: step index
+        :return: the step, as a :py:class:`TraceStep`
+        """
+        if index < 0:
+            index += len(self)
+        if not (0 <= index < len(self)):
+            raise IndexError("step index out of range")
+        return self._make_step(
+            index,
+            self._stack.get(index),
+            self._memory.get(index),
+            self._storage.get(index))
+
+    def get_event(self, index: int) -> CallStackEvent:
+        """Get the call stack event associated with a step
+
+        :param index: step index
+        :return: the event, as a :py:class:`CallStackEvent`
+        """
+        event = _EVENTS[self._event[index]]
+        data = None
+        if event == "push":
+            data = CallStackElement(self[index - 1] if index > 0 else None, self[index])
+        elif event == "pop":
+            data = self._pop_counts.get(index, 1)
+        return CallStackEvent(event=event, data=data)
+
+    def get_pop_count(self, index: int) -> int:
+        """Get the number of call stack frames exited at a step
+
+        :param index: step index
+        :return: number of frames, 0 if the event of the step is not "pop"
+        """
+        if self._event[index] != TraceStore.EVENT_POP:
+            return 0
+        return self._pop_counts.get(index, 1)
+
+    def iter_steps(self, start: int=0, stop: Optional[int]=None) -> Iterator[Tuple[TraceStep, CallStackEvent]]:
+        """Iterate steps in a range, more efficiently than accessing them one by one
+
+        :param start: index of the first step
+        :param stop: index after the last step, or None for the end of the trace
+        :return: generator of tuples of (TraceStep, CallStackEvent), like
+            :py:meth:`EvmTrace.trace_iter`
+        """
+        if stop is None or stop > len(self):
+            stop = len(self)
+        if start >= stop:
+            return
+        prev = self[start - 1] if start > 0 else None
+        rows = zip(
+            range(start, stop),
+            self._stack.iter_rows(start, stop),
+            self._memory.iter_rows(start, stop),
+            self._storage.iter_rows(start, stop))
+        for index, stack, memory, storage in rows:
+            step = self._make_step(index, stack, memory, storage)
+            event = _EVENTS[self._event[index]]
+            data = None
+            if event == "push":
+                data = CallStackElement(prev, step)
+            elif event == "pop":
+                data = self._pop_counts.get(index, 1)
+            yield step, CallStackEvent(event=event, data=data)
+            prev = step
+
+    def _link_step(self, index: int, depth: int) -> None:
+        # resolve the open steps which are followed by this one in their frame, or
+        #   whose frame ended
+        open_steps = self._open_steps
+        while open_steps and self._depth[open_steps[-1]] >= depth:
+            k = open_steps.pop()
+            self._next_step[k] = index if self._depth[k] == depth else _NEXT_NONE
+        open_steps.append(index)
+        self._next_step.append(_NEXT_PENDING)
+
+    def _get_next_steps(self) -> array:
+        if self._next_step is None:
+            self._next_step = array("i")
+            for index, depth in enumerate(self._depth):
+                self._link_step(index, depth)
+        return self._next_step
+
+    def _next_in_frame(self, index: int) -> Optional[int]:
+        # index of the step executed after a step, in the same call frame
+        next_index = self._get_next_steps()[index]
+        return next_index if next_index >= 0 else None
+
+    def is_resolved(self, index: int) -> bool:
+        """Whether the step executed after a step in the same call frame, or the
+        end of the frame, has been added. Until then, the memory writes of the step
+        are not known.
+
+        :param index: step index
+        """
+        return self._get_next_steps()[index] != _NEXT_PENDING
+
+    def get_memory_writes(self, index: int) -> Optional[List[MemoryWrite]]:
+        """Get the EVM memory ranges written by a step
+
+        The memory written by a step is its difference from the memory of the
+        next step in the same call frame. For calls, this includes the return data
+        copied to memory. Memory expansion alone is not a write.
+
+        :param index: step index
+        :return: list of :py:class:`MemoryWrite`, ordered by offset, or None if the
+            memory is not stored
+        """
+        if isinstance(self._memory, _NullColumn):
+            return None
+        next_index = self._next_in_frame(index)
+        if next_index is None:
+            return []
+        out = []  # type: List[MemoryWrite]
+        start = end = None  # type: Optional[int]
+        words = []  # type: List[str]
+        for k, value in sorted(self._memory.get_changes(index, next_index)):
+            if k != end:
+                if words:
+                    out.append(MemoryWrite(offset=start * _WORD_SIZE, data="".join(words)))
+                start = k
+                words = []
+            words.append(value[2:] if value.startswith("0x") else value)
+            end = k + 1
+        if words:
+            out.append(MemoryWrite(offset=start * _WORD_SIZE, data="".join(words)))
+        return out
+
+    def get_storage_writes(self, index: int) -> Optional[List[StorageWrite]]:
+        """Get the EVM storage slots written by a step
+
+        Storage writes are read from the operands of SSTORE, so they are available
+        even when the storage itself is not stored.
+
+        :param index: step index
+        :return: list of :py:class:`StorageWrite`, or None if the stack is not stored
+        """
+        if isinstance(self._stack, _NullColumn):
+            return None
+        if self._op[index] != _OP_SSTORE:
+            return []
+        stack = self._stack.get(index)
+        if len(stack) < 2:
+            return []
+        return [StorageWrite(slot=int(stack[-1], 16), value=int(stack[-2], 16))]
+
+    def get_code(self, code_id: int) -> SourceMapping:
+        """Get interned source code information
+
+        :param code_id: source mapping identifier, from the `code` column
+        :return: a :py:class:`SourceMapping`
+        """
+        return self._codes[code_id]
+
+    @property
+    def errors(self) -> Dict[int, str]:
+        """Error messages, as dictionary of (step index -> message)"""
+        return dict(self._errors)
+
+    @property
+    def depth(self) -> array:
+        """Call depth of each step"""
+        return self._depth
+
+    @property
+    def pc(self) -> array:
+        """Program counter of each step"""
+        return self._pc
+
+    @property
+    def op(self) -> array:
+        """Opcode of each step, as integer"""
+        return self._op
+
+    @property
+    def gas(self) -> array:
+        """Gas of each step"""
+        return self._gas
+
+    @property
+    def gas_cost(self) -> array:
+        """Gas cost of each step, as reported by the ETH node"""
+        return self._gas_cost
+
+    @property
+    def start(self) -> array:
+        """Start of the source code mapped to each step"""
+        return self._start
+
+    @property
+    def length(self) -> array:
+        """Length of the source code mapped to each step"""
+        return self._length
+
+    @property
+    def fileno(self) -> array:
+        """Source unit index of each step"""
+        return self._fileno
+
+    @property
+    def code(self) -> array:
+        """Source mapping identifier of each step (see :py:meth:`get_code`)"""
+        return self._code
+
+    @property
+    def event(self) -> array:
+        """Call stack event of each step, as index in :py:attr:`EVENTS`"""
+        return self._event
+
+    @property
+    def jumptype(self) -> array:
+        """Jump type identifier of each step (see :py:meth:`get_jumptype`)"""
+        return self._jumptype
+
+    def get_jumptype(self, jumptype_id: int) -> str:
+        """Get interned jump type
+
+        :param jumptype_id: jump type identifier, from the `jumptype` column
+        :return: jump type string
+        """
+        return self._jumptypes[jumptype_id]
+
+    @property
+    def contract(self) -> array:
+        """Contract identifier of each step (see :py:meth:`get_contract`)"""
+        return self._contract
+
+    def get_contract(self, contract_id: int) -> Tuple[Optional[str], Optional[str]]:
+        """Get interned contract
+
+        :param contract_id: contract identifier, from the `contract` column
+        :return: tuple of (unitname, contractname); the unit name is None if it is
+            not known
+        """
+        return self._contracts[contract_id]
+
+    def get_contractname(self, contract_id: int) -> str:
+        """Get interned contract name
+
+        :param contract_id: contract identifier, from the `contract` column
+        :return: contract name
+        """
+        return self._contracts[contract_id][1]
@@ -8,11 +8,13 @@ from solitude.common.errors import (
     SolitudeError,
     SetupError,
     CompilerError,
-    CommunicationError, RequestError, TransactionError)
+    CommunicationError, RequestError, TransactionError,
+    TraceFileError)
 
 __all__ = [
     "SolitudeError",
     "SetupError",
     "CompilerError",
-    "CommunicationError", "RequestError", "TransactionError"
+    "CommunicationError", "RequestError", "TransactionError",
+    "TraceFileError"
 ]
@@ -67,7 +67,11 @@ class Factory:
         """
         compiler = Compiler(
             executable=self._tools.get("Solc").get("solc"),
-            optimize=self._cfg["Compiler.Optimize"])
+            optimize=self._cfg["Compiler.Optimize"],
+            cache_dir=parse_path(self._cfg["Compiler.CacheDir"]),
+            cache_size=self._cfg["Compiler.CacheSize"] * 1024 * 1024,
+            jobs=self._cfg["Compiler.Jobs"],
+            persistent=self._cfg["Compiler.Persistent"])
         return compiler
 
     def create_server(self) -> "ETHTestServer":
@@ -121,7 +125,7 @@ class Factory:
         object_dir = self._cfg["Project.ObjectDir"]
         objects = ContractObjectList()
         if object_dir is not None:
-            objects.add_directory(object_dir)
+            objects.add_directory(object_dir, lazy=True)
         return objects
 
     def get_project_name(self):
@@ -16,6 +16,7 @@ from solitude.client import ContractBase, ETHClient, EventLog  # noqa
 from solitude.common import ContractObjectList
 from solitude.compiler import Compiler  # noqa
 from solitude import Factory, read_config_file
+from solitude.testing.coverage import get_session_coverage
 
 
 class TestingContext:
@@ -25,6 +26,9 @@ class TestingContext:
 
         Contracts from Project.ObjectDir (if not null) are added to the client's collection.
 
+        If Testing.Coverage is not null, the transactions sent by the client are recorded,
+        and at teardown the coverage report of the test session is written to that path.
+
         A server is started if Testing.RunServer is true. In this case, the client is
         connected to the new server endpoint address, whatever it is, overriding the client
         endpoint configuration.
@@ -38,6 +42,7 @@ class TestingContext:
         self._server = None  # type: ETHTestServer
         self._compiler = None  # type: Compiler
         self._server_started = False
+        self._coverage = None
 
         endpoint = None
 
@@ -59,9 +64,14 @@ class TestingContext:
         object_dir = self._cfg["Project.ObjectDir"]
         if object_dir is not None:
             objects = ContractObjectList()
-            objects.add_directory(object_dir)
+            objects.add_directory(object_dir, lazy=True)
             self._client.update_contracts(objects)
 
+        if self._cfg["Testing.Coverage"] is not None:
+            self._coverage = get_session_coverage(
+                workers=self._cfg["Testing.CoverageWorkers"])
+            self._coverage.attach(self._client)
+
     @property
     def cfg(self):
         """Configuration"""
@@ -83,9 +93,28 @@ class TestingContext:
         return self._compiler
 
     def teardown(self):
-        """Teardown the testing context, terminating the test server if any."""
-        if self._server_started:
-            self._server.stop()
+        """Teardown the testing context, terminating the test server and the compiler
+        worker processes if any.
+
+        If coverage is enabled, the transactions of this context are traced and the
+        coverage report is updated before the server is terminated.
+        """
+        try:
+            if self._coverage is not None:
+                coverage, self._coverage = self._coverage, None
+                try:
+                    coverage.collect(self._client)
+                    coverage.write(
+                        self._cfg["Testing.Coverage"], self._cfg["Testing.CoverageFormat"])
+                finally:
+                    coverage.detach(self._client)
+        finally:
+            try:
+                if self._compiler is not None:
+                    self._compiler.close()
+            finally:
+                if self._server_started:
+                    self._server.stop()
 
     @wraps(ETHClient.account)
     def account(self, address):
@@ -0,0 +1,123 @@
+# Copyright (c) 2019, Solitude Developers
+#
+# This source code is licensed under the BSD-3-Clause license found in the
+# COPYING file in the root directory of this source tree
+
+from typing import List, Dict, Tuple, Set  # noqa
+import os
+
+from solitude._internal.error_util import type_assert, value_assert, RaiseForParam
+from solitude.client import ETHClient
+from solitude.common import ContractObjectList
+from solitude.debugger import TraceAnalyzer, Coverage, CoverageMap
+
+
+class CoverageCollector:
+    """Record the transactions sent through clients, and collect the line and
+    branch coverage of the contracts from their traces.
+
+    Transactions are only traced when :py:meth:`collect` is called, typically at
+    the teardown of a testing context, while the server is still running.
+    """
+    FORMATS = ("lcov", "cobertura")
+
+    def __init__(self, workers: int=1):
+        """Create a CoverageCollector
+
+        :param workers: number of processes tracing the transactions
+        """
+        self._workers = workers
+        self._pending = {}  # type: Dict[ETHClient, List[bytes]]
+        # analyzers are reused by the following collections from the same client
+        self._analyzers = {}  # type: Dict[ETHClient, TraceAnalyzer]
+        # contracts of the attached clients, listed in the report
+        self._compiled = []  # type: List[ContractObjectList]
+        self.coverage = Coverage()
+
+    def attach(self, client: ETHClient) -> None:
+        """Start recording the transactions sent through a client
+
+        :param client: client instance
+        """
+        pending = self._pending.setdefault(client, [])
+        client.add_transaction_hook(pending.append)
+        if not any(compiled is client.contracts for compiled in self._compiled):
+            self._compiled.append(client.contracts)
+
+    def detach(self, client: ETHClient) -> None:
+        """Stop recording the transactions sent through a client. Transactions
+        recorded and not collected yet are discarded.
+
+        :param client: client instance
+        """
+        pending = self._pending.pop(client)
+        client.remove_transaction_hook(pending.append)
+        self._analyzers.pop(client, None)
+
+    def collect(self, client: ETHClient) -> None:
+        """Trace the transactions recorded from a client and add them to the coverage
+
+        :param client: client instance, connected to the server which executed the
+            transactions
+        """
+        pending = self._pending[client]
+        if not pending:
+            return
+        analyzer = self._analyzers.get(client)
+        if analyzer is None:
+            analyzer = TraceAnalyzer(client.rpc, client.contracts, gas=False)
+            self._analyzers[client] = analyzer
+        else:
+            analyzer.update_addresses()
+        analysis = analyzer.run(pending, workers=self._workers)
+        del pending[:]
+        self.coverage.merge(analysis.coverage)
+
+    def write(self, path: str, fmt: str="lcov") -> None:
+        """Write a coverage report of all the transactions collected so far
+
+        The report lists all the contracts of the clients attached so far; the
+        lines of the contracts which were not executed have no hits.
+
+        :param path: output file path
+        :param fmt: report format, "lcov" or "cobertura"
+        """
+        with RaiseForParam("fmt"):
+            type_assert(fmt, str)
+            value_assert(fmt in CoverageCollector.FORMATS, "Unknown coverage report format")
+        # a contract compiled for several clients is listed once; the unit data of
+        #   the contracts is only loaded by the coverage map, one unit at a time
+        contracts = ContractObjectList()
+        found = set()  # type: Set[Tuple[str, str]]
+        for compiled in self._compiled:
+            for key in compiled.keys():
+                if key not in found:
+                    found.add(key)
+                    contracts.add_contract(key[0], key[1], compiled.get_contract(*key))
+        coverage_map = CoverageMap(contracts)
+        if fmt == "lcov":
+            text = self.coverage.to_lcov(coverage_map)
+        else:
+            text = self.coverage.to_cobertura(coverage_map)
+        report_dir = os.path.dirname(path)
+        if report_dir:
+            os.makedirs(report_dir, exist_ok=True)
+        with open(path, "w") as fp:
+            fp.write(text)
+
+
+_session_collector = None  # type: CoverageCollector
+
+
+def get_session_coverage(workers: int=1) -> CoverageCollector:
+    """Get the coverage collector shared by all testing contexts of the process,
+    so that the coverage of a whole test session ends up in the same report.
+
+    :param workers: number of processes tracing the transactions, used when the
+        collector is created
+    :return: the session's :py:class:`CoverageCollector`
+    """
+    global _session_collector
+    if _session_collector is None:
+        _session_collector = CoverageCollector(workers=workers)
+    return _session_collector
@@ -13,6 +13,7 @@ from solitude.common.resource_util import get_resource_path, get_global_config
 from solitude._internal.os_compat import (
     append_executable_extension, set_executable_flag, get_platform, Platform)
 from solitude.common.errors import CommunicationError
+from solitude.compiler.solc_worker import SOLCJS_SERVER
 
 
 class SolcEmscripten(ToolNpmTemplate):
@@ -31,11 +32,15 @@ class SolcEmscripten(ToolNpmTemplate):
         super().add()
         # The solc launch script is patched to fix stdin handling with node 11.
         # However this is still broken in node < 11 for large inputs.
+        # The compiler server script is installed next to it, for SolcWorker.
         try:
             solcjs_standard_json = get_resource_path("solcjs_standard_json")
             executable_real_path = os.path.realpath(self._executable_path)
             shutil.copy(solcjs_standard_json, executable_real_path)
             set_executable_flag(executable_real_path)
+            shutil.copy(
+                get_resource_path(SOLCJS_SERVER),
+                os.path.join(os.path.dirname(executable_real_path), SOLCJS_SERVER))
         except (OSError, FileNotFoundError) as e:
             raise CommunicationError(str(e)) from e
 
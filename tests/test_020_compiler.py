@@ -4,9 +4,11 @@
 # COPYING file in the root directory of this source tree
 
 import os
+import hashlib
+import pickle
 import pytest
-from solitude.common import ContractSourceList
-from solitude.compiler import Compiler
+from solitude.common import ContractSourceList, ContractObjectList
+from solitude.compiler import Compiler, CompileCache, ImportGraph, SolcWorker
 from solitude.errors import CompilerError
 from conftest import tooldir, tmpdir, tool_solc, SOLIDITY_VERSION  # noqa
 
@@ -143,6 +145,331 @@ def test_0005_compile_syntax_error(tool_solc):
         pytest.fail("Syntax error not caught by compiler")
 
 
+def test_0006_compile_cache(tmpdir, tool_solc):
+    cache_dir = os.path.join(tmpdir, "cache")
+    compiler = Compiler(executable=tool_solc.get("solc"), cache_dir=cache_dir)
+    CONTRACT_NAME = "TestContractCached"
+    sources = ContractSourceList()
+    sources.add_string(
+        "test",
+        TEST_CONTRACT.format(
+            solidity_version=SOLIDITY_VERSION,
+            contract_name=CONTRACT_NAME,
+            zero_value_constexpr="0",
+            zero_value_literal="0",
+            string_literal='"a string"'))
+    compiled = compiler.compile(sources)
+    assert len(os.listdir(cache_dir)) == 1
+
+    # the second compilation must not invoke solc
+    compiler._solc.call_standard_json = None
+    cached = compiler.compile(sources)
+    contract, cached_contract = compiled.select(CONTRACT_NAME), cached.select(CONTRACT_NAME)
+    assert contract["bin"] == cached_contract["bin"]
+    assert contract["abi"] == cached_contract["abi"]
+    assert contract["_solitude"]["ast"] == cached_contract["_solitude"]["ast"]
+
+    CompileCache(cache_dir).clear()
+    assert os.listdir(cache_dir) == []
+
+
+def test_0007_incremental_compile(tmpdir, tool_solc):
+    cache_dir = os.path.join(tmpdir, "cache_incremental")
+    compiler = Compiler(executable=tool_solc.get("solc"), cache_dir=cache_dir)
+    units = {
+        "lib/Base.sol": IMPORT_CONTRACT.format(
+            solidity_version=SOLIDITY_VERSION, imports="", contract_name="Base", bases=""),
+        "Derived.sol": IMPORT_CONTRACT.format(
+            solidity_version=SOLIDITY_VERSION,
+            imports='import "./lib/Base.sol"; // import "Other.sol";',
+            contract_name="Derived", bases="is Base"),
+        "Other.sol": IMPORT_CONTRACT.format(
+            solidity_version=SOLIDITY_VERSION, imports="", contract_name="Other", bases="")}
+    graph = ImportGraph(units)
+    assert graph.dependencies("Derived.sol") == {"lib/Base.sol"}
+    assert graph.dependents("lib/Base.sol") == {"Derived.sol"}
+    assert graph.components() == [["Derived.sol", "lib/Base.sol"], ["Other.sol"]]
+
+    def compile_units():
+        sources = ContractSourceList()
+        for unitname, source in units.items():
+            sources.add_string(unitname, source)
+        return compiler.compile(sources)
+
+    compiled = compile_units()
+    assert len(os.listdir(cache_dir)) == 3
+
+    # only the modified units and the ones importing them must be compiled again,
+    #   with the units they import
+    call_standard_json = compiler._solc.call_standard_json
+    calls = []
+
+    def call_recorded(data):
+        selected = [unitname for unitname, outputs in data["settings"]["outputSelection"].items() if "*" in outputs]
+        calls.append((sorted(data["sources"]), sorted(selected)))
+        return call_standard_json(data)
+
+    compiler._solc.call_standard_json = call_recorded
+    units["Other.sol"] = units["Other.sol"].replace("value;", "value;\n    uint256 other;")
+    recompiled = compile_units()
+    assert calls == [(["Other.sol"], ["Other.sol"])]
+    assert recompiled.select("Derived")["bin"] == compiled.select("Derived")["bin"]
+    assert recompiled.select("Other")["bin"] != compiled.select("Other")["bin"]
+
+    del calls[:]
+    units["Derived.sol"] = units["Derived.sol"].replace("value;", "value;\n    uint256 derived;")
+    recompiled = compile_units()
+    assert calls == [(["Derived.sol", "lib/Base.sol"], ["Derived.sol"])]
+    assert recompiled.select("Base")["_solitude"]["ast"] == compiled.select("Base")["_solitude"]["ast"]
+
+    del calls[:]
+    units["lib/Base.sol"] = units["lib/Base.sol"].replace("value;", "value;\n    uint256 base;")
+    recompiled = compile_units()
+    assert calls == [(["Derived.sol", "lib/Base.sol"], ["Derived.sol", "lib/Base.sol"])]
+
+    # references to the imported units match their ASTs, as in a single compilation
+    derived = recompiled.select("Derived")["_solitude"]["ast"]["nodes"][-1]
+    base = recompiled.select("Base")["_solitude"]["ast"]["nodes"][-1]
+    assert derived["linearizedBaseContracts"] == [derived["id"], base["id"]]
+
+
+def test_0008_parallel_compile(tool_solc):
+    units = {
+        "lib/Base.sol": IMPORT_CONTRACT.format(
+            solidity_version=SOLIDITY_VERSION, imports="", contract_name="Base", bases=""),
+        "Derived.sol": IMPORT_CONTRACT.format(
+            solidity_version=SOLIDITY_VERSION, imports='import "./lib/Base.sol";',
+            contract_name="Derived", bases="is Base"),
+        "Other.sol": IMPORT_CONTRACT.format(
+            solidity_version=SOLIDITY_VERSION, imports="", contract_name="Other", bases="")}
+    sources = ContractSourceList()
+    for unitname, source in units.items():
+        sources.add_string(unitname, source)
+    serial = Compiler(executable=tool_solc.get("solc")).compile(sources)
+    parallel = Compiler(executable=tool_solc.get("solc"), jobs=2).compile(sources)
+
+    # the outputs of the separate compilations share the same source ids
+    source_list = sorted(units)
+    ids = set()
+    for contractname in ["Base", "Derived", "Other"]:
+        contract = parallel.select(contractname)
+        assert contract["_solitude"]["sourceList"] == source_list
+        assert contract["bin"] == serial.select(contractname)["bin"]
+        fileid = int(contract["_solitude"]["ast"]["src"].split(":")[2])
+        assert source_list[fileid] == contract["_solitude"]["unitName"]
+        ids.add(contract["_solitude"]["ast"]["nodes"][-1]["id"])
+    assert len(ids) == 3
+
+
+def test_0009_persistent_worker(tool_solc):
+    if SolcWorker.find_script(tool_solc.get("solc")) is None:
+        pytest.skip("compiler worker requires solc-js")
+    compiler = Compiler(executable=tool_solc.get("solc"), persistent=True)
+    sources = ContractSourceList()
+    sources.add_string("test", IMPORT_CONTRACT.format(
+        solidity_version=SOLIDITY_VERSION, imports="", contract_name="Worker", bases=""))
+    try:
+        compiled = compiler.compile(sources)
+        worker = compiler._solc._workers[0]
+        # the same worker process is used for the next compilation
+        compiled_again = compiler.compile(sources)
+        assert compiler._solc._workers == [worker]
+        assert worker.running
+        assert compiled.select("Worker")["bin"] == compiled_again.select("Worker")["bin"]
+    finally:
+        compiler.close()
+    assert not worker.running
+
+
+def test_0010_save_load_artifacts(tmpdir, tool_solc):
+    compiler = Compiler(executable=tool_solc.get("solc"))
+    sources = ContractSourceList()
+    sources.add_string("test", (
+        IMPORT_CONTRACT.format(solidity_version=SOLIDITY_VERSION, imports="", contract_name="First", bases="") +
+        IMPORT_CONTRACT.format(solidity_version="", imports="", contract_name="Second", bases="")
+    ).replace("pragma solidity ^;", ""))
+    compiled = compiler.compile(sources)
+    object_dir = os.path.join(tmpdir, "artifacts")
+    compiled.save_directory(object_dir)
+    # one file per contract, and the source and AST stored once in the unit file
+    assert len([f for f in os.listdir(object_dir) if f.startswith("build_")]) == 2
+    assert len([f for f in os.listdir(object_dir) if f.startswith("unit_")]) == 1
+
+    loaded = ContractObjectList()
+    loaded.add_directory(object_dir)
+    for contractname in ["First", "Second"]:
+        contract, loaded_contract = compiled.select(contractname), loaded.select(contractname)
+        assert loaded_contract["bin"] == contract["bin"]
+        assert loaded_contract["srcmap-runtime"] == contract["srcmap-runtime"]
+        assert loaded_contract["_solitude"]["ast"] == contract["_solitude"]["ast"]
+        assert loaded_contract["_solitude"]["source"] == contract["_solitude"]["source"]
+        assert loaded_contract == contract
+
+
+def test_0011_lazy_objectlist(tmpdir):
+    objects = ContractObjectList()
+    for unitname, contractname in [("a/Token.sol", "Token"), ("b/Token.sol", "Token"), ("a/Sale.sol", "Sale")]:
+        objects.add_contract(unitname, contractname, {"abi": [], "bin": "00", "_solitude": {
+            "unitName": unitname, "contractName": contractname, "ast": {}, "source": ""}})
+    object_dir = os.path.join(tmpdir, "lazy_artifacts")
+    objects.save_directory(object_dir)
+    # without a manifest, the names are only known from the files
+    os.remove(os.path.join(object_dir, "manifest.json"))
+
+    loaded = ContractObjectList()
+    loaded.add_directory(object_dir, lazy=True)
+    assert loaded._contracts == {}
+    # only the contracts with the selected name are loaded
+    assert loaded.find("a/Token.sol", "Token") == [("a/Token.sol", "Token")]
+    assert sorted(loaded._contracts) == [("a/Token.sol", "Token"), ("b/Token.sol", "Token")]
+    other = ContractObjectList()
+    other.update(loaded)
+    assert other.get_contract("a/Sale.sol", "Sale")["_solitude"]["contractName"] == "Sale"
+    assert sorted(other.contracts) == sorted(objects.contracts)
+
+
+def test_0012_artifact_manifest(tmpdir):
+    objects = ContractObjectList()
+    abi = [
+        {"type": "function", "name": "transfer", "inputs": [{"type": "address"}, {"type": "uint256"}]},
+        {"type": "function", "name": "batch", "inputs": [
+            {"type": "tuple[]", "components": [{"type": "address"}, {"type": "uint256"}]}]},
+        {"type": "event", "name": "Transfer", "anonymous": False, "inputs": [
+            {"type": "address"}, {"type": "address"}, {"type": "uint256"}]},
+        {"type": "event", "name": "Hidden", "anonymous": True, "inputs": []}]
+    for unitname, contractname in [("a/Token.sol", "Token"), ("b/Token.sol", "Token")]:
+        objects.add_contract(unitname, contractname, {"abi": abi, "bin": "00", "_solitude": {
+            "unitName": unitname, "contractName": contractname, "ast": {}, "source": ""}})
+    object_dir = os.path.join(tmpdir, "manifest_artifacts")
+    objects.save_directory(object_dir)
+
+    manifest = ContractObjectList.read_manifest(object_dir)
+    assert sorted(manifest) == [("a/Token.sol", "Token"), ("b/Token.sol", "Token")]
+    info = manifest[("a/Token.sol", "Token")]
+    assert info.selectors == {"transfer(address,uint256)": "a9059cbb", "batch((address,uint256)[])": "f4af1f8e"}
+    assert info.events == {
+        "Transfer(address,address,uint256)": "ddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"}
+    with open(os.path.join(object_dir, info.filename), "rb") as fp:
+        assert hashlib.sha256(fp.read()).hexdigest() == info.hash
+
+    # the contracts are found without opening their files
+    loaded = ContractObjectList()
+    loaded.add_directory(object_dir, lazy=True)
+    assert loaded.find(None, "Token") == [("a/Token.sol", "Token"), ("b/Token.sol", "Token")]
+    assert loaded.find_unit("b/Token.sol") == [("b/Token.sol", "Token")]
+    assert loaded.find_unit("c/Token.sol") == []
+    assert loaded._contracts == {}
+    assert loaded.select("b/Token.sol:Token")["abi"] == abi
+    assert list(loaded._contracts) == [("b/Token.sol", "Token")]
+
+    # saving a subset keeps the entries of the other files
+    os.remove(os.path.join(object_dir, manifest[("b/Token.sol", "Token")].filename))
+    objects.save_directory(object_dir, [("a/Token.sol", "Token")])
+    assert sorted(ContractObjectList.read_manifest(object_dir)) == [("a/Token.sol", "Token")]
+
+
+def test_0013_select_index():
+    objects = ContractObjectList()
+    unitnames = ["lib/erc20/ERC20.sol", "lib/myERC20.sol", "/home/user/erc20/ERC20.sol", "other/Token.sol"]
+    for unitname in unitnames:
+        objects.add_contract(unitname, "ERC20", {"_solitude": {"unitName": unitname, "contractName": "ERC20"}})
+    assert objects.find(None, "ERC20") == [(unitname, "ERC20") for unitname in unitnames]
+    assert objects.find("ERC20.sol", "ERC20") == [(unitname, "ERC20") for unitname in unitnames[:3]]
+    assert objects.find("/erc20/ERC20.sol", "ERC20") == [(unitname, "ERC20") for unitname in unitnames[0:3:2]]
+    assert objects.find("Token.sol", "ERC20") == [("other/Token.sol", "ERC20")]
+    assert objects.find("ERC20.sol", "Missing") == []
+
+    assert objects.select("user/erc20/ERC20.sol:ERC20")["_solitude"]["unitName"] == unitnames[2]
+    assert objects.select("user/erc20/ERC20.sol:ERC20")["_solitude"]["unitName"] == unitnames[2]
+    # a selector can become ambiguous when contracts are added
+    objects.add_contract("/home/other/erc20/ERC20.sol", "ERC20", {})
+    with pytest.raises(ValueError):
+        objects.select("r/erc20/ERC20.sol:ERC20")
+    with pytest.raises(ValueError):
+        objects.select("missing:ERC20")
+
+    contracts = objects.contracts
+    with pytest.raises(TypeError):
+        contracts[("unit", "ERC20")] = {}
+    objects.add_contract("unit", "ERC20", {})
+    assert ("unit", "ERC20") in contracts
+
+
+def test_0014_compile_many_files(tmpdir, tool_solc):
+    compiler = Compiler(executable=tool_solc.get("solc"))
+    sources = ContractSourceList()
+    source_dir = os.path.join(tmpdir, "many_files")
+    os.makedirs(source_dir, exist_ok=True)
+    for i in range(20):
+        path = os.path.join(source_dir, "Contract%d.sol" % i)
+        with open(path, "w") as fp:
+            fp.write(IMPORT_CONTRACT.format(
+                solidity_version=SOLIDITY_VERSION, imports="", contract_name="Contract%d" % i, bases=""))
+        sources.add_file(path)
+    compiled = compiler.compile(sources)
+    # each file is read into the source unit of its own path
+    for i in range(20):
+        contract = compiled.select("Contract%d.sol:Contract%d" % (i, i))
+        assert "contract Contract%d " % i in contract["_solitude"]["source"]
+
+
+def test_0015_parallel_compile_type_identifiers(tool_solc):
+    units = {
+        "A.sol": IMPORT_CONTRACT.format(
+            solidity_version=SOLIDITY_VERSION, imports="", contract_name="A", bases=""),
+        "B.sol": ARRAY_CONTRACT.format(
+            solidity_version=SOLIDITY_VERSION, contract_name="B")}
+    sources = ContractSourceList()
+    for unitname, source in units.items():
+        sources.add_string(unitname, source)
+    compiled = Compiler(executable=tool_solc.get("solc"), jobs=2).compile(sources)
+
+    # the node ids of the second group are shifted, the array lengths are kept
+    ast = compiled.select("B")["_solitude"]["ast"]
+    contract = ast["nodes"][-1]
+    types = {
+        node["name"]: node["typeDescriptions"]["typeIdentifier"]
+        for node in contract["nodes"] if node.get("nodeType") == "VariableDeclaration"}
+    assert types["values"] == "t_array$_t_uint256_$10_storage"
+    assert types["next"] == "t_contract$_B_$%d" % contract["id"]
+
+
+def test_0016_parallel_compile_stable_ids(tool_solc):
+    def compile_units(imports):
+        sources = ContractSourceList()
+        sources.add_string("A.sol", IMPORT_CONTRACT.format(
+            solidity_version=SOLIDITY_VERSION, imports=imports, contract_name="A", bases=""))
+        sources.add_string("B.sol", IMPORT_CONTRACT.format(
+            solidity_version=SOLIDITY_VERSION, imports="", contract_name="B", bases=""))
+        sources.add_string("Z.sol", IMPORT_CONTRACT.format(
+            solidity_version=SOLIDITY_VERSION, imports="", contract_name="Z", bases=""))
+        return Compiler(executable=tool_solc.get("solc"), jobs=2).compile(sources)
+
+    # new declarations in the first group do not shift the ids of the following ones
+    compiled = compile_units("")
+    changed = compile_units("contract Helper { uint256 public value; }")
+    assert compiled.select("A")["_solitude"]["ast"] != changed.select("A")["_solitude"]["ast"]
+    for contractname in ["B", "Z"]:
+        assert compiled.select(contractname)["_solitude"]["ast"] == changed.select(contractname)["_solitude"]["ast"]
+
+
+def test_0017_pickle_lazy_objectlist(tmpdir):
+    objects = ContractObjectList()
+    for unitname, contractname in [("a/Token.sol", "Token"), ("b/Token.sol", "Token"), ("a/Sale.sol", "Sale")]:
+        objects.add_contract(unitname, contractname, {"abi": [], "bin": "00", "_solitude": {
+            "unitName": unitname, "contractName": contractname, "ast": {}, "source": ""}})
+    object_dir = os.path.join(tmpdir, "pickle_artifacts")
+    objects.save_directory(object_dir)
+
+    loaded = ContractObjectList()
+    loaded.add_directory(object_dir, lazy=True)
+    loaded.select("a/Sale.sol:Sale")
+    # a partly loaded list can be sent to worker processes
+    copied = pickle.loads(pickle.dumps(loaded))
+    assert copied.select("b/Token.sol:Token")["_solitude"]["unitName"] == "b/Token.sol"
+    assert dict(copied.contracts) == dict(objects.contracts)
+
+
 TEST_CONTRACT = """\
 pragma solidity ^{solidity_version};
 contract {contract_name} {{
@@ -161,3 +488,21 @@ contract {contract_name} {{
     }}
 }}
 """
+
+
+IMPORT_CONTRACT = """\
+pragma solidity ^{solidity_version};
+{imports}
+contract {contract_name} {bases} {{
+    uint256 public value;
+}}
+"""
+
+
+ARRAY_CONTRACT = """\
+pragma solidity ^{solidity_version};
+contract {contract_name} {{
+    uint256[10] public values;
+    {contract_name} public next;
+}}
+"""
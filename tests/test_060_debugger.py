@@ -5,13 +5,17 @@
 
 import pytest
 import re
+import json
+import asyncio
 from collections import namedtuple
 from solitude.common import ContractSourceList
 from solitude.server import ETHTestServer, kill_all_servers  # noqa
 from solitude.client import ETHClient, ContractBase  # noqa
 from solitude.testing import SOL
 
-from solitude.debugger import EvmTrace, InteractiveDebuggerOI
+from solitude.debugger import (
+    EvmTrace, EvmDebugCore, InteractiveDebuggerOI, GasProfiler, TraceAnalyzer, DebugAdapter, StorageLayout)
+from solitude.testing.coverage import CoverageCollector
 from solitude._commandline.cmd_debug import InteractiveDebuggerCLI
 from conftest import sol, SOLIDITY_VERSION, GANACHE_VERSION, attila  # noqa
 from io import StringIO
@@ -195,6 +199,314 @@ def test_0002_interactive(sol: SOL, attila):
     del out
 
 
+def test_0003_trace_store(sol: SOL, attila):
+    with sol.account(attila):
+        Fibonacci = sol.deploy(
+            "Fibonacci", args=(), wrapper=IFibonacci)
+        tx = Fibonacci.fib(5)
+
+    debugger = EvmTrace(sol.client.rpc, sol.client.contracts)
+    store = debugger.trace_store(tx.txhash)
+    steps = list(debugger.trace_iter(tx.txhash))
+    assert len(store) == len(steps)
+    for step, callstack_event in steps:
+        assert store[step.index] == step
+        assert store.get_event(step.index).event == callstack_event.event
+    assert list(store.iter_steps()) == steps
+    assert list(store.pc) == [step.pc for step, _ in steps]
+
+
+def test_0004_trace_options(sol: SOL, attila):
+    with sol.account(attila):
+        Fibonacci = sol.deploy(
+            "Fibonacci", args=(), wrapper=IFibonacci)
+        tx = Fibonacci.fib(3)
+
+    debugger = EvmTrace(sol.client.rpc, sol.client.contracts)
+    full_steps = [step for step, _ in debugger.trace_iter(tx.txhash)]
+    steps = [step for step, _ in debugger.trace_iter(tx.txhash, memory=False, storage=False)]
+    assert len(steps) == len(full_steps)
+    for step, full_step in zip(steps, full_steps):
+        assert step.memory is None and step.storage is None
+        assert step.stack == full_step.stack
+        assert step.code == full_step.code
+
+    store = debugger.trace_store(tx.txhash, memory=False, storage=False)
+    assert store[len(store) - 1].memory is None
+
+
+def test_0005_seek(sol: SOL, attila):
+    with sol.account(attila):
+        Fibonacci = sol.deploy(
+            "Fibonacci", args=(), wrapper=IFibonacci)
+        tx = Fibonacci.fib(5)
+
+    dbg = EvmDebugCore(sol.client, tx.txhash, windowsize=4)
+    history = []
+    while dbg.get_step().valid:
+        history.append((
+            dbg.get_step().step,
+            dbg.get_callstack_depth(),
+            [f.function and str(f.function) for f in dbg.get_frames()]))
+        dbg.step()
+
+    for index in (len(history) - 1, 0, len(history) // 2, 3):
+        dbg.seek(index)
+        assert dbg.index == index
+        assert dbg.get_step().step == history[index][0]
+        assert dbg.get_callstack_depth() == history[index][1]
+        assert [f.function and str(f.function) for f in dbg.get_frames()] == history[index][2]
+    assert dbg.step_back()
+    assert dbg.get_step().step == history[2][0]
+
+    dbg.seek(0)
+    assert not dbg.step_back()
+
+
+def test_0006_gas_profile(sol: SOL, attila):
+    with sol.account(attila):
+        Fibonacci = sol.deploy(
+            "Fibonacci", args=(), wrapper=IFibonacci)
+        tx = Fibonacci.fib(5)
+
+    profiler = GasProfiler(sol.client.rpc, sol.client.contracts)
+    profile = profiler.profile(tx.txhash)
+    assert profile.total > 0
+    assert sum(profile.lines.values()) == profile.total
+    fib = profile.functions["Fibonacci.fib"]
+    fib_r = profile.functions["Fibonacci.fib_r"]
+    assert fib.inclusive > fib_r.inclusive >= fib_r.exclusive > 0
+    assert profile.contracts["Fibonacci"].inclusive == profile.total
+    assert "Fibonacci.fib;Fibonacci.fib_r;Fibonacci.fib_r " in profile.collapsed()
+    assert "Fibonacci.fib_r" in profile.report()
+
+
+def test_0007_trace_analyzer(sol: SOL, attila):
+    with sol.account(attila):
+        Fibonacci = sol.deploy(
+            "Fibonacci", args=(), wrapper=IFibonacci)
+        txhashes = [Fibonacci.fib(n).txhash for n in (3, 4, 5)]
+
+    analyzer = TraceAnalyzer(sol.client.rpc, sol.client.contracts)
+    sequential = analyzer.run(txhashes, workers=1)
+    parallel = analyzer.run(txhashes, workers=2)
+    assert sequential.transactions == parallel.transactions == 3
+    assert sequential.steps == parallel.steps
+    assert sequential.gas.total == parallel.gas.total
+    assert sequential.gas.stacks == parallel.gas.stacks
+    assert sequential.contracts == parallel.contracts == {("TestContract", "Fibonacci")}
+
+
+def test_0008_coverage(sol: SOL, attila, tmpdir):
+    collector = CoverageCollector()
+    collector.attach(sol.client)
+    with sol.account(attila):
+        Fibonacci = sol.deploy(
+            "Fibonacci", args=(), wrapper=IFibonacci)
+        Fibonacci.fib(3)
+    collector.collect(sol.client)
+    collector.detach(sol.client)
+
+    path = str(tmpdir.join("lcov.info"))
+    collector.write(path, "lcov")
+    with open(path) as fp:
+        report = fp.read()
+    assert "SF:TestContract\n" in report
+    assert re.search(r"^DA:6,[1-9]", report, re.M)  # constructor
+    assert re.search(r"^DA:10,[1-9]", report, re.M)
+    # both outcomes of "if (n < 2)" are covered
+    assert re.search(r"^BRDA:10,\d+,0,[1-9]", report, re.M)
+    assert re.search(r"^BRDA:10,\d+,1,[1-9]", report, re.M)
+    # contracts which were not executed are reported without hits
+    assert re.search(r"^DA:26,0$", report, re.M)  # FibonacciFactory.create
+
+    path = str(tmpdir.join("coverage.xml"))
+    collector.write(path, "cobertura")
+    with open(path) as fp:
+        assert 'filename="TestContract"' in fp.read()
+
+
+def test_0009_trace_file(sol: SOL, attila, tmpdir):
+    with sol.account(attila):
+        Fibonacci = sol.deploy(
+            "Fibonacci", args=(), wrapper=IFibonacci)
+        tx = Fibonacci.fib(4)
+
+    path = str(tmpdir.join("fib.trace"))
+    live = EvmDebugCore(sol.client, tx.txhash, memory=True, storage=True)
+    live.export(path)
+    offline = EvmDebugCore.from_file(path)
+
+    while True:
+        s_live, s_offline = live.get_step(), offline.get_step()
+        assert s_live.step == s_offline.step
+        if not s_live.valid:
+            break
+        assert s_live.ast == s_offline.ast
+        assert live.get_callstack_depth() == offline.get_callstack_depth()
+        assert {k: v.value for k, v in live.get_values().items()} == \
+            {k: v.value for k, v in offline.get_values().items()}
+        live.step()
+        offline.step()
+
+    offline.seek(0)
+    assert offline.get_step().step == live.get_trace()[0]
+
+
+def test_0010_external_frames(sol: SOL, attila):
+    with sol.account(attila):
+        factory = sol.deploy("FibonacciFactory", args=(), wrapper=IFibonacciFactory)
+        tx = factory.create(4)
+
+    debugger = EvmTrace(sol.client.rpc, sol.client.contracts)
+    depth = 0
+    contracts = set()
+    for step, event in debugger.trace_iter(tx.txhash, memory=True, storage=False):
+        if event.event == "push":
+            depth += 1
+        elif event.event == "pop":
+            depth -= event.data
+        assert depth >= 0
+        if step.depth > 1:
+            contracts.add(step.contractname)
+    # the constructor (CREATE) and fib (CALL) frames are exited with their
+    #   internal calls
+    assert depth == 0
+    assert contracts == {"Fibonacci"}
+
+
+def test_0011_changes(sol: SOL, attila):
+    with sol.account(attila):
+        Fibonacci = sol.deploy(
+            "Fibonacci", args=(), wrapper=IFibonacci)
+        tx = Fibonacci.fib(6)
+
+    debugger = EvmDebugCore(sol.client, tx.txhash, memory=True, storage=False)
+    storage_writes = []
+    memory_writes = 0
+    while debugger.get_step().valid:
+        for write, variables in debugger.get_storage_writes():
+            storage_writes.append((write.slot, write.value, [(var.name, value) for var, value in variables]))
+        memory_writes += len(debugger.get_memory_writes())
+        debugger.step()
+    # the free memory pointer is written at least once
+    assert memory_writes > 0
+    assert storage_writes == [(0, 8, [("Fibonacci.result", 8)])]
+
+    buf = StringIO()
+    idbg = InteractiveDebuggerCLI(InteractiveDebuggerOI(tx.txhash, sol.client, memory=True), stdout=buf)
+    onecmd(idbg, buf, "break TestContract:17")
+    onecmd(idbg, buf, "continue")
+    out = ""
+    while "Storage:" not in out and "Program" not in out:
+        out = onecmd(idbg, buf, "stepi") + onecmd(idbg, buf, "info changes")
+    assert "Fibonacci.result = 8" in out
+
+
+def test_0012_debug_adapter(sol: SOL, attila):
+    with sol.account(attila):
+        Fibonacci = sol.deploy(
+            "Fibonacci", args=(), wrapper=IFibonacci)
+        tx = Fibonacci.fib(6)
+
+    adapter = DebugAdapter(InteractiveDebuggerOI(tx.txhash, sol.client))
+
+    async def session():
+        server = await adapter.start_tcp("127.0.0.1", 0)
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+
+        async def request(obj):
+            writer.write((json.dumps(obj) + "\n").encode("utf-8"))
+            while True:
+                out = json.loads((await reader.readline()).decode("utf-8"))
+                if out.get("seq") == obj["seq"] and "event" not in out:
+                    return out
+
+        try:
+            out = await request({"seq": 1, "command": "break", "args": ["TestContract:10"]})
+            assert out["status"] == "ok"
+            out = await request({"seq": 2, "command": "continue", "args": []})
+            assert out["response"]["type"] == "breakpoint"
+            assert out["response"]["code"]["line_index"] == 9
+            # nothing to cancel, the last request has been answered
+            out = await request({"seq": 3, "command": "cancel"})
+            assert not out["response"]["cancelled"]
+            # the next connection debugs the same transaction, without the
+            #   requests of the previous one
+            writer.close()
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            out = await request({"seq": 1, "command": "cancel"})
+            assert not out["response"]["cancelled"]
+            out = await request({"seq": 2, "command": "continue", "args": []})
+            assert out["response"]["type"] == "breakpoint"
+        finally:
+            writer.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.get_event_loop().run_until_complete(session())
+
+
+def test_0013_background_decoding(sol: SOL, attila):
+    with sol.account(attila):
+        Fibonacci = sol.deploy(
+            "Fibonacci", args=(), wrapper=IFibonacci)
+        tx = Fibonacci.fib(5)
+
+    foreground = EvmDebugCore(sol.client, tx.txhash, windowsize=5, background=False)
+    background = EvmDebugCore(sol.client, tx.txhash, windowsize=5, background=True)
+    while True:
+        s_foreground, s_background = foreground.get_step(), background.get_step()
+        assert s_foreground.step == s_background.step
+        assert s_foreground.ast == s_background.ast
+        if not s_foreground.valid:
+            break
+        foreground.step()
+        background.step()
+    assert len(foreground.get_trace()) == len(background.get_trace())
+
+
+def test_0014_coverage_reuse_analyzer(sol: SOL, attila, tmpdir):
+    def hit_counts(report):
+        # (source unit, DA or BRDA line without the count) -> count
+        counts, unitname = {}, None
+        for line in report.splitlines():
+            if line.startswith("SF:"):
+                unitname = line[3:]
+            elif line.startswith(("DA:", "BRDA:")):
+                key, _, hits = line.rpartition(",")
+                counts[(unitname, key)] = 0 if hits == "-" else int(hits)
+        return counts
+
+    collector = CoverageCollector()
+    collector.attach(sol.client)
+    path = str(tmpdir.join("lcov.info"))
+    reports = []
+    # the contracts deployed after a collection are found by the next one
+    for _ in range(2):
+        with sol.account(attila):
+            Fibonacci = sol.deploy(
+                "Fibonacci", args=(), wrapper=IFibonacci)
+            Fibonacci.fib(3)
+        collector.collect(sol.client)
+        collector.write(path, "lcov")
+        with open(path) as fp:
+            reports.append(hit_counts(fp.read()))
+    collector.detach(sol.client)
+    assert reports[0][("TestContract", "DA:10")] > 0
+    assert reports[1] == {key: 2 * value for key, value in reports[0].items()}
+
+
+def test_0015_storage_layout_same_name(sol: SOL):
+    sources = ContractSourceList()
+    for unitname, variable in (("first", "uint8 a; uint8 b;"), ("second", "uint256 c;")):
+        sources.add_string(unitname, "pragma solidity ^%s;\ncontract Token { %s }\n" % (SOLIDITY_VERSION, variable))
+    layouts = StorageLayout.create_all(sol.compiler.compile(sources))
+    assert [(v.name, v.slot, v.offset) for v in layouts[("first", "Token")].variables] == [
+        ("Token.a", 0, 0), ("Token.b", 0, 1)]
+    assert [(v.name, v.slot, v.offset) for v in layouts[("second", "Token")].variables] == [("Token.c", 0, 0)]
+
+
 class IFibonacci(ContractBase):
     def fib(self, n: int):
         return self.transact_sync("fib", n)
@@ -204,6 +516,11 @@ class IFibonacci(ContractBase):
         return self.functions.result().call()
 
 
+class IFibonacciFactory(ContractBase):
+    def create(self, n: int):
+        return self.transact_sync("create", n)
+
+
 TEST_CONTRACT = """\
 pragma solidity ^{solidity_version};
 contract Fibonacci {{
@@ -224,4 +541,13 @@ contract Fibonacci {{
         result = fib_r(n);
     }}
 }}
+
+contract FibonacciFactory {{
+    Fibonacci public child;
+
+    function create(uint n) public {{
+        child = new Fibonacci();
+        child.fib(n);
+    }}
+}}
 """
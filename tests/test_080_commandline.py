@@ -50,6 +50,44 @@ def test_0001_e01_cat_shelter(tooldir, tmpdir):
         run_pytest(["tests"])
 
 
+def test_0002_compile_watch_changes(tmpdir):
+    import os
+    from solitude.common import ContractObjectList, DirectoryWatcher
+    from solitude._commandline.cmd_compile import save_changes
+    tmp = TmpTestDir(tmpdir)
+    tmp.makedirs("watch/src/lib")
+    tmp.create("watch/src/A.sol", "contract A {}")
+    watcher = DirectoryWatcher(os.path.join(tmp.path, "watch", "src"), interval=0.01, debounce=0.05)
+    assert watcher.poll() == set()
+    created = tmp.create("watch/src/lib/B.sol", "contract B {}")
+    tmp.create("watch/src/notes.txt", "ignored")
+    assert watcher.wait(timeout=5) == {created}
+    assert watcher.wait(timeout=0.1) == set()
+
+    def objects(**contracts):
+        out = ContractObjectList()
+        for name, code in contracts.items():
+            out.add_contract("unit", name, {"bin": code, "_solitude": {
+                "unitName": "unit", "contractName": name, "timestamp": code + name}})
+        return out
+
+    object_dir = os.path.join(tmp.path, "watch", "obj")
+    first = objects(A="00", B="01")
+    assert save_changes(first, ContractObjectList(), object_dir) == (2, 0)
+    # only the modified contract is written, the removed one is deleted
+    second = objects(A="02")
+    second.contracts[("unit", "A")]["_solitude"]["timestamp"] = "later"
+    assert save_changes(second, first, object_dir) == (1, 1)
+    assert save_changes(objects(A="02"), second, object_dir) == (0, 0)
+    loaded = ContractObjectList()
+    loaded.add_directory(object_dir)
+    assert list(loaded.contracts) == [("unit", "A")]
+    assert loaded.select("A")["bin"] == "02"
+    # contract file, unit file and manifest
+    assert len(os.listdir(object_dir)) == 3
+    assert list(ContractObjectList.read_manifest(object_dir)) == [("unit", "A")]
+
+
 TEST_CONTRACT = """\
 contract CatShelter
 {